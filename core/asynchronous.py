@@ -0,0 +1,275 @@
+"""
+Asynchronous access to the databases registered in ferdolt.
+
+Postgres databases are used through psycopg's AsyncConnection. These connections are opened outside of the pools of core.connections,
+at most DATABASE_POOL_MAX_SIZE of them are open to the same database at the same time from an event loop. The other drivers only have blocking calls,
+their connections are wrapped in a ThreadedConnection running each call on a shared pool of DATABASE_ASYNC_THREADS threads,
+so a thread is only taken while a call runs instead of for the whole life of the connection.
+Both classes have the same coroutines, a single event loop can then work on many databases at the same time.
+
+The ORM can't be used from the event loop, records are read with asgiref's sync_to_async.
+"""
+from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import threading
+import weakref
+
+from asgiref.sync import sync_to_async
+
+import psycopg
+
+from core.connections import get_connection_parameters
+from core.functions import get_database_connection, get_dbms_booleans, get_postgres_connection_string
+from core.health import allow_connection_attempt, record_connection_failure, record_connection_success
+from ferdolt import models as ferdolt_models
+from ferdolt_web import settings
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the threads the blocking drivers' calls are run on
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor( max_workers=settings.DATABASE_ASYNC_THREADS, thread_name_prefix="ferdolt-database" )
+
+    return _executor
+
+# event loop: { database id: semaphore }, as asyncio's semaphores can only be used from the event loop they were first used in
+_postgres_slots = weakref.WeakKeyDictionary()
+
+def get_postgres_slots(database_id) -> asyncio.Semaphore:
+    """
+    Returns the semaphore limiting the Postgres connections open to a database from the running event loop, 
+    to DATABASE_POOL_MAX_SIZE (or GROUP_TASKS_ASYNC_CONCURRENCY without pools)
+    """
+    slots = _postgres_slots.setdefault( asyncio.get_running_loop(), {} )
+
+    if database_id not in slots:
+        slots[database_id] = asyncio.Semaphore( settings.DATABASE_POOL_MAX_SIZE or settings.GROUP_TASKS_ASYNC_CONCURRENCY )
+
+    return slots[database_id]
+
+class AsyncConnection(ABC):
+    """
+    An asynchronous connection to a database. Like the drivers' connections, it must only be used by one coroutine at a time
+    """
+    def __init__(self, connection, database: ferdolt_models.Database, dbms_booleans: dict):
+        self.connection = connection
+        self.database = database
+        self.dbms_booleans = dbms_booleans
+
+    @abstractmethod
+    async def execute(self, query, parameters=None):
+        """
+        Runs a query and returns its columns and all its rows, or two empty lists if it returns no rows
+        """
+
+    @abstractmethod
+    async def executemany(self, query, rows):
+        pass
+
+    @abstractmethod
+    def stream(self, query, parameters=None, batch_size=None, name=None):
+        """
+        Asynchronous generator running a query and yielding its columns with its rows in lists of at most batch_size 
+        (EXTRACTION_BATCH_SIZE by default) rows. Postgres reads the rows from a server-side cursor if a cursor name is given
+        """
+
+    @abstractmethod
+    async def commit(self):
+        pass
+
+    @abstractmethod
+    async def rollback(self):
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+class PsycopgConnection(AsyncConnection):
+    """
+    A psycopg AsyncConnection, holding one of its database's slots (see get_postgres_slots) until it is closed
+    """
+    def __init__(self, connection, database: ferdolt_models.Database, dbms_booleans: dict, slots: asyncio.Semaphore):
+        super().__init__(connection, database, dbms_booleans)
+
+        self.slots = slots
+
+    async def execute(self, query, parameters=None):
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(query, parameters or None)
+
+            if cursor.description is None:
+                return [], []
+
+            return [ column[0] for column in cursor.description ], await cursor.fetchall()
+
+    async def executemany(self, query, rows):
+        async with self.connection.cursor() as cursor:
+            await cursor.executemany(query, rows)
+
+    async def stream(self, query, parameters=None, batch_size=None, name=None):
+        batch_size = batch_size or settings.EXTRACTION_BATCH_SIZE
+        cursor = self.connection.cursor(name=name) if name else self.connection.cursor()
+
+        try:
+            await cursor.execute(query, parameters or None)
+            columns = [ column[0] for column in cursor.description ]
+
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+
+                if not rows:
+                    break
+
+                yield columns, rows
+        finally:
+            await cursor.close()
+
+    async def commit(self):
+        await self.connection.commit()
+
+    async def rollback(self):
+        await self.connection.rollback()
+
+    async def close(self):
+        try:
+            await self.connection.close()
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+                self.slots = None
+
+class ThreadedConnection(AsyncConnection):
+    """
+    A blocking connection whose calls are run on the threads of get_executor()
+    """
+    def __init__(self, connection, database: ferdolt_models.Database, dbms_booleans: dict):
+        super().__init__(connection, database, dbms_booleans)
+
+        # the drivers' connections can't be used by two threads at the same time
+        self.lock = asyncio.Lock()
+
+    async def run(self, function, *args, **kwargs):
+        async with self.lock:
+            return await asyncio.get_running_loop().run_in_executor( get_executor(), functools.partial(function, *args, **kwargs) )
+
+    def _execute(self, query, parameters):
+        cursor = self.connection.cursor()
+
+        try:
+            if parameters:
+                cursor.execute(query, parameters)
+            else:
+                cursor.execute(query)
+
+            if cursor.description is None:
+                return [], []
+
+            return [ column[0] for column in cursor.description ], cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _executemany(self, query, rows):
+        cursor = self.connection.cursor()
+
+        try:
+            cursor.executemany(query, rows)
+        finally:
+            cursor.close()
+
+    async def execute(self, query, parameters=None):
+        return await self.run(self._execute, query, parameters)
+
+    async def executemany(self, query, rows):
+        await self.run(self._executemany, query, rows)
+
+    async def stream(self, query, parameters=None, batch_size=None, name=None):
+        batch_size = batch_size or settings.EXTRACTION_BATCH_SIZE
+        cursor = await self.run(self.connection.cursor)
+
+        try:
+            if parameters:
+                await self.run(cursor.execute, query, parameters)
+            else:
+                await self.run(cursor.execute, query)
+
+            columns = [ column[0] for column in cursor.description ]
+
+            while True:
+                rows = await self.run(cursor.fetchmany, batch_size)
+
+                if not rows:
+                    break
+
+                yield columns, rows
+        finally:
+            await self.run(cursor.close)
+
+    async def commit(self):
+        await self.run(self.connection.commit)
+
+    async def rollback(self):
+        await self.run(self.connection.rollback)
+
+    async def close(self):
+        # pooled connections are given back to their pool
+        await self.run(self.connection.close)
+
+async def connect(database: ferdolt_models.Database) -> AsyncConnection:
+    """
+    Opens an asynchronous connection to a database, or returns None if the connection fails or the database's circuit is open
+    """
+    dbms_booleans = await sync_to_async(get_dbms_booleans)(database)
+
+    if not dbms_booleans['is_postgres_db']:
+        # the blocking drivers connect in a thread, borrowing from the database's pool as get_database_connection does
+        connection = await asyncio.get_running_loop().run_in_executor( get_executor(), get_database_connection, database )
+
+        return ThreadedConnection(connection, database, dbms_booleans) if connection else None
+
+    if not await sync_to_async(allow_connection_attempt)(database.id):
+        logging.info(f"Not connecting to the {database} database, its circuit is open")
+        return None
+
+    slots = get_postgres_slots(database.id)
+
+    try:
+        await asyncio.wait_for( slots.acquire(), timeout=settings.DATABASE_POOL_BORROW_TIMEOUT )
+    except asyncio.TimeoutError:
+        logging.error(f"Timed out waiting for a connection to the {database} database, all its connections are in use")
+        return None
+
+    parameters = await sync_to_async(get_connection_parameters)(database)
+    connection_string = get_postgres_connection_string(database, parameters)
+
+    try:
+        # we append the password here instead of above for security reasons as we will be logging the connection string in case of errors
+        connection = await psycopg.AsyncConnection.connect( connection_string + f"password={parameters['password']}" )
+    except psycopg.OperationalError as e:
+        slots.release()
+        logging.error(f"Error connecting to the Postgres database {database.name} on {database.host}:{database.port}. Connection string: '{connection_string}'. Error: {str(e)}")
+        await sync_to_async(record_connection_failure)(database.id)
+        return None
+    except BaseException as e:
+        slots.release()
+        raise e
+
+    await sync_to_async(record_connection_success)(database.id)
+
+    return PsycopgConnection(connection, database, dbms_booleans, slots)
@@ -0,0 +1,259 @@
+"""
+Pools of connections to the databases registered in ferdolt.
+
+A pool is kept per Database record and per process. Connections borrowed from a pool are PooledConnection objects
+behaving like the driver's connection, except that closing them gives them back to the pool.
+A connection is checked before it is lent and rolled back when it is given back,
+idle connections are closed after DATABASE_POOL_IDLE_TIMEOUT seconds, down to DATABASE_POOL_MIN_SIZE connections.
+
+The decrypted credentials of the databases are cached in memory so they are only decrypted again when they change.
+"""
+from collections import deque
+import logging
+import threading
+import time
+
+from ferdolt import models as ferdolt_models
+from ferdolt_web import settings
+
+def get_database_fingerprint(database: ferdolt_models.Database) -> tuple:
+    # the encrypted values change whenever the credentials are modified
+    return ( database.dbms_version_id, database.name, database.host, database.port, database.username, database.password )
+
+_credentials = {}
+_credentials_lock = threading.Lock()
+
+def get_connection_parameters(database: ferdolt_models.Database) -> dict:
+    """
+    Returns the decrypted host, port, username and password of a database, decrypting them only if they changed since the last call
+    """
+    fingerprint = get_database_fingerprint(database)
+
+    with _credentials_lock:
+        cached = _credentials.get(database.id)
+
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+    parameters = {
+        "host": database.get_host,
+        "port": database.get_port,
+        "username": database.get_username,
+        "password": database.get_password,
+    }
+
+    with _credentials_lock:
+        _credentials[database.id] = ( fingerprint, parameters )
+
+    return parameters
+
+class PooledConnection:
+    """
+    A connection borrowed from a ConnectionPool, close() gives it back to the pool
+    """
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self.raw_connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self.raw_connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.raw_connection is not None:
+            connection, self.raw_connection = self.raw_connection, None
+            self._pool.give_back(connection)
+
+    def discard(self):
+        """
+        Closes the connection instead of giving it back, for connections left in an unknown state
+        """
+        if self.raw_connection is not None:
+            connection, self.raw_connection = self.raw_connection, None
+            self._pool.give_back(connection, discard=True)
+
+    def __del__(self):
+        # connections that were not closed are given back when they are garbage collected
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    """
+    The connections to one database, connect( database ) opens a new connection or returns None if it can't
+    """
+    def __init__(self, connect, fingerprint, min_size=0, max_size=5, idle_timeout=300, borrow_timeout=30):
+        self.connect = connect
+        self.fingerprint = fingerprint
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.borrow_timeout = borrow_timeout
+
+        # ( connection, time it was given back )
+        self.idle = deque()
+        self.size = 0
+        self.is_closed = False
+
+        self.condition = threading.Condition()
+
+    def is_healthy(self, connection) -> bool:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            connection.rollback()
+
+            return True
+        except Exception as e:
+            logging.info(f"Closing a pooled connection that failed its health check. Error: {str(e)}")
+            return False
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logging.warning(f"Error closing a pooled connection. Error: {str(e)}")
+
+    def _prune(self):
+        # called with the condition held, the oldest idle connections are at the left
+        now = time.monotonic()
+        expired = []
+
+        while len(self.idle) > self.min_size and now - self.idle[0][1] > self.idle_timeout:
+            expired.append( self.idle.popleft()[0] )
+            self.size -= 1
+
+        return expired
+
+    def borrow(self, database: ferdolt_models.Database):
+        """
+        Returns a PooledConnection to the database, or None if no connection could be opened
+        """
+        deadline = time.monotonic() + self.borrow_timeout
+
+        while True:
+            connection = None
+
+            with self.condition:
+                for expired_connection in self._prune():
+                    self._close(expired_connection)
+
+                if self.idle:
+                    connection = self.idle.pop()[0]
+                elif self.size < self.max_size:
+                    self.size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        logging.error(f"No connection to the {database} database was given back to its pool within {self.borrow_timeout} seconds")
+                        return None
+
+                    self.condition.wait(remaining)
+                    continue
+
+            if connection is not None:
+                # the connection may have been closed by the server while it was idle
+                if self.is_healthy(connection):
+                    return PooledConnection(self, connection)
+
+                self._close(connection)
+
+                with self.condition:
+                    self.size -= 1
+
+                continue
+
+            try:
+                connection = self.connect(database)
+            except Exception as e:
+                connection = None
+                logging.error(f"Error opening a connection to the {database} database. Error: {str(e)}")
+
+            if connection is None:
+                with self.condition:
+                    self.size -= 1
+                    self.condition.notify()
+
+                return None
+
+            return PooledConnection(self, connection)
+
+    def give_back(self, connection, discard=False):
+        if not discard:
+            try:
+                # what wasn't committed by the borrower is not committed by the next one
+                connection.rollback()
+            except Exception as e:
+                logging.info(f"Closing a pooled connection that could not be rolled back. Error: {str(e)}")
+                discard = True
+
+        with self.condition:
+            if discard or self.is_closed:
+                self.size -= 1
+            else:
+                self.idle.append( ( connection, time.monotonic() ) )
+                connection = None
+
+            self.condition.notify()
+
+        if connection is not None:
+            self._close(connection)
+
+    def close(self):
+        """
+        Closes the idle connections, the connections in use are closed when they are given back
+        """
+        with self.condition:
+            self.is_closed = True
+            connections = [ connection for connection, _ in self.idle ]
+            self.idle.clear()
+            self.size -= len(connections)
+            self.condition.notify_all()
+
+        for connection in connections:
+            self._close(connection)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(database: ferdolt_models.Database, connect) -> ConnectionPool:
+    """
+    Returns the pool of connections to a database, a new pool replaces the previous one when the database's credentials change
+    """
+    fingerprint = get_database_fingerprint(database)
+
+    with _pools_lock:
+        pool = _pools.get(database.id)
+
+        if pool and pool.fingerprint == fingerprint:
+            return pool
+
+        previous_pool = pool
+        pool = ConnectionPool(
+            connect, fingerprint,
+            min_size=settings.DATABASE_POOL_MIN_SIZE, max_size=settings.DATABASE_POOL_MAX_SIZE,
+            idle_timeout=settings.DATABASE_POOL_IDLE_TIMEOUT, borrow_timeout=settings.DATABASE_POOL_BORROW_TIMEOUT
+        )
+        _pools[database.id] = pool
+
+    if previous_pool:
+        previous_pool.close()
+
+    return pool
+
+def close_pools():
+    with _pools_lock:
+        pools = list( _pools.values() )
+        _pools.clear()
+
+    for pool in pools:
+        pool.close()
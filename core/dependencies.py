@@ -0,0 +1,153 @@
+"""
+Dependencies between the tables of a database.
+
+The level of a table is the order its rows have to be written in to avoid integrity errors:
+tables referencing no other table are at level 0 and a table is one level above the highest table it references.
+The levels of all the tables of a database are computed from the foreign keys read in a single query.
+Tables referencing each other in a cycle can't be ordered, each cycle is reported and its tables share a level.
+"""
+import logging
+
+from django.db.models import F
+
+from ferdolt import models as ferdolt_models
+
+def get_foreign_key_edges(database) -> dict:
+    """
+    Returns the ids of the tables each table of the database references, indexed by the referencing table's id
+    """
+    edges = {}
+
+    references = ( ferdolt_models.ColumnConstraint.objects
+        .filter( column__table__schema__database=database, references__isnull=False )
+        .exclude( references__table=F("column__table") )
+        .values_list( "column__table_id", "references__table_id" )
+        .distinct()
+    )
+
+    for table_id, referenced_table_id in references:
+        edges.setdefault(table_id, set()).add(referenced_table_id)
+
+    return edges
+
+def get_strongly_connected_components(table_ids, edges: dict) -> list:
+    """
+    Returns the strongly connected components of the graph of foreign keys (Tarjan's algorithm, without recursion),
+    a component's tables are listed before the components of the tables they reference
+    """
+    index_of, low_link = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    counter = 0
+
+    for root in table_ids:
+        if root in index_of:
+            continue
+
+        # ( table, iterator over the tables it references )
+        work = [ ( root, iter( edges.get(root, ()) ) ) ]
+        index_of[root] = low_link[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            table_id, referenced_tables = work[-1]
+            advanced = False
+
+            for referenced_table_id in referenced_tables:
+                if referenced_table_id not in index_of:
+                    index_of[referenced_table_id] = low_link[referenced_table_id] = counter
+                    counter += 1
+                    stack.append(referenced_table_id)
+                    on_stack.add(referenced_table_id)
+                    work.append( ( referenced_table_id, iter( edges.get(referenced_table_id, ()) ) ) )
+                    advanced = True
+                    break
+                elif referenced_table_id in on_stack:
+                    low_link[table_id] = min( low_link[table_id], index_of[referenced_table_id] )
+
+            if advanced:
+                continue
+
+            work.pop()
+
+            if work:
+                parent_id = work[-1][0]
+                low_link[parent_id] = min( low_link[parent_id], low_link[table_id] )
+
+            if low_link[table_id] == index_of[table_id]:
+                component = []
+
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+
+                    if member == table_id:
+                        break
+
+                components.append(component)
+
+    return components
+
+def compute_table_levels(table_ids, edges: dict):
+    """
+    Returns the level of each table, indexed by the table's id, and the cycles (lists of table ids) found in the foreign keys
+    """
+    table_ids = list(table_ids)
+    components = get_strongly_connected_components(table_ids, edges)
+
+    component_of = {}
+
+    for position, component in enumerate(components):
+        for table_id in component:
+            component_of[table_id] = position
+
+    # Tarjan's algorithm emits a component after all the components it references, so one pass in that order is enough
+    component_levels = []
+
+    for position, component in enumerate(components):
+        referenced_components = {
+            component_of[referenced_table_id]
+            for table_id in component for referenced_table_id in edges.get(table_id, ())
+            if referenced_table_id in component_of and component_of[referenced_table_id] != position
+        }
+
+        component_levels.append( max( ( component_levels[referenced] + 1 for referenced in referenced_components ), default=0 ) )
+
+    levels = { table_id: component_levels[ component_of[table_id] ] for table_id in table_ids }
+    cycles = [ component for component in components if len(component) > 1 ]
+
+    return levels, cycles
+
+def set_database_table_levels(database) -> list:
+    """
+    Computes the level of every table of a database and saves the levels that changed in a single query.
+    Returns the cycles found, as lists of tables
+    """
+    tables = list( ferdolt_models.Table.objects.filter(schema__database=database).select_related("schema") )
+    tables_by_id = { table.id: table for table in tables }
+
+    levels, cycles = compute_table_levels( tables_by_id.keys(), get_foreign_key_edges(database) )
+
+    changed_tables = []
+
+    for table in tables:
+        if table.level != levels[table.id]:
+            table.level = levels[table.id]
+            changed_tables.append(table)
+
+    if changed_tables:
+        ferdolt_models.Table.objects.bulk_update(changed_tables, ["level"], batch_size=1000)
+
+        # bulk updates don't send the signals the extraction plans are invalidated with
+        from groups.plans import invalidate_extraction_plans
+        invalidate_extraction_plans()
+
+    cycles = [ [ tables_by_id[table_id] for table_id in cycle ] for cycle in cycles ]
+
+    for cycle in cycles:
+        logging.warning(f"The foreign keys of the {', '.join( table.get_queryname() for table in cycle )} tables of the {database} database form a cycle, these tables are given the same level")
+
+    return cycles
@@ -5,4 +5,7 @@ class NotSupported(Exception):
     """Raised when an unimplemented feature is being accessed"""
 
 class InvalidDatabaseStructure(Exception):
-    """Raised when a target database has an invalid structure e.g. a table without a primary key"""
\ No newline at end of file
+    """Raised when a target database has an invalid structure e.g. a table without a primary key"""
+
+class CorruptExtractionArchive(Exception):
+    """Raised when an extraction archive is truncated, tampered with or cannot be decrypted"""
@@ -1,22 +1,27 @@
 import logging
 from sqlite3 import ProgrammingError
-import time
 
 from cryptography.fernet import Fernet
 
 from django.db.models import F, Q
 from django.db.utils import IntegrityError
 
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
 import mysql.connector
 from mysql.connector import Error
 
 import psycopg
 
+from core.connections import get_connection_parameters, get_pool
+from core.health import allow_connection_attempt, get_database_health, record_connection_failure, record_connection_success
 from core.data_types import data_types
+from core.dependencies import set_database_table_levels
 from core.exceptions import InvalidDatabaseConnectionParameters, InvalidDatabaseStructure, NotSupported
 
 from flux import models as flux_models
 from ferdolt import models as ferdolt_models
+from ferdolt_web import settings
 from ferdolt_web.settings import FERNET_KEY, SERVER_ID
 
 import re
@@ -24,6 +29,7 @@ import pyodbc
 from django.utils.translation import gettext as _
 
 import datetime as dt
+import itertools
 import json
 
 sql_server_regex = re.compile("sqlserver", re.I)
@@ -96,20 +102,30 @@ def get_column_dictionary(table: ferdolt_models.Table, column_name: str) -> dict
         logging.error(f"[In flux.serializers] no column with name {column_name} exists in the {table.__str__()} table")
         return None
 
-def get_database_connection(database: ferdolt_models.Database) -> pyodbc.Cursor:
+def get_postgres_connection_string(database: ferdolt_models.Database, parameters: dict) -> str:
+    # without the password, the connection string is logged when the connection fails
+    return f"dbname={database.name.lower()} user={parameters['username']} host={parameters['host']} "
+
+def open_database_connection(database: ferdolt_models.Database):
+    """
+    Opens a new connection to a database, or returns None if the connection fails
+    """
     dbms_name = database.dbms_version.dbms.name
 
+    # the credentials are only decrypted when they change
+    parameters = get_connection_parameters(database)
+
     if sql_server_regex.search(dbms_name):
         driver = "{SQL Server Native Client 11.0}"
         connection_string = (
             f"Driver={driver};"
-            f"Server={database.get_host};"
+            f"Server={parameters['host']};"
             f"Database={database.name};"
-            f"UID={database.get_username};"
+            f"UID={parameters['username']};"
             )
         try:
             # we append the password here instead of above for security reasons as we will be logging the connection string in case of errors
-            connection = pyodbc.connect(connection_string + f"PWD={database.get_password};")
+            connection = pyodbc.connect(connection_string + f"PWD={parameters['password']};")
             return connection
         except pyodbc.ProgrammingError as e:
             print(_("Error connecting to the %(database_name)s database"))
@@ -120,11 +136,11 @@ def get_database_connection(database: ferdolt_models.Database) -> pyodbc.Cursor:
             return None
     
     if postgresql_regex.search(dbms_name):
-        connection_string = f"dbname={database.name.lower()} user={database.get_username} host={database.get_host} "
+        connection_string = get_postgres_connection_string(database, parameters)
         
         try:
             # we append the password here instead of above for security reasons as we will be logging the connection string in case of errors
-            connection = psycopg.connect(connection_string + f"password={database.get_password}")
+            connection = psycopg.connect(connection_string + f"password={parameters['password']}")
             return connection
         except psycopg.OperationalError as e:
             logging.error(f"Error connecting to the Postgres database {database.name} on {database.host}:{database.port}. Connection string: '{connection_string}'. Error: {str(e)}")
@@ -134,10 +150,10 @@ def get_database_connection(database: ferdolt_models.Database) -> pyodbc.Cursor:
     if mysql_regex.search(dbms_name):
         try:
             connection = mysql.connector.connect(
-                host=f'{database.get_host}',
+                host=parameters['host'],
                 database=f'{database.name.lower()}',
-                user=f'{database.get_username}',
-                password=f'{database.get_password}'
+                user=parameters['username'],
+                password=parameters['password']
             )
 
             if not connection.is_connected():
@@ -150,17 +166,185 @@ def get_database_connection(database: ferdolt_models.Database) -> pyodbc.Cursor:
             logging.error(f"Error while connecting to the MySQL database {database.__str__()}. Error: {str(e)}")
             return None
 
+def connect_to_database(database: ferdolt_models.Database):
+    """
+    Opens a new connection to a database and records the outcome in the database's circuit breaker
+    """
+    connection = open_database_connection(database)
+
+    if connection:
+        record_connection_success(database.id)
+    else:
+        record_connection_failure(database.id)
+
+    return connection
+
+def get_database_connection(database: ferdolt_models.Database) -> pyodbc.Connection:
+    """
+    Returns a connection to a database, or None if the connection fails or the database's circuit is open. 
+    Unless DATABASE_POOL_MAX_SIZE is 0, the connection is borrowed from the database's pool and closing it gives it back
+    """
+    if not allow_connection_attempt(database.id):
+        logging.info(f"Not connecting to the {database} database, it failed to connect {get_database_health(database.id)['failures']} times in a row")
+        return None
+
+    if settings.DATABASE_POOL_MAX_SIZE > 0:
+        return get_pool(database, connect_to_database).borrow(database)
+
+    return connect_to_database(database)
+
+def get_streaming_cursor(connection, name=None):
+    """
+    Get a cursor whose results can be fetched in batches without loading the whole result set in memory.
+    Postgres connections get a named (server-side) cursor, the other drivers already fetch rows lazily
+    """
+    # pooled connections wrap the driver's connection
+    connection = getattr(connection, "raw_connection", connection)
+
+    if name and isinstance(connection, psycopg.Connection):
+        return connection.cursor(name=name)
+
+    return connection.cursor()
+
+def fetch_in_batches(cursor, batch_size):
+    """
+    Yields the rows of an executed cursor in lists of at most batch_size rows
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+
+        if not rows:
+            break
+
+        yield rows
+
+# the ODBC type and default size of each SQL Server data type, used to describe parameters to fast_executemany
+SQLSERVER_INPUT_TYPES = {
+    'bit': (pyodbc.SQL_BIT, 0), 'tinyint': (pyodbc.SQL_TINYINT, 0), 'smallint': (pyodbc.SQL_SMALLINT, 0),
+    'int': (pyodbc.SQL_INTEGER, 0), 'bigint': (pyodbc.SQL_BIGINT, 0), 
+    'decimal': (pyodbc.SQL_DECIMAL, 18), 'numeric': (pyodbc.SQL_NUMERIC, 18), 'money': (pyodbc.SQL_DECIMAL, 19),
+    'float': (pyodbc.SQL_FLOAT, 0), 'real': (pyodbc.SQL_REAL, 0),
+    'date': (pyodbc.SQL_TYPE_DATE, 0), 'time': (pyodbc.SQL_SS_TIME2, 16),
+    'datetime': (pyodbc.SQL_TYPE_TIMESTAMP, 23), 'datetime2': (pyodbc.SQL_TYPE_TIMESTAMP, 27), 'smalldatetime': (pyodbc.SQL_TYPE_TIMESTAMP, 16),
+    'char': (pyodbc.SQL_CHAR, 0), 'varchar': (pyodbc.SQL_VARCHAR, 0), 'text': (pyodbc.SQL_VARCHAR, 0),
+    'nchar': (pyodbc.SQL_WCHAR, 0), 'nvarchar': (pyodbc.SQL_WVARCHAR, 0), 'ntext': (pyodbc.SQL_WVARCHAR, 0),
+    'binary': (pyodbc.SQL_BINARY, 0), 'varbinary': (pyodbc.SQL_VARBINARY, 0),
+    'uniqueidentifier': (pyodbc.SQL_GUID, 0),
+}
+
+def get_sqlserver_input_sizes(column_dictionaries) -> list:
+    """
+    Returns the ( type, size, decimal digits ) of the parameters used to insert into SQL Server columns, 
+    from the dictionaries returned by get_column_dictionary. Columns of unknown types are described as None, letting pyodbc guess
+    """
+    input_sizes = []
+
+    for column_dictionary in column_dictionaries:
+        if not column_dictionary or column_dictionary['data_type'] not in SQLSERVER_INPUT_TYPES:
+            input_sizes.append(None)
+            continue
+
+        type = column_dictionary['data_type']
+        sql_type, size = SQLSERVER_INPUT_TYPES[type]
+        decimal_digits = 0
+
+        if type in ['char', 'nchar', 'varchar', 'nvarchar', 'binary', 'varbinary']:
+            # (max) columns have a length of -1, they are sent with a size of 0
+            size = max( column_dictionary['character_maximum_length'] or 0, 0 )
+
+        if type in ['decimal', 'numeric']:
+            # the temporary tables are created with no scale, see get_type_and_precision
+            size = column_dictionary['numeric_precision'] or size
+
+        if type in ['datetime', 'datetime2', 'time'] and column_dictionary['datetime_precision'] is not None:
+            decimal_digits = column_dictionary['datetime_precision']
+            
+            if type == 'time':
+                size = 8 + decimal_digits + (1 if decimal_digits else 0)
+            else:
+                size = 19 + decimal_digits + (1 if decimal_digits else 0)
+
+        input_sizes.append( ( sql_type, size, decimal_digits ) )
+
+    return input_sizes
+
+def iter_batches(rows, batch_size):
+    """
+    Yields the rows (a list or any iterable) in lists of at most batch_size rows
+    """
+    rows = iter(rows)
+
+    while True:
+        batch = list( itertools.islice(rows, batch_size) )
+
+        if not batch:
+            break
+
+        yield batch
+
+def bulk_insert_rows(cursor, table_name, columns, rows, input_sizes=None, batch_size=None):
+    """
+    Inserts rows into a table, streaming them with COPY ... FROM STDIN on postgres connections 
+    and falling back to executemany calls of INSERT queries on the other drivers or if the COPY fails.
+    Each executemany sends at most batch_size (EXTRACTION_BATCH_SIZE by default) rows, 
+    as the drivers hold all the parameters of a call in memory.
+
+    With the input_sizes of the columns (see get_sqlserver_input_sizes), pyodbc cursors send the rows of a batch at once with fast_executemany
+    """
+    batch_size = batch_size or settings.EXTRACTION_BATCH_SIZE
+
+    if isinstance(cursor, psycopg.Cursor):
+        # the rows are read again by the fallback if the copy fails
+        rows = rows if isinstance(rows, list) else list(rows)
+
+        try:
+            # the copy runs in a savepoint so a failure doesn't abort the transaction the fallback runs in
+            with cursor.connection.transaction():
+                with cursor.copy( f"COPY {table_name} ( { ', '.join(columns) } ) FROM STDIN" ) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+
+            return
+        except psycopg.Error as e:
+            logging.warning(f"Error copying rows into the {table_name} table, inserting them instead. Error: {str(e)}")
+
+    insert_query = f"""
+    INSERT INTO {table_name} ( { ', '.join(columns) } ) 
+    VALUES ( { ', '.join( [ '?' if isinstance(cursor, pyodbc.Cursor) else '%s' for _ in columns ] ) } );
+    """
+
+    if input_sizes and isinstance(cursor, pyodbc.Cursor):
+        # the parameters are described up front so pyodbc doesn't have to guess them from the first row
+        cursor.fast_executemany = True
+        cursor.setinputsizes(input_sizes)
+
+        try:
+            for batch in iter_batches(rows, batch_size):
+                cursor.executemany(insert_query, batch)
+        finally:
+            cursor.fast_executemany = False
+            cursor.setinputsizes(None)
+
+        return
+
+    for batch in iter_batches(rows, batch_size):
+        cursor.executemany(insert_query, batch)
+
 def get_create_temporary_table_query(database, temporary_table_name, columns_and_datatypes_string):
     """
     Get the query to create a temporary table based on the database
     """
     dbms_name = database.dbms_version.dbms.name
 
+    # pooled connections are reused, so a temporary table of an earlier synchronization may still exist
     if sql_server_regex.search(dbms_name):
-        return f"CREATE TABLE #{temporary_table_name} {columns_and_datatypes_string}"
+        return f"IF OBJECT_ID('tempdb..#{temporary_table_name}') IS NOT NULL DROP TABLE #{temporary_table_name}; CREATE TABLE #{temporary_table_name} {columns_and_datatypes_string}"
 
-    if postgresql_regex.search(dbms_name) or mysql_regex.search(dbms_name):
-        return f"CREATE TEMP TABLE {temporary_table_name} {columns_and_datatypes_string}"
+    if postgresql_regex.search(dbms_name):
+        return f"DROP TABLE IF EXISTS pg_temp.{temporary_table_name}; CREATE TEMP TABLE {temporary_table_name} {columns_and_datatypes_string}"
+
+    if mysql_regex.search(dbms_name):
+        return f"CREATE TEMPORARY TABLE IF NOT EXISTS {temporary_table_name} {columns_and_datatypes_string}"
 
 def get_temporary_table_name(database, temporary_table_name: str):
     """
@@ -270,7 +454,154 @@ def get_column_datatype(is_postgres_db, is_sqlserver_db, is_mysql_db, data_type_
     
     return data_type_string
 
+def get_foreign_key_references_query(dbms_booleans, database, table: ferdolt_models.Table=None) -> str:
+    """
+    Returns the query selecting every column of a database referencing another column, optionally only those of a table.
+    Each row has the referencing_schema, referencing_table and referencing_column, and the schema_name, table_name and column_name referenced. 
+    The columns of composite foreign keys are paired by their position in the key
+    """
+    query = None
+
+    if dbms_booleans["is_sqlserver_db"]:
+        query = f"""
+            SELECT OBJECT_SCHEMA_NAME(fc.parent_object_id) referencing_schema, OBJECT_NAME(fc.parent_object_id) referencing_table, 
+            COL_NAME(fc.parent_object_id, fc.parent_column_id) referencing_column, 
+            OBJECT_SCHEMA_NAME(fc.referenced_object_id) schema_name, OBJECT_NAME(fc.referenced_object_id) table_name, 
+            COL_NAME(fc.referenced_object_id, fc.referenced_column_id) column_name 
+            FROM sys.foreign_key_columns fc 
+            { f"WHERE fc.parent_object_id=object_id('{table.schema.name}.{table.name}')" if table else '' }
+        """
+    elif dbms_booleans['is_postgres_db']:
+        query = f"""
+            SELECT kcu.table_schema referencing_schema, kcu.table_name referencing_table, kcu.column_name referencing_column, 
+            ukcu.table_schema schema_name, ukcu.table_name table_name, ukcu.column_name column_name 
+            FROM information_schema.referential_constraints rc 
+            JOIN information_schema.key_column_usage kcu 
+                ON kcu.constraint_schema = rc.constraint_schema AND kcu.constraint_name = rc.constraint_name 
+            JOIN information_schema.key_column_usage ukcu 
+                ON ukcu.constraint_schema = rc.unique_constraint_schema AND ukcu.constraint_name = rc.unique_constraint_name 
+                AND ukcu.ordinal_position = kcu.position_in_unique_constraint 
+            { f"WHERE kcu.table_schema='{table.schema.name}' AND kcu.table_name='{table.name}'" if table else '' }
+        """
+    elif dbms_booleans['is_mysql_db']:
+        query = f"""
+            SELECT TABLE_SCHEMA referencing_schema, TABLE_NAME referencing_table, COLUMN_NAME referencing_column, 
+            REFERENCED_TABLE_SCHEMA schema_name, REFERENCED_TABLE_NAME table_name, REFERENCED_COLUMN_NAME column_name
+            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE 
+            WHERE REFERENCED_TABLE_NAME IS NOT NULL AND TABLE_SCHEMA='{database.name}' 
+            { f"AND TABLE_NAME='{table.name}'" if table else '' }
+        """
+
+    return query
+
+def read_foreign_key_references(database: ferdolt_models.Database, cursor, dbms_booleans, table: ferdolt_models.Table=None) -> list:
+    """
+    Reads the foreign keys of a database (or of one of its tables) with a single query.
+    Returns them as ( referencing table, { table_name, schema_name, column_name, referencing_column } ) tuples, 
+    the foreign keys of tables without records are left out
+    """
+    query = get_foreign_key_references_query(dbms_booleans, database, table)
+
+    if not query:
+        return []
+
+    if table:
+        tables = { ( table.schema.name.lower(), table.name.lower() ): table }
+    else:
+        tables = { 
+            ( record.schema.name.lower(), record.name.lower() ): record 
+            for record in ferdolt_models.Table.objects.filter(schema__database=database).select_related("schema") 
+        }
+
+    cursor.execute(query)
+    columns = [ column[0].lower() for column in cursor.description ]
+    rows = cursor.fetchall()
+
+    references = []
+
+    for row in rows:
+        record = dict( zip( columns, row ) )
+        referencing_table = tables.get( ( str(record["referencing_schema"]).lower(), str(record["referencing_table"]).lower() ) )
+
+        if referencing_table:
+            references.append( ( referencing_table, record ) )
+
+    return references
+
+def set_foreign_key_references(database: ferdolt_models.Database, references) -> int:
+    """
+    Points the foreign key constraints of a database's columns to the columns they reference, 
+    references being ( referencing table, { table_name, schema_name, column_name, referencing_column } ) tuples.
+    The columns and constraints of the database are read once and the constraints are created or updated in bulk. 
+    Returns the number of constraints created or modified
+    """
+    columns_by_table = {}
+
+    for column in ferdolt_models.Column.objects.filter(table__schema__database=database).select_related("table__schema"):
+        columns_by_table.setdefault( ( column.table.name.lower(), column.name.lower() ), [] ).append(column)
+
+    foreign_key_constraints = {}
+
+    for constraint in ferdolt_models.ColumnConstraint.objects.filter(column__table__schema__database=database, is_foreign_key=True):
+        foreign_key_constraints.setdefault(constraint.column_id, []).append(constraint)
+
+    constraints_to_create, constraints_to_update = [], {}
+
+    for table, record in references:
+        referenced_columns = columns_by_table.get( ( str(record["table_name"]).lower(), str(record["column_name"]).lower() ), [] )
+
+        if len(referenced_columns) > 1:
+            # tables with the same name in different schemas
+            referenced_columns = [ 
+                column for column in referenced_columns if column.table.schema.name.lower() == str(record["schema_name"]).lower() 
+            ] or referenced_columns
+
+        if not referenced_columns:
+            logging.error(f"Couldn't find the {record['column_name']} column in the {record['table_name']} table")
+            continue
+
+        if len(referenced_columns) > 1:
+            logging.error(f"Multiple {record['column_name']} columns in the {record['table_name']} table")
+            continue
+
+        referenced_column = referenced_columns[0]
+
+        referencing_column = next( ( 
+            column for column in columns_by_table.get( ( table.name.lower(), str(record["referencing_column"]).lower() ), [] ) 
+            if column.table_id == table.id 
+        ), None )
+
+        if not referencing_column:
+            logging.error(f"Couldn't find the {record['referencing_column']} column in the {table.__str__()} table")
+            continue
+
+        constraints = foreign_key_constraints.get(referencing_column.id, [])
+
+        if len(constraints) > 1:
+            logging.error(f"Multiple foreign key constraints on the {referencing_column.name.lower()} column in the {table.__str__()} table")
+        elif not constraints:
+            constraint = ferdolt_models.ColumnConstraint(
+                column=referencing_column, is_foreign_key=True, is_primary_key=False, references=referenced_column
+            )
+            foreign_key_constraints[referencing_column.id] = [ constraint ]
+            constraints_to_create.append(constraint)
+        elif constraints[0].references_id != referenced_column.id:
+            constraints[0].references = referenced_column
+
+            if constraints[0].pk is not None:
+                constraints_to_update[constraints[0].pk] = constraints[0]
+
+    # the constraints are saved without ColumnConstraint.save, the levels of the tables are set by the caller
+    bulk_create_with_history(constraints_to_create, ferdolt_models.ColumnConstraint, batch_size=1000)
+    bulk_update_with_history(list( constraints_to_update.values() ), ferdolt_models.ColumnConstraint, ["references"], batch_size=1000)
+
+    return len(constraints_to_create) + len(constraints_to_update)
+
 def get_table_foreign_key_references(table: ferdolt_models.Table, connection=None):
+    """
+    Refreshes the foreign keys of a single table. set_foreign_key_references reads the columns of the whole database, 
+    callers refreshing many tables use refresh_foreign_key_references once instead
+    """
     database = table.schema.database
 
     if not connection:
@@ -281,78 +612,24 @@ def get_table_foreign_key_references(table: ferdolt_models.Table, connection=Non
 
         dbms_booleans = get_dbms_booleans(database)
 
-        query = None
-
-        if dbms_booleans["is_sqlserver_db"]:
-            # select the table and column name of the referenced table as well as 
-            # the column name of the referencing column
-            query = f"""
-                select OBJECT_NAME(fks.referenced_object_id) table_name, 
-                sc2.name schema_name, COL_NAME(fks.referenced_object_id, fc2.referenced_column_id) column_name, 
-                COL_NAME(fks.parent_object_id, fc.parent_column_id) referencing_column 
-                FROM sys.foreign_keys fks 
-                LEFT JOIN sys.tables tab ON referenced_object_id = tab.object_id 
-                LEFT JOIN sys.schemas sc2 ON tab.schema_id = sc2.schema_id 
-                LEFT JOIN sys.foreign_key_columns fc ON fks.object_id = fc.constraint_object_id 
-                LEFT JOIN sys.foreign_key_columns fc2 ON fks.object_id = fc2.constraint_object_id
-                WHERE fks.parent_object_id=object_id('{table.schema.name}.{table.name}')
-            """
-        elif dbms_booleans['is_postgres_db']:
-            query = f"""
-            SELECT ccu.table_name as table_name, ccu.table_schema as schema_name, ccu.column_name as column_name,
-            kcu.column_name referencing_column  
-            from information_schema.table_constraints as tc 
-            JOIN information_schema.key_column_usage as kcu 
-                on tc.constraint_name=kcu.constraint_name and tc.table_schema = kcu.table_schema 
-            JOIN information_schema.constraint_column_usage as ccu 
-                ON ccu.constraint_name=tc.constraint_name AND ccu.table_schema=tc.table_schema 
-            WHERE tc.constraint_type='FOREIGN KEY' AND tc.table_name='{table.name}' 
-                AND tc.table_schema='{table.schema.name}'
-            """
-        elif dbms_booleans['is_mysql_db']:
-            query = f"""
-            SELECT TABLE_SCHEMA schema_name, COLUMN_NAME referencing_column, 
-            REFERENCED_TABLE_NAME table_name, REFERENCED_COLUMN_NAME column_name
-            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE 
-            WHERE REFERENCED_TABLE_SCHEMA='{table.schema.name}' AND TABLE_NAME='{table.name}'
-            """
-        if query:
-            rows = cursor.execute(query)
-            columns = [ column[0] for column in cursor.description ]
-
-            for row in rows:
-                record = dict( zip( columns, row ) )
-
-                try:
-                    # getting the primary key column in the parent table
-                    referenced_column = ferdolt_models.Column.objects.get( table__schema__database=database, table__name__iexact=record["table_name"], 
-                    name__iexact=record["column_name"] )
-
-                    try:
-                        try:
-                            referencing_column = ferdolt_models.Column.objects.get( table=table, name__iexact=record["referencing_column"] ) 
-                            constraint = ferdolt_models.ColumnConstraint.objects.get_or_create( column=referencing_column, 
-                            is_foreign_key=True, defaults={'is_primary_key': False} )
-
-                            constraint
-                            constraint[0].references = referenced_column
-                            constraint[0].save()
+        if set_foreign_key_references( database, read_foreign_key_references(database, cursor, dbms_booleans, table=table) ):
+            # bulk operations don't send the signals the extraction plans are invalidated with
+            from groups.plans import invalidate_extraction_plans
 
-                            logging.info(f"Successfully { 'created' if constraint[1] else 'modified' } the foreign key constraint in the {table.__str__()} table")
-                        except ferdolt_models.ColumnConstraint.MultipleObjectsReturned as e:
-                            logging.error(f"Multiple foreign key constraints on the {referencing_column.name.lower()} column in the {table.__str__()} table")
+            set_database_table_levels(database)
+            invalidate_extraction_plans()
 
-                    except ferdolt_models.Column.DoesNotExist as e:
-                        logging.error(f"Couldn't find the {record['column_name']} column in the {record['table_name']} table")
-                    
-                    except IntegrityError as e:
-                        logging.error(f"Error adding foreign key constraint on {table.name}{record['referencing_column']} to {record['table_name']}.{record['column_name']}. Error: {str(e)}")
+def refresh_foreign_key_references(database: ferdolt_models.Database, connection):
+    """
+    Refreshes the foreign keys of all the tables of a database with one query, then the levels of its tables
+    """
+    from groups.plans import invalidate_extraction_plans
 
-                    except ferdolt_models.Column.MultipleObjectsReturned as e:
-                        logging.error(f"Multiple {record['column_name']} columns in the {record['table_name']} table")
+    set_foreign_key_references( database, read_foreign_key_references(database, connection.cursor(), get_dbms_booleans(database)) )
+    set_database_table_levels(database)
 
-                except ferdolt_models.Column.DoesNotExist as e:
-                    logging.error(f"Couldn't find the {record['column_name']} column in the {record['table_name']} table")
+    # bulk operations don't send the signals the extraction plans are invalidated with
+    invalidate_extraction_plans()
 
 def get_database_structure_dictionary(database, connection):
     """
@@ -437,47 +714,127 @@ def get_database_structure_dictionary(database, connection):
 
         return dictionary
 
-def create_database_objects_records_from_structure_dictionary( database, dictionary ):
-    for schema in dictionary.keys():
-        schema_record = ferdolt_models.DatabaseSchema.objects.get_or_create(
-            name=schema.lower(), database=database
-        )[0]
-        schema_dictionary = dictionary[schema]
+def create_database_objects_records_from_structure_dictionary( database, dictionary, connection=None ):
+    """
+    Brings the schema, table, column and constraint records of a database in line with its structure dictionary 
+    (see get_database_structure_dictionary). The existing records are read once and the differences are written in bulk. 
+    Records of objects no longer in the database are kept, except for constraints.
+    The foreign keys are then read with the connection, if there is one
+    """
+    schemas = { schema.name: schema for schema in ferdolt_models.DatabaseSchema.objects.filter(database=database) }
+
+    new_schemas = [ 
+        ferdolt_models.DatabaseSchema(database=database, name=schema.lower()) 
+        for schema in dict.fromkeys( schema.lower() for schema in dictionary.keys() ) if schema not in schemas 
+    ]
+    bulk_create_with_history(new_schemas, ferdolt_models.DatabaseSchema, batch_size=1000)
+    schemas.update( { schema.name: schema for schema in new_schemas } )
+
+    tables = { 
+        ( table.schema.name, table.name ): table 
+        for table in ferdolt_models.Table.objects.filter(schema__database=database).select_related("schema") 
+    }
+
+    new_tables = {}
 
+    for schema, schema_dictionary in dictionary.items():
         for table in schema_dictionary.keys():
-            table_record: ferdolt_models.Table = ferdolt_models.Table.objects.get_or_create(schema=schema_record, name=table.lower())[0]
-            table_dictionary = schema_dictionary[table]
-            for column in table_dictionary.keys():
-                column_dictionary = table_dictionary[column]
-                try:
-                    if column_dictionary['data_type'] in data_types:
-                        column_record = ferdolt_models.Column.objects.get_or_create(table=table_record, name=column)[0]
+            key = ( schema.lower(), table.lower() )
+
+            if key not in tables and key not in new_tables:
+                new_tables[key] = ferdolt_models.Table( schema=schemas[key[0]], name=key[1] )
+
+    bulk_create_with_history(list( new_tables.values() ), ferdolt_models.Table, batch_size=1000)
+    tables.update(new_tables)
+
+    # the columns keep the case of their names, they are matched without it
+    columns = { 
+        ( column.table_id, column.name.lower() ): column 
+        for column in ferdolt_models.Column.objects.filter(table__schema__database=database) 
+    }
+
+    column_fields = [ 'data_type', 'datetime_precision', 'character_maximum_length', 'numeric_precision', 'is_nullable' ]
+    new_columns, changed_columns = {}, []
+    # the constraints each column should have, as ( is_primary_key, is_foreign_key ) tuples
+    column_constraints = {}
+
+    primary_key_regex = re.compile("primary key", re.I)
+    foreign_key_regex = re.compile("foreign key", re.I)
+
+    for schema, schema_dictionary in dictionary.items():
+        for table, table_dictionary in schema_dictionary.items():
+            table_record = tables[ ( schema.lower(), table.lower() ) ]
+
+            for column, column_dictionary in table_dictionary.items():
+                if column_dictionary['data_type'] not in data_types:
+                    continue
+
+                key = ( table_record.id, column.lower() )
+                column_record = columns.get(key) or new_columns.get(key)
+
+                if column_record is None:
+                    column_record = ferdolt_models.Column( table=table_record, name=column )
+                    new_columns[key] = column_record
+                    
+                    for field in column_fields:
+                        setattr( column_record, field, column_dictionary[field] )
+                elif any( getattr(column_record, field) != column_dictionary[field] for field in column_fields ):
+                    for field in column_fields:
+                        setattr( column_record, field, column_dictionary[field] )
+
+                    changed_columns.append(column_record)
+
+                constraints = column_constraints.setdefault(key, set())
+
+                for constraint in column_dictionary['constraint_type']:
+                    if constraint:
+                        if primary_key_regex.search(constraint):
+                            constraints.add( ( True, False ) )
                         
-                        column_record.data_type = column_dictionary['data_type']
-                        column_record.datetime_precision = column_dictionary['datetime_precision']
-                        column_record.character_maximum_length = column_dictionary['character_maximum_length']
-                        column_record.numeric_precision = column_dictionary['numeric_precision']
-                        column_record.is_nullable = column_dictionary['is_nullable']
-                        column_record.save()
-
-                        column_record.columnconstraint_set.all().delete()
-
-                        for constraint in column_dictionary['constraint_type']:
-                            primary_key_regex = re.compile("primary key", re.I)
-                            foreign_key_regex = re.compile("foreign key", re.I)
-                            
-                            if constraint:
-                                if primary_key_regex.search(constraint):
-                                    ferdolt_models.ColumnConstraint.objects.create(column=column_record, is_primary_key=True)
-                                
-                                if foreign_key_regex.search(constraint):
-                                    ferdolt_models.ColumnConstraint.objects.create(column=column_record, is_foreign_key=True)
+                        if foreign_key_regex.search(constraint):
+                            constraints.add( ( False, True ) )
 
-                        get_table_foreign_key_references(table_record)
+    bulk_create_with_history(list( new_columns.values() ), ferdolt_models.Column, batch_size=1000)
+    bulk_update_with_history(changed_columns, ferdolt_models.Column, column_fields, batch_size=1000)
+    columns.update(new_columns)
 
-                except ferdolt_models.Column.MultipleObjectsReturned as e:
-                    logging.error(f"Error when trying to get column {column} from table {table}. Error: {str(e)}")
-                    print(f"Error when trying to get column {column} from table {table}. Error: {str(e)}")
+    # the constraints that still exist are kept with the columns they reference
+    existing_constraints = {}
+
+    for constraint in ferdolt_models.ColumnConstraint.objects.filter(column__table__schema__database=database):
+        existing_constraints.setdefault( ( constraint.column_id, constraint.is_primary_key, constraint.is_foreign_key ), [] ).append(constraint)
+
+    new_constraints = []
+    column_ids = { key: columns[key].id for key in column_constraints.keys() }
+
+    for key, constraints in column_constraints.items():
+        for is_primary_key, is_foreign_key in constraints:
+            if not existing_constraints.pop( ( column_ids[key], is_primary_key, is_foreign_key ), None ):
+                new_constraints.append( ferdolt_models.ColumnConstraint(
+                    column=columns[key], is_primary_key=is_primary_key, is_foreign_key=is_foreign_key
+                ) )
+
+    introspected_column_ids = set( column_ids.values() )
+    removed_constraint_ids = [ 
+        constraint.id for ( column_id, _, _ ), constraints in existing_constraints.items() 
+        if column_id in introspected_column_ids for constraint in constraints 
+    ]
+
+    ferdolt_models.ColumnConstraint.objects.filter(id__in=removed_constraint_ids).delete()
+    bulk_create_with_history(new_constraints, ferdolt_models.ColumnConstraint, batch_size=1000)
+
+    if connection:
+        # all the foreign keys of the database are read with one query
+        references = read_foreign_key_references( database, connection.cursor(), get_dbms_booleans(database) )
+
+        set_foreign_key_references(database, references)
+
+    # the order the tables are written in during synchronizations
+    set_database_table_levels(database)
+
+    # bulk operations don't send the signals the extraction plans are invalidated with
+    from groups.plans import invalidate_extraction_plans
+    invalidate_extraction_plans()
 
 def get_database_details( database ):
     connection = get_database_connection(database)
@@ -485,36 +842,51 @@ def get_database_details( database ):
     if connection:
         dictionary = get_database_structure_dictionary(database, connection)
 
-        create_database_objects_records_from_structure_dictionary(database, dictionary)
+        create_database_objects_records_from_structure_dictionary(database, dictionary, connection=connection)
         connection.close()
 
     else:
         raise InvalidDatabaseConnectionParameters("""Error connecting to the database. Check if the credentials are correct or if the database is running""")
 
-def synchronize_database( connection, database_record, dictionary, temporary_tables_created=None ):
+def get_database_sections(reader, database_name):
+    """
+    Returns the sections of an extraction (see flux.archives) holding the tables of a database, as { ( schema, table ): keys of the section },
+    the schema and table names being lowercased. An extraction of a single database is used whatever the name of that database.
+    Returns None if the extraction has several databases and the database is not one of them
+    """
+    databases = {}
+
+    for keys in reader.keys:
+        # the sections of extractions of several databases are keyed by ( database, schema, table )
+        full_keys = ( reader.root_key, *keys ) if reader.root_key is not None else tuple(keys)
+
+        if len(full_keys) == 3:
+            databases.setdefault( full_keys[0], {} )[ ( full_keys[1].lower(), full_keys[2].lower() ) ] = keys
+
+    if database_name.lower() in databases:
+        return databases[database_name.lower()]
+
+    return list( databases.values() )[0] if len(databases) == 1 else None
+
+def synchronize_database( connection, database_record, reader, temporary_tables_created=None ):
+    """
+    Applies an extraction to a database, reading its rows from the reader (see flux.archives.open_extraction) one chunk at a time
+    """
     if temporary_tables_created is None:
         temporary_tables_created = set([])
 
     cursor = connection.cursor()
 
-    dictionary_key = list( dictionary.keys() )[0] if len(dictionary.keys()) == 1 else None
-
-    if database_record.name.lower() in dictionary.keys():
-        dictionary_key = database_record.name.lower()
+    sections = get_database_sections(reader, database_record.name)
     
-    if not dictionary_key:
-        logging.error( f"[In core.functions.synchronize_database]. The dictionary has multiple keys and the database's name is not one of them" )
-        print( f"[In core.functions.synchronize_database]. The dictionary has multiple keys and the database's name is not one of them" )
+    if sections is None:
+        logging.error( f"[In core.functions.synchronize_database]. The extraction has multiple databases and the database's name is not one of them" )
+        print( f"[In core.functions.synchronize_database]. The extraction has multiple databases and the database's name is not one of them" )
     else:
         dbms_booleans = get_dbms_booleans(database_record)
 
-        item: dict = dictionary[dictionary_key]
-
-        tables_set = set([])
-
-        for schema in item.keys():
-            for table in item[schema].keys():
-                tables_set.add(table.lower())
+        tables_set = set( [ table for _, table in sections.keys() ] )
+        schemas_set = set( [ schema for schema, _ in sections.keys() ] )
 
         database_tables = ferdolt_models.Table.objects.filter(
             Q(schema__database=database_record)
@@ -525,7 +897,7 @@ def synchronize_database( connection, database_record, dictionary, temporary_tab
             ~Q( id__in=database_tables.filter(deletion_table__isnull=False)
                                         .values("deletion_table__id"))
             & Q( name__in=tables_set )
-            & Q( schema__name__in=item.keys() )
+            & Q( schema__name__in=schemas_set )
         ).annotate(deletion_target_level=F("deletion_target__level")).order_by("level")
 
         # get tables that are deletion tables
@@ -539,12 +911,15 @@ def synchronize_database( connection, database_record, dictionary, temporary_tab
 
             table_dictionary_key = "rows" if table.deletion_target_level is None else "deletions"
 
-            table_rows = item[schema_name][table_name][table_dictionary_key]
+            # sections without rows may be missing from the extraction
+            section_keys = sections.get( ( schema_name, table_name ) )
+            column_chunks = reader.iter_column_chunks(section_keys, table_dictionary_key) if section_keys else iter([])
+            first_chunk = next(column_chunks, None)
 
-            if table_rows:
-                table_columns = set([
-                    f["name"] for f in table.column_set.values("name") if f["name"] in table_rows[0].keys()
-                ])
+            if first_chunk is not None:
+                table_columns = [
+                    f["name"] for f in table.column_set.values("name") if f["name"] in first_chunk[0]
+                ]
                 if table.deletion_target_level is None:
                     primary_key_columns = [
                         f["name"] for f in table.column_set.filter(columnconstraint__is_primary_key=True).values("name")
@@ -575,19 +950,18 @@ def synchronize_database( connection, database_record, dictionary, temporary_tab
                             connection.rollback()
                             raise e
 
-                        insert_into_temporary_table_query = f"""
-                        INSERT INTO {temporary_table_actual_name} ( { ', '.join( [ column for column in table_columns ] ) } ) 
-                        VALUES ( { ', '.join( [ '?' if isinstance(cursor, pyodbc.Cursor) else '%s'  for _ in table_columns ] ) } );
-                        """
-                        rows_to_insert = []
+                        # postgres targets get the rows through COPY and SQL Server targets through fast_executemany instead of one INSERT per row
+                        input_sizes = get_sqlserver_input_sizes( 
+                            [ get_column_dictionary(table, column) for column in table_columns ] 
+                        ) if dbms_booleans['is_sqlserver_db'] else None
+
+                        # the rows are inserted in the temporary table one chunk of the extraction at a time
+                        for columns, values in itertools.chain( [ first_chunk ], column_chunks ):
+                            positions = { column: position for position, column in enumerate(columns) }
+                            rows_to_insert = list( zip( *[ values[ positions[column] ] for column in table_columns ] ) )
 
-                        # getting the list of tables for bulk insert
-                        for row in table_rows:
-                            rows_to_insert.append( tuple(
-                                row[f] for f in table_columns
-                            ) )
+                            bulk_insert_rows(cursor, temporary_table_actual_name, table_columns, rows_to_insert, input_sizes=input_sizes)
 
-                        cursor.executemany(insert_into_temporary_table_query, rows_to_insert)
                         if dbms_booleans['is_sqlserver_db']:
                             # set identity_insert on to be able to explicitly write values for identity columns
                             try:
@@ -687,7 +1061,6 @@ def synchronize_database( connection, database_record, dictionary, temporary_tab
                     except (psycopg.ProgrammingError, pyodbc.ProgrammingError) as e:
                         logging.error(f"Error inserting into temporary table {temporary_table_actual_name}. Error encountered: {str(e)}")
                         # print(f"Error inserting into temporary table {temporary_table_actual_name}. Error encountered: {str(e)}")
-                        logging.error(f"Query to insert into temporary table {insert_into_temporary_table_query}")
                         cursor.connection.rollback()
                         flag = False
                         raise e
@@ -702,7 +1075,26 @@ def synchronize_database( connection, database_record, dictionary, temporary_tab
                     flag = False
                     raise e
             
-def create_sequence_query(sequence_name, is_postgres_db=False, is_sqlserver_db=False, is_mysql_db=False, data_type='int', start=1, minvalue=1, cycle='true', increment=1, maxvalue=99):
+# the tracking_ids are the server's id, a prefix and a counter of TRACKING_ID_COUNTER_DIGITS digits. 
+# The prefix tells the ids given by the triggers from those given to the existing rows of a table when it is initialized,
+# both are kept apart from the ids set by the former triggers, which only had digits after the server's id
+TRIGGER_TRACKING_ID_PREFIX = 'S'
+BACKFILLED_TRACKING_ID_PREFIX = 'B'
+TRACKING_ID_COUNTER_DIGITS = 15
+
+def get_tracking_id_sequence_name(table) -> str:
+    """
+    returns the name of the sequence numbering the tracking_ids set by the triggers of a table
+    """
+    return f"{table.schema.name.lower()}_{table.name.lower()}_tracking_id_counter"
+
+def create_sequence_query(sequence_name, is_postgres_db=False, is_sqlserver_db=False, is_mysql_db=False, data_type='bigint', start=1, minvalue=1, cycle=False, increment=1, maxvalue=None):
+    """
+    returns the query creating a sequence, by default the sequence numbering the tracking_ids set by the triggers: 
+    a bigint that never cycles and stops at the largest counter a tracking_id can hold
+    """
+    maxvalue = 10 ** TRACKING_ID_COUNTER_DIGITS - 1 if maxvalue is None else maxvalue
+
     if not is_postgres_db and not is_mysql_db and not is_sqlserver_db:
         raise ValueError("One of the followin have to be True: is_postgres_db, is_mysql_db, is_sqlserver_db")
 
@@ -910,6 +1302,106 @@ def get_column_type_and_precision(column) -> str:
 
     return f"{string} {type}"
 
+def get_tracking_id_expression(counter_expression, prefix, is_postgres_db=False, is_sqlserver_db=False, is_mysql_db=False) -> str:
+    """
+    Returns the expression of a tracking_id made of the server's id, a prefix and a zero-padded counter
+    """
+    if is_sqlserver_db:
+        return f"'{SERVER_ID}{prefix}' + RIGHT( REPLICATE('0', {TRACKING_ID_COUNTER_DIGITS}) + CAST( {counter_expression} AS VARCHAR({TRACKING_ID_COUNTER_DIGITS}) ), {TRACKING_ID_COUNTER_DIGITS} )"
+    if is_postgres_db:
+        return f"'{SERVER_ID}{prefix}' || LPAD( CAST( {counter_expression} AS VARCHAR ), {TRACKING_ID_COUNTER_DIGITS}, '0' )"
+    if is_mysql_db:
+        return f"CONCAT( '{SERVER_ID}{prefix}', LPAD( {counter_expression}, {TRACKING_ID_COUNTER_DIGITS}, '0' ) )"
+
+def get_backfill_tracking_id_query(table, primary_key_columns, offset, chunk_size, is_postgres_db=False, is_sqlserver_db=False, is_mysql_db=False, column_name='tracking_id') -> str:
+    """
+    Returns the query giving tracking_ids to (at most chunk_size, all of them if chunk_size is 0) rows of a table without one, in the order of their primary key.
+    The counters of the ids follow offset
+    """
+    primary_key_column_names = [ column.name for column in primary_key_columns ]
+    order_by = ', '.join(primary_key_column_names)
+    table_queryname = table.get_queryname()
+
+    if is_sqlserver_db:
+        tracking_id = get_tracking_id_expression(f"{offset} + row_position", BACKFILLED_TRACKING_ID_PREFIX, is_sqlserver_db=True)
+
+        return f"""
+        WITH numbered_rows AS (
+            SELECT { f'TOP ({chunk_size}) ' if chunk_size else '' }{column_name}, ROW_NUMBER() OVER (ORDER BY {order_by}) AS row_position
+            FROM {table_queryname} WHERE {column_name} IS NULL{ f' ORDER BY {order_by}' if chunk_size else '' }
+        )
+        UPDATE numbered_rows SET {column_name} = {tracking_id}
+        """
+
+    if is_postgres_db:
+        tracking_id = get_tracking_id_expression(f"{offset} + numbered_rows.row_position", BACKFILLED_TRACKING_ID_PREFIX, is_postgres_db=True)
+
+        return f"""
+        WITH numbered_rows AS (
+            SELECT {order_by}, ROW_NUMBER() OVER (ORDER BY {order_by}) AS row_position
+            FROM {table_queryname} WHERE {column_name} IS NULL ORDER BY {order_by}{ f' LIMIT {chunk_size}' if chunk_size else '' }
+        )
+        UPDATE {table_queryname} AS t SET {column_name} = {tracking_id}
+        FROM numbered_rows WHERE { ' AND '.join( [ f"t.{column} = numbered_rows.{column}" for column in primary_key_column_names ] ) }
+        """
+
+    if is_mysql_db:
+        # the counter is a session variable, set to offset before the query is run
+        tracking_id = get_tracking_id_expression("@tracking_id_counter := @tracking_id_counter + 1", BACKFILLED_TRACKING_ID_PREFIX, is_mysql_db=True)
+
+        return f"""
+        UPDATE {table_queryname} SET {column_name} = {tracking_id}
+        WHERE {column_name} IS NULL ORDER BY {order_by}{ f' LIMIT {chunk_size}' if chunk_size else '' }
+        """
+
+def get_last_tracking_id_counter(cursor, table, prefix, column_name='tracking_id') -> int:
+    """
+    Returns the highest counter of the tracking_ids of a table starting with the server's id and prefix, 0 if there is none
+    """
+    # the counters are zero-padded, the highest id is the one with the highest counter
+    cursor.execute(f"SELECT MAX({column_name}) FROM {table.get_queryname()} WHERE {column_name} LIKE '{SERVER_ID}{prefix}%'")
+    last_tracking_id = cursor.fetchone()[0]
+
+    return int( last_tracking_id[ len(SERVER_ID) + len(prefix): ] ) if last_tracking_id else 0
+
+def backfill_tracking_ids(connection, cursor, table, primary_key_columns, dbms_booleans, chunk_size=None, on_progress=None, column_name='tracking_id') -> int:
+    """
+    Gives a tracking_id to the rows of a table that don't have one, chunk_size (TRACKING_ID_BACKFILL_CHUNK_SIZE by default) rows per update.
+    Every chunk is committed and reported with on_progress( rows updated, rows to update ). Returns the number of rows updated
+    """
+    chunk_size = settings.TRACKING_ID_BACKFILL_CHUNK_SIZE if chunk_size is None else chunk_size
+
+    cursor.execute(f"SELECT COUNT(*) FROM {table.get_queryname()} WHERE {column_name} IS NULL")
+    total = cursor.fetchone()[0]
+
+    # the rows backfilled by a previous initialization keep their ids
+    offset = get_last_tracking_id_counter(cursor, table, BACKFILLED_TRACKING_ID_PREFIX, column_name=column_name)
+    updated = 0
+
+    while updated < total:
+        query = get_backfill_tracking_id_query(table, primary_key_columns, offset, chunk_size, column_name=column_name, **dbms_booleans)
+
+        if dbms_booleans['is_mysql_db']:
+            cursor.execute(f"SET @tracking_id_counter = {offset}")
+
+        cursor.execute(query)
+        row_count = cursor.rowcount
+        connection.commit()
+
+        if row_count <= 0:
+            # rows were given a tracking_id by another session since they were counted
+            break
+
+        offset += row_count
+        updated += row_count
+
+        logging.info(f"Set the tracking_id of {updated} of the {total} rows of the {table.get_queryname()} table")
+
+        if on_progress:
+            on_progress(updated, total)
+
+    return updated
+
 def set_tracking_id_where_null_query_multiple_primary_keys(table, primary_key_columns, server_id, sequence_name, is_postgres_db=False, is_sqlserver_db=False, is_mysql_db=False, column_name='tracking_id'):
     schema_name = table.schema.name
     table_name = table.name
@@ -1007,6 +1499,9 @@ def insert_update_delete_trigger_query(
     primary_key_column_names = [ f.name for f in primary_key_columns ]
 
     if is_sqlserver_db:
+        # quoted to be part of the trigger's dynamic sql
+        tracking_id_expression = get_tracking_id_expression(f"NEXT VALUE FOR {sequence_name}", TRIGGER_TRACKING_ID_PREFIX, is_sqlserver_db=True).replace("'", "''")
+
         return f"""
         -- create trigger if not exists but last_updated column exists
             IF EXISTS(SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{table.name}' AND TABLE_SCHEMA = '{table.schema.name}' AND COLUMN_NAME = 'last_updated')
@@ -1031,42 +1526,15 @@ def insert_update_delete_trigger_query(
 
                             + 'IF NOT EXISTS (SELECT 0 FROM deleted) '
                             + 'BEGIN '
-                                + ' DECLARE @table_id TABLE ( {', '.join( [ f"{get_column_type_and_precision(column)}" for column in primary_key_columns ] )} );'
-                                + ' DECLARE @now_datetime DATETIME2;'
-                                + ' DECLARE @nextvalue INT;'
-                                + ' DECLARE @offset INT; '
-
-                                + ' SET @nextvalue = next value for {sequence_name}; '
-                                + ' SET @offset = 0;'
-
-                                + 'INSERT INTO @table_id SELECT { ', '.join( [ column.name for column in primary_key_columns ] ) } FROM inserted WHERE tracking_id IS NULL '
-                                + ' ORDER BY { ', '.join( [ column.name for column in primary_key_columns ] ) } OFFSET @offset ROWS ' 
-                                + ' FETCH NEXT 1 ROWS ONLY;'
-
-                                + ' WHILE EXISTS(SELECT 1 FROM @table_id) '
-                                + ' BEGIN '
-                                    + ' SET @now_datetime = CURRENT_TIMESTAMP;'
-                                    + ' UPDATE {table.get_queryname()} SET tracking_id = ''{SERVER_ID}'' +  FORMAT( @now_datetime, ''yyyyMMddHHmmss'' ) + '
-                                    + ' RIGHT ( ''00'' + CAST( @nextvalue AS varchar(2) ), 2 ), last_updated = @now_datetime '
-                                    + ' WHERE { " AND ".join( [ f"{column} IN (SELECT {column} FROM @table_id)" for column in primary_key_column_names ] ) }'
-
-                                    + ' DELETE FROM @table_id;'
-                                    
-                                    + ' SET @offset = @offset + 1; '
-
-                                    + 'INSERT INTO @table_id SELECT { ', '.join( [ column.name for column in primary_key_columns ] ) } FROM inserted WHERE tracking_id IS NULL '
-                                    + ' ORDER BY { ', '.join( [ column.name for column in primary_key_columns ] ) } OFFSET @offset ROWS ' 
-                                    + ' FETCH NEXT 1 ROWS ONLY; '
-                                
-                                    + ' SET @nextvalue = next value for { sequence_name }; '
-                                + ' END'
-
+                                + ' UPDATE t SET tracking_id = { tracking_id_expression }, last_updated = CURRENT_TIMESTAMP ' -- a single update numbers all the inserted rows
+                                + ' FROM {table.get_queryname()} t INNER JOIN inserted i ON { " AND ".join( [ f"t.{column} = i.{column}" for column in primary_key_column_names ] ) } '
+                                + ' WHERE t.tracking_id IS NULL; '
                         + ' END '
                         + ' ELSE ' -- deletion
                         + ' BEGIN '
                                 + 'IF EXISTS (SELECT DISTINCT { ', '.join( primary_key_columns ) if not tracking_id_exists else 'tracking_id' } FROM DELETED) '
                                 + 'BEGIN '
-                                    + ' DECLARE @table_tracking_id { ' INT ' if not tracking_id_exists else ' VARCHAR(21) ' }; '
+                                    + ' DECLARE @table_tracking_id { ' INT ' if not tracking_id_exists else f' VARCHAR({ len(SERVER_ID) + 16 }) ' }; '
                                     + ' SELECT @table_tracking_id = min({ ', '.join( primary_key_columns ) if not tracking_id_exists else 'tracking_id' }) FROM deleted; '
                                     + ' WHILE @table_tracking_id IS NOT NULL '
                                     + ' BEGIN '
@@ -1085,6 +1553,7 @@ def insert_update_delete_trigger_query(
     elif is_postgres_db:
         def get_trigger_function_query(function_name: str):
             tracking_id_column = 'tracking_id'
+            tracking_id_expression = get_tracking_id_expression(f"nextval('{sequence_name}')", TRIGGER_TRACKING_ID_PREFIX, is_postgres_db=True)
             print("Creating trigger for postgres db")
             return f"""
                 CREATE OR REPLACE FUNCTION {function_name}() 
@@ -1106,8 +1575,8 @@ def insert_update_delete_trigger_query(
                     ELSIF (TG_OP = 'INSERT') THEN 
                         IF NEW.tracking_id IS NULL THEN 
                             BEGIN
-                                UPDATE {table.get_queryname()} SET tracking_id = '{SERVER_ID}' || TO_CHAR( now(), 'YYYYMMDDHH24MISS' ) 
-                                || LPAD( CAST(nextval('{sequence_name}') AS VARCHAR), 2, '0' ), last_updated=CURRENT_TIMESTAMP  
+                                UPDATE {table.get_queryname()} SET tracking_id = {tracking_id_expression}, 
+                                last_updated=CURRENT_TIMESTAMP  
                                 { " WHERE " if len(primary_key_column_names) else " " }{ " AND ".join( [ f"{column}=NEW.{column}" for column in primary_key_column_names ] ) };
                             END;
                         END IF;
@@ -1143,6 +1612,15 @@ def insert_update_delete_trigger_query(
         raise NotSupported
 
 
+def drop_trigger_query( table, trigger_name, is_postgres_db=False, is_sqlserver_db=False, is_mysql_db=False ):
+    if is_sqlserver_db:
+        return f"""
+        IF OBJECT_ID('{table.schema.name}.{trigger_name}', 'TR') IS NOT NULL 
+            DROP TRIGGER {table.schema.name}.{trigger_name}
+        """
+    if is_postgres_db:
+        return f"DROP TRIGGER IF EXISTS {trigger_name} ON {table.get_queryname()}"
+
 def create_deletion_table_query( table, is_postgres_db=False, is_sqlserver_db=False, is_mysql_db=False ):
     if is_sqlserver_db:
         return f"""
@@ -1157,7 +1635,7 @@ def create_deletion_table_query( table, is_postgres_db=False, is_sqlserver_db=Fa
         row_tracking_id VARCHAR( { len(SERVER_ID) + 16 } ))
         """
 
-def refresh_table( connection, table ):
+def refresh_table( connection, table, refresh_foreign_keys=True ):
     if connection:
         cursor = connection.cursor()
 
@@ -1244,12 +1722,17 @@ def refresh_table( connection, table ):
                             if foreign_key_regex.search(constraint):
                                 ferdolt_models.ColumnConstraint.objects.create(column=column_record, is_foreign_key=True)
 
-                    get_table_foreign_key_references(table, connection=connection)
                 except Exception as e:
                     logging.error(f"Error occured: {str(e)}")
                     print(f"Error occured: {str(e)}")
                     raise e
 
+            # the foreign keys of the table are read once all its columns are registered.
+            # Callers refreshing many tables refresh the foreign keys of the database once they are all refreshed
+            if refresh_foreign_keys:
+                get_table_foreign_key_references(table, connection=connection)
+                set_database_table_levels(table.schema.database)
+
 def initialize_database( database_record ):
     logging.debug(f"Initializing database {database_record.__str__()}")
     print(f"Initializing database {database_record.__str__()}")
@@ -1293,7 +1776,7 @@ def initialize_database( database_record ):
                             logging.info(f"Creating the tracking_id sequence in the {database_record.__str__()} database")
                             print(f"Creating the tracking_id sequence in the {database_record.__str__()} database")
 
-                            sequence_name = f"{table.schema.name.lower()}_{table.name.lower()}_tracking_id_sequence"
+                            sequence_name = get_tracking_id_sequence_name(table)
 
                             # create sequence
                             sequence_query = create_sequence_query(f"{sequence_name}", **dbms_booleans)
@@ -1303,64 +1786,15 @@ def initialize_database( database_record ):
                             logging.info(f"Setting the tracking_id where null in the {table.get_queryname()} in the {database_record.__str__()} database")
                             print(f"Setting the tracking_id where null in the {table.get_queryname()} in the {database_record.__str__()} database")
 
-                            results = cursor.execute(f"SELECT COUNT(*) FROM {table.get_queryname()}").fetchone()
-
-                            number_of_rows = results[0]
-                            batch_size = 99
-
-                            number_of_iterations, remainder = divmod(number_of_rows, batch_size)
-
-                            number_of_iterations += 0 if remainder == 0 else 1
-
-                            query = set_tracking_id_where_null_query(
-                                table.name, table.schema.name, 
-                                primary_key_columns.first().name, server_id=server_id, 
-                                sequence_name=f"{table.schema.name.lower()}_{table.name.lower()}_tracking_id_sequence", 
-                                **dbms_booleans, batch_size=batch_size 
-                            )
-
-                            if dbms_booleans['is_sqlserver_db']:
-                                number_of_iterations = 1
-
-                            if dbms_booleans['is_postgres_db']:
-                                # create the function to populate the tracking_id
-                                try:
-                                    procedure_name = f"set_{table.schema.name}_{table.name}_tracking_id_where_null"
-                                    procedure_query = get_set_tracking_id_where_null_query(table.name, table.schema.name, primary_key_columns, sequence_name=sequence_name, server_id=SERVER_ID, **dbms_booleans)
-                                    cursor.execute(procedure_query)
-
-                                    for i in range(number_of_iterations):
-                                        try:
-                                            date_time_string = dt.datetime.now().strftime('%Y%m%d%H%M%S')
-                                            call_procedure_query = f"call {procedure_name}({batch_size}, '{date_time_string}')"
-                                            cursor.execute(call_procedure_query)
-                                            time.sleep(2)
-                                        except (psycopg.ProgrammingError, pyodbc.ProgrammingError) as e:
-                                            logging.error(f"Error calling the {procedure_name} procedure")
-                                            logging.error(f"{call_procedure_query}")
-                                            connection.rollback()
-                                            successful_flag = False
-                                            raise e
-                                
-                                except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                    logging.error(f"Error creating the procedure to populate the tracking_id column")
-                                    logging.error(f"Query to create the procedure: {procedure_query}")
-                                    connection.rollback()
-                                    successful_flag = False
-                                    raise e
-
-                            else:
-                                # setting the tracking_id where null in batches to avoid integrity errors due to duplicate tracking_ids
-                                try:
-                                    # set the tracking_id where it is null
-                                    cursor.execute( query )
-                                    logging.info("tracking_id column populated successfully")
-                                except ( pyodbc.ProgrammingError, psycopg.ProgrammingError ) as e:
-                                    logging.error(f"Error setting tracking_id where null in the {table.get_queryname()} table in the {database_record.name.lower()} database. Error: {str(e)}")
-                                    logging.error(f"Query to set the tracking_id where null: {sequence_query}")
-                                    success_flag = False
-                                    connection.rollback()
-                                    raise e
+                            # the existing rows are given their ids by a few set-based updates instead of row by row
+                            try:
+                                backfill_tracking_ids(connection, cursor, table, primary_key_columns, dbms_booleans)
+                                logging.info("tracking_id column populated successfully")
+                            except ( pyodbc.ProgrammingError, psycopg.ProgrammingError ) as e:
+                                logging.error(f"Error setting tracking_id where null in the {table.get_queryname()} table in the {database_record.name.lower()} database. Error: {str(e)}")
+                                success_flag = False
+                                connection.rollback()
+                                raise e
 
                         except ( pyodbc.ProgrammingError, psycopg.ProgrammingError ) as e:
                             logging.error(f"Error creating tracking_id_sequence. Error: {e}")
@@ -1393,66 +1827,18 @@ def initialize_database( database_record ):
                             logging.info(f"Creating the tracking_id sequence in the {database_record.__str__()} database")
                             print(f"Creating the tracking_id sequence in the {database_record.__str__()} database")
 
-                            create_sequence_query_string = create_sequence_query(f"{table.schema.name.lower()}_{table.name.lower()}_tracking_id_sequence", **dbms_booleans)
+                            create_sequence_query_string = create_sequence_query(get_tracking_id_sequence_name(table), **dbms_booleans)
 
                             cursor.execute( create_sequence_query_string )
                             
-                            sequence_name = f"{table.schema.name.lower()}_{table.name.lower()}_tracking_id_sequence"
-
-                            set_tracking_id_where_null_query_string = set_tracking_id_where_null_query_multiple_primary_keys(
-                                table, primary_key_columns, server_id, 
-                                sequence_name=sequence_name, **dbms_booleans
-                            )
-
                             try:
                                 logging.info(f"Setting the tracking_id where null in the {table.get_queryname()} table (with composite PKs) in the {database_record.__str__()} database")
                                 print(f"Setting the tracking_id where null in the {table.get_queryname()} table (with composite PKs) in the {database_record.__str__()} database")
 
-                                logging.info(f"Query to set the tracking_id where null: {set_tracking_id_where_null_query_string}")
-
-                                if not dbms_booleans['is_postgres_db']:
-                                    cursor.execute( set_tracking_id_where_null_query_string )
-                                else:
-                                    procedure_query = get_set_tracking_id_where_null_query(
-                                        table.name, table.schema.name, primary_key_columns, 
-                                        sequence_name, SERVER_ID, **dbms_booleans
-                                    )
-
-                                    try:
-                                        cursor.execute(procedure_query)
-                                        
-                                        # get the number of rows in the table
-                                        query = f"SELECT COUNT(*) FROM {table.get_queryname()}"
-                                        number_of_rows = cursor.execute(query).fetchone()[0]
-                                        batch_size = 99
-
-                                        number_of_iterations, remainder = divmod(number_of_rows, batch_size)
-
-                                        number_of_iterations += 0 if remainder == 0 else 1
-
-                                        for i in range( number_of_iterations ):
-                                            try:
-                                                date_time_string = dt.datetime.now().strftime('%Y%m%d%H%M%S')
-                                                call_procedure_query = f"call {procedure_name}({batch_size}, '{date_time_string}')"
-                                                cursor.execute(call_procedure_query)
-                                                time.sleep(2)
-                                            except (psycopg.ProgrammingError, pyodbc.ProgrammingError) as e:
-                                                logging.error(f"Error calling the {procedure_name} procedure")
-                                                logging.error(f"{call_procedure_query}")
-                                                connection.rollback()
-                                                successful_flag = False
-                                                raise e
-
-                                    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                        logging.error(f"Error creating the procedure to set the tracking_id where null")
-                                        logging.error(f"Query to create the procedure: {procedure_query}")
-                                        success_flag = False
-                                        connection.rollback()
-                                        raise e
+                                backfill_tracking_ids(connection, cursor, table, primary_key_columns, dbms_booleans)
 
                             except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
                                 logging.error(f"Error setting the values of the tracking_id column in the {table.get_queryname()} table in the {database_record.name.lower()} database. Error: {str(e)}")
-                                logging.error(f"Query to set the values of the tracking_id column: {set_tracking_id_where_null_query_string}")
                                 success_flag = False
                                 connection.rollback()
                                 raise e
@@ -1505,7 +1891,7 @@ def initialize_database( database_record ):
 
                     cursor.execute( create_deletion_table_query(table, **dbms_booleans) )
 
-                    query = insert_update_delete_trigger_query(table, f"{table.schema.name}_{table.name}_insert_update_delete_trigger", f"{table.schema.name}_{table.name}_tracking_id_sequence", primary_key_columns, **dbms_booleans)
+                    query = insert_update_delete_trigger_query(table, f"{table.schema.name}_{table.name}_insert_update_delete_trigger", get_tracking_id_sequence_name(table), primary_key_columns, **dbms_booleans)
 
                     logging.info(f"Creating the insert, update and delete trigger for the {table.__str__()} table in the {database_record.__str__()} database")
                     logging.info(f"Running query: {query}")
@@ -1525,7 +1911,7 @@ def initialize_database( database_record ):
                         
                         logging.info("Refreshing the deletion table to get the different columns")
                         print("Refreshing the deletion table to get the different columns")
-                        refresh_table( connection, deletion_table )
+                        refresh_table( connection, deletion_table, refresh_foreign_keys=False )
 
                         logging.info("Successfully recorded and refreshed the deletion table. Commiting changes to the target database.")
                         connection.commit()
@@ -1593,7 +1979,10 @@ def initialize_database( database_record ):
             database_record.save()
 
             add_and_populate_foreign_tracking_id_columns(database_record)
-            refresh_table(connection, table)
+            refresh_table(connection, table, refresh_foreign_keys=False)
+
+            # the foreign keys of all the tables are read with one query
+            refresh_foreign_key_references(database_record, connection)
 
     except InvalidDatabaseConnectionParameters as e:
         print(f"Error connectiing to the database. Error {str(e)}")
@@ -1615,9 +2004,20 @@ def replace_triggers( database_record ):
             tracking_id_exists = False
             primary_key_columns = table.column_set.filter(columnconstraint__is_primary_key=True).distinct()
 
+            trigger_name = f"{table.schema.name}_{table.name}_insert_update_delete_trigger"
+
             # create and record the deletion table in the local dbms
             try:
-                query = insert_update_delete_trigger_query(table, f"{table.schema.name}_{table.name}_insert_update_delete_trigger", f"{table.schema.name}_{table.name}_tracking_id_sequence", primary_key_columns, **dbms_booleans)
+                # triggers created before the tracking_ids were numbered by a bigint sequence get the new sequence, 
+                # the ids they already set are kept as they can't collide with the new ones
+                if primary_key_columns.exists():
+                    cursor.execute( create_sequence_query(get_tracking_id_sequence_name(table), **dbms_booleans) )
+
+                if dbms_booleans['is_sqlserver_db']:
+                    # sql server triggers are only created if they don't exist
+                    cursor.execute( drop_trigger_query(table, trigger_name, **dbms_booleans) )
+
+                query = insert_update_delete_trigger_query(table, trigger_name, get_tracking_id_sequence_name(table), primary_key_columns, **dbms_booleans)
 
                 logging.info(f"Creating the insert, update and delete trigger for the {table.__str__()} table in the {database_record.__str__()} database")
                 logging.info(f"Running query: {query}")
@@ -1662,73 +2062,18 @@ def populate_tracking_id_column(database_record):
     if connection:
         cursor = connection.cursor()
 
-        for table in ferdolt_models.Table.objects.filter( schema__database=database_record ):
+        for table in ferdolt_models.Table.objects.filter( Q(schema__database=database_record) & ~Q(name__icontains='_deletion') ):
             primary_key_columns = table.column_set.filter(columnconstraint__is_primary_key=True).distinct()
-            sequence_name = f"{table.schema.name.lower()}_{table.name.lower()}_tracking_id_sequence"
-
-            try:
-                if dbms_booleans['is_postgres_db']:
-                    print(f"Populating the tracking_id column of the {table.get_queryname()} table in a postgres db")
-                    batch_size = 98
-                    results = cursor.execute(f"SELECT COUNT(*) FROM {table.get_queryname()}").fetchone()
-                    number_of_rows = results[0]
-
-                    number_of_iterations, remainder = divmod( number_of_rows, batch_size )
 
-                    number_of_iterations += 0 if remainder == 0 else 1
-
-                    procedure_name = f"set_{table.schema.name}_{table.name}_tracking_id_where_null"
-                    
-                    procedure_query = get_set_tracking_id_where_null_query(
-                        table.name, table.schema.name, 
-                        primary_key_columns, sequence_name=sequence_name, 
-                        server_id=SERVER_ID, **dbms_booleans
-                    )
-                    try:
-                        cursor.execute(procedure_query)
+            if not primary_key_columns.exists():
+                continue
 
-                        for i in range(number_of_iterations):
-                            print(f"Batch {i+1} of {number_of_iterations}")
-                            # populating in batches of batch_size in order to avoid unique key constraints
-                            try:
-                                date_time_string = dt.datetime.now().strftime('%Y%m%d%H%M%S')
-                                call_procedure_query = f"call {procedure_name}({batch_size}, '{date_time_string}')"
-                                cursor.execute(call_procedure_query)
-                                time.sleep(2)
-                            except (psycopg.ProgrammingError, pyodbc.ProgrammingError) as e:
-                                logging.error(f"Error calling the {procedure_name} procedure")
-                                logging.error(f"{call_procedure_query}")
-                                connection.rollback()
-                                successful_flag = False
-                                raise e
-
-                    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                        logging.error(f"Error altering/creating the {procedure_name} procedure for the {table.get_queryname()} table in the {database_record.name.lower()} database. Error: {str(e)}")
-                        logging.error(f"Query to alter/create the procedure: {procedure_name}")
-                        success_flag = False
-                        connection.rollback()
-                        raise e
-
-                elif dbms_booleans['is_sqlserver_db']:
-                    query = None
-                    if primary_key_columns.count() == 1:
-                        query = set_tracking_id_where_null_query(
-                            table.name, table.schema.name, 
-                            primary_key_column=primary_key_columns.first(), sequence_name=sequence_name, 
-                            server_id=SERVER_ID, **dbms_booleans
-                        )
-                    else:
-                        query = set_tracking_id_where_null_query_multiple_primary_keys(
-                            table, primary_key_columns, server_id, 
-                            sequence_name=sequence_name, **dbms_booleans
-                        )
-
-                    if query:
-                        cursor.execute(query)
+            try:
+                print(f"Populating the tracking_id column of the {table.get_queryname()} table")
+                backfill_tracking_ids(connection, cursor, table, primary_key_columns, dbms_booleans)
 
             except ( pyodbc.ProgrammingError, psycopg.ProgrammingError ) as e:
-                logging.error(f"Error adding tracking_id column to the {table.get_queryname()} table in the {database_record.name.lower()} database. Error: {str(e)}")
-                logging.error(f"Query to add the tracking_id column: {query}")
+                logging.error(f"Error populating the tracking_id column of the {table.get_queryname()} table in the {database_record.name.lower()} database. Error: {str(e)}")
                 success_flag = False
                 connection.rollback()
                 raise e
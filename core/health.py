@@ -0,0 +1,87 @@
+"""
+Health of the connections to the databases registered in ferdolt.
+
+Each database has a circuit breaker kept in the cache (see CACHES in the settings), so that it is shared by the web and huey processes.
+After DATABASE_CIRCUIT_FAILURE_THRESHOLD consecutive connection failures the circuit opens and no connection
+to the database is attempted for a cool-off period, doubling with each failure up to DATABASE_CIRCUIT_MAX_COOL_OFF seconds.
+Once the cool-off has elapsed a single caller is let through to probe the database, the circuit closes if it connects.
+"""
+import time
+
+from django.core.cache import cache
+
+from ferdolt_web import settings
+
+def get_health_key(database_id) -> str:
+    return f"core:database-health:{database_id}"
+
+def get_probe_key(database_id) -> str:
+    return f"core:database-health:{database_id}:probe"
+
+def get_database_health(database_id) -> dict:
+    """
+    Returns the cached health of a database: its consecutive connection failures, the time of the last attempt,
+    the time until which no connection is attempted and whether that time is still ahead
+    """
+    health = cache.get( get_health_key(database_id) ) or {}
+
+    health = {
+        "failures": health.get("failures", 0),
+        "last_attempt": health.get("last_attempt"),
+        "last_success": health.get("last_success"),
+        "open_until": health.get("open_until"),
+    }
+    health["is_open"] = bool( health["open_until"] and health["open_until"] > time.time() )
+
+    return health
+
+def is_circuit_open(database_id) -> bool:
+    return get_database_health(database_id)["is_open"]
+
+def get_cool_off(failures: int) -> int:
+    exponent = failures - settings.DATABASE_CIRCUIT_FAILURE_THRESHOLD
+
+    return min( settings.DATABASE_CIRCUIT_COOL_OFF * 2 ** max(exponent, 0), settings.DATABASE_CIRCUIT_MAX_COOL_OFF )
+
+def allow_connection_attempt(database_id) -> bool:
+    """
+    Returns False while the circuit of a database is open. After the cool-off only the first caller may try to connect,
+    the others are turned away until that attempt has been recorded
+    """
+    health = get_database_health(database_id)
+
+    if health["is_open"]:
+        return False
+
+    if health["failures"] < settings.DATABASE_CIRCUIT_FAILURE_THRESHOLD:
+        return True
+
+    # the probe key expires on its own in case the probing caller never records its attempt
+    return cache.add( get_probe_key(database_id), True, timeout=settings.DATABASE_CIRCUIT_COOL_OFF )
+
+def record_connection_success(database_id):
+    health = get_database_health(database_id)
+    now = time.time()
+
+    # a healthy database isn't written to the cache on every connection
+    if health["failures"] or not health["last_success"] or now - health["last_success"] > settings.DATABASE_CIRCUIT_COOL_OFF:
+        cache.set( get_health_key(database_id), { "failures": 0, "last_attempt": now, "last_success": now, "open_until": None }, timeout=None )
+
+    cache.delete( get_probe_key(database_id) )
+
+def record_connection_failure(database_id):
+    health = get_database_health(database_id)
+    now = time.time()
+
+    failures = health["failures"] + 1
+    open_until = now + get_cool_off(failures) if failures >= settings.DATABASE_CIRCUIT_FAILURE_THRESHOLD else None
+
+    cache.set(
+        get_health_key(database_id),
+        { "failures": failures, "last_attempt": now, "last_success": health["last_success"], "open_until": open_until },
+        timeout=None
+    )
+    cache.delete( get_probe_key(database_id) )
+
+def reset_database_health(database_id):
+    cache.delete_many( [ get_health_key(database_id), get_probe_key(database_id) ] )
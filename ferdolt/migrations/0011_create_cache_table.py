@@ -0,0 +1,17 @@
+from django.core.management import call_command
+from django.db import migrations
+
+def create_cache_table(apps, schema_editor):
+    # the circuit breakers of the databases and the extraction plans are kept in the cache shared by the web and huey processes,
+    # createcachetable only creates the tables of the database caches that don't exist yet
+    call_command("createcachetable", database=schema_editor.connection.alias)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ferdolt', '0010_historicalserver_host_server_host'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
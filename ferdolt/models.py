@@ -204,26 +204,24 @@ class Table(models.Model):
         return super().save(*args, **kwargs)
 
     def get_level(self):
-        referenced_tables = Table.objects.filter( 
-        id__in=ColumnConstraint.objects.filter( 
-            Q( references__isnull=False ) & Q( column__table=self ) & ~Q( references__table=self ) )
-            .values("references__table__id") 
-        )
-
-        level = 0
+        # the levels are computed for the whole database at once, see core.dependencies
+        from core.dependencies import compute_table_levels, get_foreign_key_edges
 
-        if not referenced_tables.exists():
-            return 0
-        else:
-            for referenced_table in referenced_tables:
-                level = max( level, referenced_table.get_level() )
+        database = self.schema.database
+        levels, _ = compute_table_levels( 
+            Table.objects.filter(schema__database=database).values_list("id", flat=True), get_foreign_key_edges(database) 
+        )
 
-        return level + 1
+        return levels[self.id]
 
     def set_level(self):
-        level = self.get_level()
-        self.level = level
-        self.save()
+        """
+        Sets the level of every table of the table's database, as a new foreign key can change the level of the tables referencing this one
+        """
+        from core.dependencies import set_database_table_levels
+
+        set_database_table_levels(self.schema.database)
+        self.refresh_from_db(fields=["level"])
 
     def get_queryname(self) -> str:
         """
@@ -288,6 +286,8 @@ class ColumnConstraint(models.Model):
         return string
 
     def save(self, *args, **kwargs):
-        # modify the level of the table if need be
-        self.column.table.set_level()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+        # modify the levels of the tables if need be
+        if self.references_id is not None:
+            self.column.table.set_level()
\ No newline at end of file
@@ -17,3 +17,11 @@ def initialize_database(database_id):
             database.is_initialized = True
             database.save()
 
+
+@task()
+def replace_triggers(database_id):
+    # moves the triggers of an initialized database to the current tracking_id scheme
+    database = models.Database.objects.filter(id=database_id).first()
+
+    if database:
+        core_functions.replace_triggers(database)
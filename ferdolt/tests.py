@@ -1,3 +1,680 @@
-from django.test import TestCase
-
-# Create your tests here.
+import asyncio
+from contextlib import contextmanager
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+import psycopg
+import pyodbc
+
+from core import asynchronous, health
+from core.connections import ConnectionPool
+from core.dependencies import compute_table_levels
+from core.functions import (
+    BACKFILLED_TRACKING_ID_PREFIX, SQLSERVER_INPUT_TYPES, backfill_tracking_ids, bulk_insert_rows, 
+    create_database_objects_records_from_structure_dictionary, get_database_sections, get_sqlserver_input_sizes
+)
+from ferdolt_web.settings import SERVER_ID
+
+from . import models, tasks
+
+class FakeReader:
+    """
+    The part of the interface of flux.archives' readers that the synchronization of databases uses
+    """
+    def __init__(self, keys, root_key=None):
+        self.keys = keys
+        self.root_key = root_key
+
+class DatabaseSectionsTestCase(SimpleTestCase):
+    def test_sections_of_a_single_database(self):
+        reader = FakeReader( [ ( "Source", "Public", "Product" ), ( "Source", "public", "category" ) ] )
+
+        # an extraction of a single database is applied whatever the name of the target database
+        self.assertEqual( get_database_sections(reader, "target"), {
+            ( "public", "product" ): ( "Source", "Public", "Product" ),
+            ( "public", "category" ): ( "Source", "public", "category" ),
+        } )
+
+    def test_sections_of_several_databases(self):
+        reader = FakeReader( [ ( "first", "dbo", "product" ), ( "second", "dbo", "product" ) ] )
+
+        self.assertEqual( get_database_sections(reader, "Second"), { ( "dbo", "product" ): ( "second", "dbo", "product" ) } )
+        self.assertIsNone( get_database_sections(reader, "third") )
+
+    def test_sections_under_a_root_key(self):
+        # legacy extractions of a single database have the database's name as their root key
+        reader = FakeReader( [ ( "public", "product" ) ], root_key="source" )
+
+        self.assertEqual( get_database_sections(reader, "source"), { ( "public", "product" ): ( "public", "product" ) } )
+
+class RecordingCursor:
+    """
+    A cursor of a driver without COPY or fast_executemany, recording the queries it runs
+    """
+    def __init__(self):
+        self.executemany_calls = []
+
+    def executemany(self, query, rows):
+        self.executemany_calls.append( ( query, list(rows) ) )
+
+class BulkInsertRowsTestCase(SimpleTestCase):
+    def test_rows_are_inserted_in_batches(self):
+        cursor = RecordingCursor()
+        rows = [ ( position, f"name {position}" ) for position in range(7) ]
+
+        # the rows may be given as any iterable
+        bulk_insert_rows( cursor, "product_temporary_table", [ "id", "name" ], iter(rows), batch_size=3 )
+
+        self.assertEqual( [ batch for _, batch in cursor.executemany_calls ], [ rows[0:3], rows[3:6], rows[6:] ] )
+
+        query = cursor.executemany_calls[0][0]
+        self.assertIn( "INSERT INTO product_temporary_table ( id, name )", query )
+        self.assertIn( "VALUES ( %s, %s )", query )
+
+    def test_no_rows(self):
+        cursor = RecordingCursor()
+
+        bulk_insert_rows( cursor, "product_temporary_table", [ "id" ], [], batch_size=3 )
+
+        self.assertEqual( cursor.executemany_calls, [] )
+
+class CopyCursor(RecordingCursor):
+    """
+    A psycopg cursor whose COPY fails if copy_error is set
+    """
+    def __init__(self, copy_error=None):
+        super().__init__()
+        self.copy_error = copy_error
+        self.copies = []
+        # the cursor stands for its connection, whose transaction() opens a savepoint
+        self.connection = self
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    @contextmanager
+    def copy(self, query):
+        rows = []
+        yield SimpleNamespace( write_row=rows.append )
+
+        if self.copy_error:
+            raise self.copy_error
+
+        self.copies.append( ( query, rows ) )
+
+class FastExecutemanyCursor(RecordingCursor):
+    """
+    A pyodbc cursor recording the input sizes and the fast_executemany flag each executemany call was made with
+    """
+    def __init__(self):
+        super().__init__()
+        self.fast_executemany = False
+        self.input_sizes = None
+        self.calls_settings = []
+
+    def setinputsizes(self, input_sizes):
+        self.input_sizes = input_sizes
+
+    def executemany(self, query, rows):
+        self.calls_settings.append( ( self.fast_executemany, self.input_sizes ) )
+        super().executemany(query, rows)
+
+class BulkLoadingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.rows = [ ( position, f"name {position}" ) for position in range(5) ]
+
+    def test_postgres_rows_are_copied(self):
+        cursor = CopyCursor()
+
+        with mock.patch.object(psycopg, "Cursor", CopyCursor):
+            bulk_insert_rows( cursor, "product_temporary_table", [ "id", "name" ], iter(self.rows) )
+
+        self.assertEqual( cursor.copies, [ ( "COPY product_temporary_table ( id, name ) FROM STDIN", self.rows ) ] )
+        self.assertEqual( cursor.executemany_calls, [] )
+
+    def test_failed_copy_falls_back_to_inserts(self):
+        cursor = CopyCursor( copy_error=psycopg.Error("invalid input syntax") )
+
+        with mock.patch.object(psycopg, "Cursor", CopyCursor):
+            # the rows of an iterator can still be inserted once the copy has read them
+            bulk_insert_rows( cursor, "product_temporary_table", [ "id", "name" ], iter(self.rows), batch_size=3 )
+
+        self.assertEqual( cursor.copies, [] )
+        self.assertEqual( [ rows for _, rows in cursor.executemany_calls ], [ self.rows[:3], self.rows[3:] ] )
+        self.assertIn( "VALUES ( %s, %s )", cursor.executemany_calls[0][0] )
+
+    def test_sqlserver_rows_are_sent_with_fast_executemany(self):
+        cursor = FastExecutemanyCursor()
+        input_sizes = get_sqlserver_input_sizes( [ 
+            { 'data_type': 'int', 'character_maximum_length': None, 'numeric_precision': 10, 'datetime_precision': None },
+            { 'data_type': 'nvarchar', 'character_maximum_length': 50, 'numeric_precision': None, 'datetime_precision': None },
+        ] )
+
+        with mock.patch.object(pyodbc, "Cursor", FastExecutemanyCursor):
+            bulk_insert_rows( cursor, "#product_temporary_table", [ "id", "name" ], self.rows, input_sizes=input_sizes, batch_size=3 )
+
+        self.assertEqual( [ rows for _, rows in cursor.executemany_calls ], [ self.rows[:3], self.rows[3:] ] )
+        self.assertEqual( cursor.calls_settings, [ ( True, input_sizes ) ] * 2 )
+        self.assertIn( "VALUES ( ?, ? )", cursor.executemany_calls[0][0] )
+
+        # the cursor is left as it was for the queries that follow
+        self.assertFalse( cursor.fast_executemany )
+        self.assertIsNone( cursor.input_sizes )
+
+    def test_sqlserver_input_sizes(self):
+        input_sizes = get_sqlserver_input_sizes( [
+            { 'data_type': 'varchar', 'character_maximum_length': -1, 'numeric_precision': None, 'datetime_precision': None },
+            { 'data_type': 'decimal', 'character_maximum_length': None, 'numeric_precision': 12, 'datetime_precision': None },
+            { 'data_type': 'datetime2', 'character_maximum_length': None, 'numeric_precision': None, 'datetime_precision': 7 },
+            { 'data_type': 'geography', 'character_maximum_length': None, 'numeric_precision': None, 'datetime_precision': None },
+            None,
+        ] )
+
+        self.assertEqual( input_sizes, [
+            # (max) columns are sent with a size of 0
+            ( SQLSERVER_INPUT_TYPES['varchar'][0], 0, 0 ),
+            ( SQLSERVER_INPUT_TYPES['decimal'][0], 12, 0 ),
+            ( SQLSERVER_INPUT_TYPES['datetime2'][0], 27, 7 ),
+            None,
+            None,
+        ] )
+
+class TableLevelsTestCase(SimpleTestCase):
+    def test_chain(self):
+        # 1 references 2, which references 3
+        levels, cycles = compute_table_levels( [ 1, 2, 3, 4 ], { 1: { 2 }, 2: { 3 } } )
+
+        self.assertEqual( levels, { 1: 2, 2: 1, 3: 0, 4: 0 } )
+        self.assertEqual( cycles, [] )
+
+    def test_table_referencing_several_tables(self):
+        levels, _ = compute_table_levels( [ 1, 2, 3, 4 ], { 1: { 2, 4 }, 2: { 3 } } )
+
+        self.assertEqual( levels, { 1: 2, 2: 1, 3: 0, 4: 0 } )
+
+    def test_cycle(self):
+        # 1 and 2 reference each other, 3 references the cycle and the cycle references 4
+        levels, cycles = compute_table_levels( [ 1, 2, 3, 4 ], { 1: { 2 }, 2: { 1, 4 }, 3: { 1 } } )
+
+        self.assertEqual( levels, { 1: 1, 2: 1, 3: 2, 4: 0 } )
+        self.assertEqual( [ sorted(cycle) for cycle in cycles ], [ [ 1, 2 ] ] )
+
+    def test_long_chain(self):
+        # the components are found without recursion
+        table_ids = list( range(5000) )
+        levels, _ = compute_table_levels( table_ids, { table_id: { table_id + 1 } for table_id in table_ids[:-1] } )
+
+        self.assertEqual( levels[0], 4999 )
+        self.assertEqual( levels[4999], 0 )
+
+class BackfillCursor:
+    """
+    A cursor over a table whose rows without a tracking_id are given one by each UPDATE, at most chunk_size rows at a time
+    """
+    def __init__(self, rows_without_id, chunk_size, last_tracking_id=None):
+        self.rows_without_id = rows_without_id
+        self.chunk_size = chunk_size
+        self.last_tracking_id = last_tracking_id
+        self.queries = []
+        self.rowcount = -1
+        self.result = None
+
+    def execute(self, query):
+        self.queries.append(query)
+
+        if "COUNT(*)" in query:
+            self.result = ( self.rows_without_id, )
+        elif "MAX(" in query:
+            self.result = ( self.last_tracking_id, )
+        elif "UPDATE" in query:
+            self.rowcount = min(self.chunk_size, self.rows_without_id)
+            self.rows_without_id -= self.rowcount
+
+    def fetchone(self):
+        return self.result
+
+class BackfillTrackingIdsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.connection = SimpleNamespace( commits=0 )
+        self.connection.commit = lambda: setattr( self.connection, "commits", self.connection.commits + 1 )
+
+        self.table = SimpleNamespace( get_queryname=lambda: "public.product" )
+        self.primary_key_columns = [ SimpleNamespace(name="id") ]
+        self.dbms_booleans = { "is_postgres_db": True, "is_sqlserver_db": False, "is_mysql_db": False }
+
+    def get_update_queries(self, cursor):
+        return [ query for query in cursor.queries if "UPDATE" in query ]
+
+    def test_rows_are_updated_chunk_by_chunk(self):
+        cursor = BackfillCursor(250, 100)
+        progress = []
+
+        updated = backfill_tracking_ids(
+            self.connection, cursor, self.table, self.primary_key_columns, self.dbms_booleans, 
+            chunk_size=100, on_progress=lambda done, total: progress.append( ( done, total ) )
+        )
+
+        self.assertEqual( updated, 250 )
+        self.assertEqual( progress, [ ( 100, 250 ), ( 200, 250 ), ( 250, 250 ) ] )
+        self.assertEqual( self.connection.commits, 3 )
+
+        # every chunk numbers its rows after the ones of the previous chunk
+        queries = self.get_update_queries(cursor)
+        self.assertEqual( len(queries), 3 )
+
+        for query, offset in zip( queries, [ 0, 100, 200 ] ):
+            self.assertIn( f"{offset} + numbered_rows.row_position", query )
+            self.assertIn( "LIMIT 100", query )
+
+    def test_previous_backfill_is_continued(self):
+        cursor = BackfillCursor( 10, 100, last_tracking_id=f"{SERVER_ID}{BACKFILLED_TRACKING_ID_PREFIX}{'42'.zfill(15)}" )
+
+        self.assertEqual( backfill_tracking_ids(self.connection, cursor, self.table, self.primary_key_columns, self.dbms_booleans, chunk_size=100), 10 )
+        self.assertIn( "42 + numbered_rows.row_position", self.get_update_queries(cursor)[0] )
+
+    def test_rows_updated_by_another_session(self):
+        cursor = BackfillCursor(250, 100)
+        cursor.chunk_size = 0
+
+        # the rows counted were given a tracking_id since, the backfill stops instead of looping
+        self.assertEqual( backfill_tracking_ids(self.connection, cursor, self.table, self.primary_key_columns, self.dbms_booleans, chunk_size=100), 0 )
+        self.assertEqual( len( self.get_update_queries(cursor) ), 1 )
+
+def create_database(**kwargs):
+    # the database management systems are created by the migrations
+    dbms = models.DatabaseManagementSystem.objects.get(codename="postgres")
+    dbms_version = models.DatabaseManagementSystemVersion.objects.get_or_create(dbms=dbms, version_number="14.0")[0]
+
+    return models.Database.objects.create(dbms_version=dbms_version, name="source", username="user", password="password", port="5432", **kwargs)
+
+class DatabaseStructureRecordsTestCase(TestCase):
+    def setUp(self):
+        self.database = create_database()
+
+    def get_structure_dictionary(self):
+        column_dictionary = {
+            'data_type': 'integer', 'character_maximum_length': None, 'datetime_precision': None, 'numeric_precision': 32, 
+            'constraint_type': set( [ 'PRIMARY KEY' ] ), 'is_nullable': False
+        }
+
+        return { "public": { "Product": { "ProductId": column_dictionary } } }
+
+    def test_mixed_case_column_introspected_twice(self):
+        for _ in range(2):
+            create_database_objects_records_from_structure_dictionary( self.database, self.get_structure_dictionary() )
+
+        columns = models.Column.objects.filter(table__schema__database=self.database)
+
+        # the column keeps the case of its name and is found again on the next introspection
+        self.assertEqual( [ column.name for column in columns ], [ "ProductId" ] )
+        self.assertEqual( models.ColumnConstraint.objects.filter(column__in=columns, is_primary_key=True).count(), 1 )
+
+class ReplaceTriggersTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate( get_user_model().objects.create(username="staff", is_staff=True) )
+
+    @mock.patch.object(tasks, "replace_triggers")
+    def test_triggers_of_an_initialized_database_are_replaced(self, replace_triggers):
+        database = create_database(is_initialized=True)
+
+        response = self.client.post( reverse("databases-replace-triggers", args=[ database.id ]) )
+
+        self.assertEqual( response.status_code, 200 )
+        replace_triggers.assert_called_once_with(database.id)
+
+    @mock.patch.object(tasks, "replace_triggers")
+    def test_database_not_initialized(self, replace_triggers):
+        database = create_database()
+
+        response = self.client.post( reverse("databases-replace-triggers", args=[ database.id ]) )
+
+        self.assertEqual( response.status_code, 400 )
+        replace_triggers.assert_not_called()
+
+class FakeAsyncConnection:
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+        self.is_closed = False
+
+    async def close(self):
+        self.is_closed = True
+
+class BlockingCursor:
+    """
+    A cursor of a blocking driver, counting the calls running at the same time on its connection
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = [ ( "value", None ) ]
+
+    def execute(self, query, parameters=None):
+        with self.connection.lock:
+            self.connection.running += 1
+            self.connection.most_running = max(self.connection.most_running, self.connection.running)
+
+        time.sleep(0.01)
+
+        with self.connection.lock:
+            self.connection.running -= 1
+
+    def fetchall(self):
+        return [ ( 1, ) ]
+
+    def close(self):
+        pass
+
+class BlockingConnection:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+
+    def cursor(self):
+        return BlockingCursor(self)
+
+class AsyncConnectionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.database = SimpleNamespace( id=1, name="source", host="host", port="5432" )
+        self.failures, self.successes = [], []
+
+        for patcher in [
+            mock.patch.object(asynchronous, "get_dbms_booleans", return_value={ "is_postgres_db": True, "is_sqlserver_db": False, "is_mysql_db": False }),
+            mock.patch.object(asynchronous, "get_connection_parameters", return_value={ "password": "password" }),
+            mock.patch.object(asynchronous, "get_postgres_connection_string", return_value="dbname=source "),
+            mock.patch.object(asynchronous, "allow_connection_attempt", return_value=True),
+            mock.patch.object(asynchronous, "record_connection_failure", self.failures.append),
+            mock.patch.object(asynchronous, "record_connection_success", self.successes.append),
+            mock.patch.object(asynchronous.settings, "DATABASE_POOL_MAX_SIZE", 1),
+            mock.patch.object(asynchronous.settings, "DATABASE_POOL_BORROW_TIMEOUT", 0.01),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_slots_of_a_database(self):
+        slots = asynchronous.get_postgres_slots(self.database.id)
+
+        self.assertIs( asynchronous.get_postgres_slots(self.database.id), slots )
+        self.assertIsNot( asynchronous.get_postgres_slots(2), slots )
+
+        with mock.patch.object(asynchronous.settings, "DATABASE_POOL_MAX_SIZE", 0), mock.patch.object(asynchronous.settings, "GROUP_TASKS_ASYNC_CONCURRENCY", 3):
+            # without pools, as many connections as databases worked on at the same time
+            self.assertEqual( asynchronous.get_postgres_slots(3)._value, 3 )
+
+    async def test_slot_is_released_when_the_connection_fails(self):
+        connect = mock.AsyncMock( side_effect=psycopg.OperationalError("connection refused") )
+
+        with mock.patch.object(psycopg.AsyncConnection, "connect", connect):
+            self.assertIsNone( await asynchronous.connect(self.database) )
+
+        self.assertFalse( asynchronous.get_postgres_slots(self.database.id).locked() )
+        self.assertEqual( self.failures, [ self.database.id ] )
+        self.assertIn( "password=password", connect.call_args.args[0] )
+
+    async def test_slot_is_released_when_connecting_raises(self):
+        with mock.patch.object(psycopg.AsyncConnection, "connect", mock.AsyncMock( side_effect=ValueError("invalid connection string") )):
+            with self.assertRaises(ValueError):
+                await asynchronous.connect(self.database)
+
+        self.assertFalse( asynchronous.get_postgres_slots(self.database.id).locked() )
+
+    async def test_slot_is_held_until_the_connection_is_closed(self):
+        with mock.patch.object(psycopg.AsyncConnection, "connect", mock.AsyncMock( side_effect=FakeAsyncConnection )):
+            connection = await asynchronous.connect(self.database)
+
+            # the only slot of the database is taken, the next connection times out
+            self.assertIsNone( await asynchronous.connect(self.database) )
+
+            await connection.close()
+            await connection.close()
+
+            self.assertTrue( connection.connection.is_closed )
+            self.assertEqual( asynchronous.get_postgres_slots(self.database.id)._value, 1 )
+            self.assertEqual( self.successes, [ self.database.id ] )
+
+    async def test_open_circuit(self):
+        connect = mock.AsyncMock()
+
+        with mock.patch.object(asynchronous, "allow_connection_attempt", return_value=False), mock.patch.object(psycopg.AsyncConnection, "connect", connect):
+            self.assertIsNone( await asynchronous.connect(self.database) )
+
+        connect.assert_not_called()
+        self.assertFalse( asynchronous.get_postgres_slots(self.database.id).locked() )
+
+    async def test_threaded_connection_runs_one_call_at_a_time(self):
+        blocking_connection = BlockingConnection()
+        connection = asynchronous.ThreadedConnection( blocking_connection, self.database, {} )
+
+        results = await asyncio.gather( *[ connection.execute("SELECT 1") for _ in range(4) ] )
+
+        self.assertEqual( results, [ ( [ "value" ], [ ( 1, ) ] ) ] * 4 )
+        self.assertEqual( blocking_connection.most_running, 1 )
+
+@override_settings(CACHES={ "default": { "BACKEND": "django.core.cache.backends.locmem.LocMemCache" } })
+class CircuitBreakerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+
+        for patcher in [
+            mock.patch.object(health.time, "time", lambda: self.now),
+            mock.patch.object(health.settings, "DATABASE_CIRCUIT_FAILURE_THRESHOLD", 3),
+            mock.patch.object(health.settings, "DATABASE_CIRCUIT_COOL_OFF", 30),
+            mock.patch.object(health.settings, "DATABASE_CIRCUIT_MAX_COOL_OFF", 100),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        health.reset_database_health(1)
+
+    def record_failures(self, times=1):
+        for _ in range(times):
+            health.record_connection_failure(1)
+
+    def test_circuit_opens_after_the_threshold(self):
+        self.record_failures(2)
+
+        self.assertFalse( health.is_circuit_open(1) )
+        self.assertTrue( health.allow_connection_attempt(1) )
+
+        self.record_failures()
+
+        self.assertEqual( health.get_database_health(1)["open_until"], self.now + 30 )
+        self.assertTrue( health.is_circuit_open(1) )
+        self.assertFalse( health.allow_connection_attempt(1) )
+
+        # the other databases aren't affected
+        self.assertTrue( health.allow_connection_attempt(2) )
+
+    def test_cool_off_doubles_up_to_the_maximum(self):
+        self.assertEqual( [ health.get_cool_off(failures) for failures in range(1, 7) ], [ 30, 30, 30, 60, 100, 100 ] )
+
+    def test_a_single_probe_after_the_cool_off(self):
+        self.record_failures(3)
+        self.now += 31
+
+        # half open: the first caller probes the database, the others are turned away until its attempt is recorded
+        self.assertFalse( health.is_circuit_open(1) )
+        self.assertTrue( health.allow_connection_attempt(1) )
+        self.assertFalse( health.allow_connection_attempt(1) )
+
+        # the probe failed, the circuit opens again for twice as long
+        self.record_failures()
+
+        self.assertEqual( health.get_database_health(1)["open_until"], self.now + 60 )
+        self.assertFalse( health.allow_connection_attempt(1) )
+
+        self.now += 61
+
+        self.assertTrue( health.allow_connection_attempt(1) )
+
+        # the probe connected, the circuit closes
+        health.record_connection_success(1)
+
+        self.assertEqual( health.get_database_health(1)["failures"], 0 )
+        self.assertTrue( health.allow_connection_attempt(1) )
+        self.assertTrue( health.allow_connection_attempt(1) )
+
+    def test_success_resets_the_failures(self):
+        self.record_failures(2)
+        health.record_connection_success(1)
+        self.record_failures(2)
+
+        self.assertFalse( health.is_circuit_open(1) )
+
+    def test_reset(self):
+        self.record_failures(3)
+        health.reset_database_health(1)
+
+        self.assertEqual( health.get_database_health(1), { "failures": 0, "last_attempt": None, "last_success": None, "open_until": None, "is_open": False } )
+        self.assertTrue( health.allow_connection_attempt(1) )
+
+class PoolConnection:
+    """
+    A driver connection recording what the pool does with it
+    """
+    def __init__(self, is_healthy=True):
+        self.is_healthy = is_healthy
+        self.rollbacks = 0
+        self.is_closed = False
+
+    def cursor(self):
+        if not self.is_healthy:
+            raise psycopg.OperationalError("server closed the connection unexpectedly")
+
+        return mock.Mock()
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.is_closed = True
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.connections = []
+
+    def connect(self, database):
+        self.connections.append( PoolConnection() )
+
+        return self.connections[-1]
+
+    def test_connections_are_given_back_and_reused(self):
+        pool = ConnectionPool(self.connect, None, max_size=2)
+
+        with pool.borrow("database") as connection:
+            self.assertIs( connection.raw_connection, self.connections[0] )
+
+        # what the borrower didn't commit is rolled back when the connection is given back
+        self.assertEqual( self.connections[0].rollbacks, 1 )
+        self.assertEqual( ( pool.size, len(pool.idle) ), ( 1, 1 ) )
+
+        connection = pool.borrow("database")
+        connection.close()
+        connection.close()
+
+        self.assertEqual( len(self.connections), 1 )
+        self.assertEqual( ( pool.size, len(pool.idle) ), ( 1, 1 ) )
+
+    def test_unhealthy_connections_are_replaced(self):
+        pool = ConnectionPool(self.connect, None, max_size=1)
+        pool.borrow("database").close()
+
+        self.connections[0].is_healthy = False
+        connection = pool.borrow("database")
+
+        self.assertTrue( self.connections[0].is_closed )
+        self.assertIs( connection.raw_connection, self.connections[1] )
+        self.assertEqual( pool.size, 1 )
+
+    def test_discarded_connections_are_closed(self):
+        pool = ConnectionPool(self.connect, None, max_size=1)
+        pool.borrow("database").discard()
+
+        self.assertTrue( self.connections[0].is_closed )
+        self.assertEqual( ( pool.size, len(pool.idle) ), ( 0, 0 ) )
+
+    def test_borrow_times_out_when_every_connection_is_in_use(self):
+        pool = ConnectionPool(self.connect, None, max_size=1, borrow_timeout=0.05)
+        connection = pool.borrow("database")
+
+        start = time.monotonic()
+        self.assertIsNone( pool.borrow("database") )
+        self.assertGreaterEqual( time.monotonic() - start, 0.05 )
+
+        # a borrower waiting for a connection gets the one given back
+        threading.Timer(0.01, connection.close).start()
+        pool.borrow_timeout = 5
+
+        self.assertIs( pool.borrow("database").raw_connection, self.connections[0] )
+        self.assertEqual( len(self.connections), 1 )
+
+    def test_failed_connections_free_their_place(self):
+        pool = ConnectionPool(lambda database: None, None, max_size=1, borrow_timeout=0.01)
+
+        self.assertIsNone( pool.borrow("database") )
+        self.assertEqual( pool.size, 0 )
+
+    def test_idle_connections_are_closed_down_to_the_minimum(self):
+        pool = ConnectionPool(self.connect, None, min_size=1, max_size=3, idle_timeout=60)
+        connections = [ pool.borrow("database") for _ in range(3) ]
+
+        for connection in connections:
+            connection.close()
+
+        with mock.patch("core.connections.time.monotonic", return_value=time.monotonic() + 61):
+            pool.borrow("database").close()
+
+        # the two oldest were closed, the newest was lent again
+        self.assertEqual( [ connection.is_closed for connection in self.connections ], [ True, True, False ] )
+        self.assertEqual( pool.size, 1 )
+
+    def test_connections_given_back_to_a_closed_pool_are_closed(self):
+        pool = ConnectionPool(self.connect, None, max_size=2)
+        idle_connection, connection = pool.borrow("database"), pool.borrow("database")
+        idle_connection.close()
+
+        pool.close()
+        connection.close()
+
+        self.assertEqual( [ connection.is_closed for connection in self.connections ], [ True, True ] )
+        self.assertEqual( pool.size, 0 )
+
+class ThreadedPoolConnectionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.database = SimpleNamespace( id=1, name="source", host="host", port="1433" )
+        self.pool = ConnectionPool(lambda database: PoolConnection(), None, max_size=1, borrow_timeout=0.05)
+
+        for patcher in [
+            mock.patch.object(asynchronous, "get_dbms_booleans", return_value={ "is_postgres_db": False, "is_sqlserver_db": True, "is_mysql_db": False }),
+            mock.patch.object(asynchronous, "get_database_connection", self.pool.borrow),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_blocking_connections_are_borrowed_from_the_pool(self):
+        connection = await asynchronous.connect(self.database)
+
+        self.assertIsInstance( connection, asynchronous.ThreadedConnection )
+        self.assertEqual( ( self.pool.size, len(self.pool.idle) ), ( 1, 0 ) )
+
+        # the only connection of the pool is in use, the next one times out
+        self.assertIsNone( await asynchronous.connect(self.database) )
+
+        raw_connection = connection.connection.raw_connection
+        await connection.close()
+
+        # closing gives the connection back to the pool, the next coroutine gets it
+        self.assertEqual( ( self.pool.size, len(self.pool.idle) ), ( 1, 1 ) )
+        self.assertEqual( raw_connection.rollbacks, 1 )
+
+        next_connection = await asynchronous.connect(self.database)
+
+        self.assertIs( next_connection.connection.raw_connection, raw_connection )
+        await next_connection.close()
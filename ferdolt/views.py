@@ -1,14 +1,14 @@
 import json
-import zipfile
 from rest_framework import viewsets
 from rest_framework.decorators import action, permission_classes
 from rest_framework import permissions as drf_permissions
 from rest_framework.response import Response
 from rest_framework import status
 from common.permissions import IsStaff
-from core.exceptions import InvalidDatabaseConnectionParameters, InvalidDatabaseStructure
+from core.exceptions import CorruptExtractionArchive, InvalidDatabaseConnectionParameters, InvalidDatabaseStructure
 from rest_framework import serializers as drf_serializers
 
+import datetime as dt
 import logging
 import psycopg
 import pyodbc
@@ -23,10 +23,12 @@ from django.utils import timezone
 from common.viewsets import MultiplePermissionViewSet, MultipleSerializerViewSet
 from core.functions import (decrypt, encrypt, get_database_connection, get_database_details, 
                             get_dbms_booleans, initialize_database, synchronize_database)
+from core.health import get_database_health, reset_database_health
 from ferdolt import tasks
 from ferdolt_web.settings import FERNET_KEY
 
 from flux import models as flux_models
+from flux.archives import open_extraction_parts
 from flux.serializers import ExtractionSerializer
 from groups.models import GroupServer
 
@@ -140,6 +142,20 @@ class DatabaseViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
             return Response( data={'message': _("We could not connect to the %(database)s database. Please ensure that your server is running and your credentials are correct" % {'database': db.__str__()})} )
 
         return Response(data={'message': _("The %(database)s was initialized successfully." % {'database': db.__str__()})})
+
+    @action(
+        methods=["POST"], detail=True
+    )
+    def replace_triggers(self, request, *args, **kwargs):
+        # the triggers of databases initialized before the tracking_ids were numbered by a bigint sequence are replaced in the background
+        db: models.Database = self.get_object()
+
+        if not db.is_initialized:
+            return Response( data={'message': _("The %(database)s database has not been initialized" % {'database': db.__str__()})}, status=status.HTTP_400_BAD_REQUEST )
+
+        tasks.replace_triggers(db.id)
+
+        return Response( data={'message': _("The triggers of the %(database)s database are being replaced." % {'database': db.__str__()})} )
     
     @action(
         methods=["POST"], detail=True
@@ -148,7 +164,7 @@ class DatabaseViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
         f = fernet.Fernet(FERNET_KEY)
         database = self.get_object()
 
-        pending_synchronizations = flux_models.ExtractionTargetDatabase.objects.filter(database=database, is_applied=False).order_by('extraction__time_made')
+        pending_synchronizations = flux_models.ExtractionTargetDatabase.objects.filter(database=database, is_applied=False, extraction__is_complete=True).order_by('extraction__time_made')
 
         if not pending_synchronizations.exists():
             return Response(data={'message': _("The %(database_name)s database does not have any pending synchronization" % {'database_name': database.name})})
@@ -169,52 +185,46 @@ class DatabaseViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
                     print("Performing synchronization of a group extraction")
                     group = synchronization.extraction.groupextraction.group
 
-                    f = fernet.Fernet(group.fernet_key)
+                    f = fernet.Fernet(group.get_fernet_key())
 
                 try:
-                    with zipfile.ZipFile(file_path) as zip_file:
-                        for file in zip_file.namelist():
-                            if file.endswith('.json'):
-                                content = zip_file.read(file)
-                                if len(content) > 0:
-                                    content = f.decrypt( content.encode('utf-8') if not isinstance(content, bytes) else content ) 
-                                    content = content.decode('utf-8')
-
-                                    logging.debug("['In ferdolt.views.DatabaseViewSet.synchronize'] reading the unapplied synchronization")
-
-                                    try:
-                                        dictionary: dict = json.loads(content)
-                                        try:
-                                            synchronize_database(connection, database, dictionary, 
-                                            temporary_tables_created=temporary_tables_created)
-                                            time_applied = timezone.now()
-                                            synchronization.time_applied = time_applied
-                                            synchronization.is_applied = True
-
-                                            synchronization.save()
-                                            
-                                            synchronizations_applied.append(synchronization.extraction)
-                                        except ( pyodbc.ProgrammingError, psycopg.ProgrammingError ) as e:
-                                            logging.error(f"[In ferdolt.views.SynchronizationViewSet.synchronize]. Error synchronizing the database, error: {str(e)}")
-                                            unapplied_synchronizations.append({
-                                                'synchronization': ExtractionSerializer(synchronization.extraction).data,
-                                                "error": _("Couldn't apply the synchronization due to a server error")
-                                            })
-
-                                    except json.JSONDecodeError as e:
-                                        logging.error( f"[In ferdolt.views.SynchronizationViewSet.synchronize]. Error parsing json from file for database synchronization. File path: {file_path}" )
-                                        unapplied_synchronizations.append({
-                                            "synchronization": ExtractionSerializer(synchronization.extraction),
-                                            "error": _("Couldn't decode json file")
-                                        })
-                                else:
+                    with open_extraction_parts(synchronization.extraction.get_file_paths(), f, cache_keys=synchronization.extraction.get_file_hashes()) as reader:
+                        if not reader.is_empty:
+                            logging.debug("['In ferdolt.views.DatabaseViewSet.synchronize'] reading the unapplied synchronization")
+
+                            try:
+                                try:
+                                    # the sections of the extraction are read one chunk at a time
+                                    synchronize_database(connection, database, reader, 
+                                    temporary_tables_created=temporary_tables_created)
                                     time_applied = timezone.now()
-                                    
                                     synchronization.time_applied = time_applied
                                     synchronization.is_applied = True
-                                    synchronization.save()
 
+                                    synchronization.save()
+                                    
                                     synchronizations_applied.append(synchronization.extraction)
+                                except ( pyodbc.ProgrammingError, psycopg.ProgrammingError ) as e:
+                                    logging.error(f"[In ferdolt.views.SynchronizationViewSet.synchronize]. Error synchronizing the database, error: {str(e)}")
+                                    unapplied_synchronizations.append({
+                                        'synchronization': ExtractionSerializer(synchronization.extraction).data,
+                                        "error": _("Couldn't apply the synchronization due to a server error")
+                                    })
+
+                            except json.JSONDecodeError as e:
+                                logging.error( f"[In ferdolt.views.SynchronizationViewSet.synchronize]. Error parsing json from file for database synchronization. File path: {file_path}" )
+                                unapplied_synchronizations.append({
+                                    "synchronization": ExtractionSerializer(synchronization.extraction),
+                                    "error": _("Couldn't decode json file")
+                                })
+                        else:
+                            time_applied = timezone.now()
+                            
+                            synchronization.time_applied = time_applied
+                            synchronization.is_applied = True
+                            synchronization.save()
+
+                            synchronizations_applied.append(synchronization.extraction)
 
                 except FileNotFoundError as e:
                     logging.error(f"['In ferdolt.views.DatabaseViewSet.synchronize'] couldn't read extraction file {file_path} because it does not exist")
@@ -223,7 +233,7 @@ class DatabaseViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
                         "error": _("The extraction file has been renamed, moved or deleted")
                     })
 
-                except fernet.InvalidToken as e:
+                except (fernet.InvalidToken, CorruptExtractionArchive) as e:
                     logging.error(f"['In ferdolt.views.DatabaseViewSet.synchronize'] couldn't decode extraction file {file_path}")
                     unapplied_synchronizations.append({
                         "synchronization": ExtractionSerializer(synchronization.extraction).data,
@@ -261,15 +271,30 @@ class DatabaseViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
     def test_connection(self, request, *args, **kwargs):
         database = self.get_object()
 
-        connection_successful = False
+        # ?force=true tries to connect even if the database's circuit is open, e.g. after its credentials were corrected
+        if request.query_params.get("force", "").lower() in ( "1", "true" ):
+            reset_database_health(database.id)
+
+        health = get_database_health(database.id)
+
+        if health['is_open']:
+            return Response( 
+                data={
+                    'message': _("The last %(failures)d attempts to connect to the database failed, it will be tried again after %(retry_time)s") % {
+                        'failures': health['failures'], 'retry_time': dt.datetime.fromtimestamp( health['open_until'] ).isoformat(timespec="seconds")
+                    }, 
+                    'health': health
+                }, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE 
+            )
 
         connection = get_database_connection(database)
 
         if connection:
             connection.close()
-            return Response( data={'message': _("Successfully connected to the database")} )
+            return Response( data={'message': _("Successfully connected to the database"), 'health': get_database_health(database.id)} )
 
-        return Response( data={'message': _("Error connecting to the database. Please check that your server is running and your connection credentials are correct.")}, status=status.HTTP_400_BAD_REQUEST )
+        return Response( data={'message': _("Error connecting to the database. Please check that your server is running and your connection credentials are correct."), 'health': get_database_health(database.id)}, status=status.HTTP_400_BAD_REQUEST )
         
 class DatabaseSchemaViewSet(viewsets.ModelViewSet):
     permission_classes = [ IsStaff ]
@@ -376,8 +401,10 @@ class TableViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
             connection.commit()
         elif atomic and error_occured_flag:
             logging.error( _("An error occured, the changes will not be committed") )
+            connection.close()
             return Response( data = _("An error occured, the changes will not be committed"), status=status.HTTP_400_BAD_REQUEST )
 
+        connection.close()
         return Response(data={"records_inserted": records_inserted})
 
     @action(detail=False, methods=['PATCH', 'PUT'], permission_classes=[permissions.DummyPermission])
@@ -441,17 +468,21 @@ class TableViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
 
             except ( pyodbc.ProgrammingError, psycopg.ProgrammingError ) as e:
                 logging.error(f"Error execuing update query. Query: {query}")
+                connection.close()
                 return Response( data={'message': "Error updating records"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR )
             except (pyodbc.Error, psycopg.Error) as e:
                 logging.error(f"Error execuing update query. Query: {query}")
+                connection.close()
                 return Response( data={'message': "Error updating records"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR )
 
         if atomic and not error_occured_flag:
             connection.commit()
         elif atomic and error_occured_flag:
             logging.error( _("An error occured, the changes will not be committed") )
+            connection.close()
             return Response( data = _("An error occured, the changes will not be committed"), status=status.HTTP_400_BAD_REQUEST )
 
+        connection.close()
         return Response( data=records_updated )
 
     @action(detail=False, methods=['DELETE'], permission_classes=[permissions.DummyPermission])
@@ -493,11 +524,13 @@ class TableViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
             except pyodbc.ProgrammingError as e:
                 if atomic: 
                     logging.error( _("An error occured, the changes will not be committed") )
+                    connection.close()
                     return Response( data = _("An error occured, the changes will not be committed"), status=status.HTTP_400_BAD_REQUEST )
                 error_occured_flag = True
             except pyodbc.Error as e:
                 if atomic: 
                     logging.error( _("An error occured, the changes will not be committed") )
+                    connection.close()
                     return Response( data = _("An error occured, the changes will not be committed"), status=status.HTTP_400_BAD_REQUEST )
                 
                 error_occured_flag = True
@@ -506,8 +539,10 @@ class TableViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
             connection.commit()
         elif atomic and error_occured_flag:
             logging.error( _("An error occured, the changes will not be committed") )
+            connection.close()
             return Response( data = _("An error occured, the changes will not be committed"), status=status.HTTP_400_BAD_REQUEST )
 
+        connection.close()
         return Response( records_deleted )
 
     @action(detail=False, methods=['GET'], permission_classes=[permissions.DummyPermission])
@@ -519,6 +554,10 @@ class TableViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
         table = serializer.validated_data.pop('table')
 
         connection = get_database_connection(database)
+
+        if not connection:
+            raise drf_serializers.ValidationError( _("Error connecting to the database. Invalid connection parameters") )
+
         cursor = connection.cursor()
 
         query = f"SELECT * FROM {table.schema.name}.{table.name}"
@@ -530,6 +569,7 @@ class TableViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
         for row in rows:
             results.append( dict( zip(columns, row) ) )
 
+        connection.close()
         return Response(data=results)
 
 class ColumnViewSet(viewsets.ModelViewSet):
@@ -8,7 +8,36 @@ import environ
 env = environ.Env(
     DEBUG=(bool, True),
     SECRET_KEY=(str, 'django-insecure-=*8sy^+&sru&vcexj*l720sg#8bq%v&2ms(8ew3!xao9t(o64!'),
-    SERVER_ID=(str, 'W2X91')
+    SERVER_ID=(str, 'W2X91'),
+    EXTRACTION_BATCH_SIZE=(int, 5000),
+    EXTRACTION_COMPRESSION=(str, 'deflate'),
+    EXTRACTION_WORKERS=(int, 1),
+    GROUP_TASKS_MAX_CONCURRENT=(int, 4),
+    GROUP_TASKS_PER_DATABASE=(int, 1),
+    GROUP_TASKS_ASYNCHRONOUS=(bool, False),
+    GROUP_TASKS_ASYNC_CONCURRENCY=(int, 20),
+    DATABASE_ASYNC_THREADS=(int, 8),
+    TRACKING_ID_BACKFILL_CHUNK_SIZE=(int, 100000),
+    EXTRACTION_PLAN_TIMEOUT=(int, 300),
+    EXTRACTION_PAGE_SIZE=(int, 50000),
+    EXTRACTION_PART_ROWS=(int, 500000),
+    EXTRACTION_RESUME_ATTEMPTS=(int, 3),
+    EXTRACTION_WATERMARK_OVERLAP=(int, 60),
+    SYNCHRONIZATION_LOAD_STRATEGY=(str, 'temporary_table'),
+    SYNCHRONIZATION_WORKERS=(int, 1),
+    SYNCHRONIZATION_COMPACT_BACKLOG=(bool, True),
+    SYNCHRONIZATION_LEVEL_WORKERS=(int, 1),
+    DATABASE_POOL_MIN_SIZE=(int, 0),
+    DATABASE_POOL_MAX_SIZE=(int, 5),
+    DATABASE_POOL_IDLE_TIMEOUT=(int, 300),
+    DATABASE_POOL_BORROW_TIMEOUT=(int, 30),
+    DATABASE_CIRCUIT_FAILURE_THRESHOLD=(int, 3),
+    DATABASE_CIRCUIT_COOL_OFF=(int, 30),
+    DATABASE_CIRCUIT_MAX_COOL_OFF=(int, 1800),
+    CACHE_URL=(str, 'dbcache://ferdolt_cache_table'),
+    EXTRACTION_CACHE_BYTES=(int, 256 * 1024 * 1024),
+    EXTRACTION_CACHE_SPILL_DIRECTORY=(str, ''),
+    EXTRACTION_CACHE_SPILL_BYTES=(int, 1024 * 1024 * 1024),
 )
 
 environ.Env.read_env()
@@ -21,6 +50,75 @@ DEBUG = env("DEBUG")
 
 SERVER_ID = env('SERVER_ID')
 
+# number of rows fetched from a source table at a time during an extraction
+EXTRACTION_BATCH_SIZE = env('EXTRACTION_BATCH_SIZE')
+
+# codec used to compress extraction files before they are encrypted (none, deflate, lzma or zstd if zstandard is installed)
+EXTRACTION_COMPRESSION = env('EXTRACTION_COMPRESSION')
+
+# number of connections used to extract the tables of a group database in parallel (1 extracts the tables one after the other)
+EXTRACTION_WORKERS = env('EXTRACTION_WORKERS')
+
+# maximum number of group database extraction/synchronization tasks running at the same time, overall and on the same database
+GROUP_TASKS_MAX_CONCURRENT = env('GROUP_TASKS_MAX_CONCURRENT')
+GROUP_TASKS_PER_DATABASE = env('GROUP_TASKS_PER_DATABASE')
+
+# whether the periodic tasks extract from and synchronize all the group databases from one event loop (see groups.asynchronous)
+# instead of queueing a task per group database, and the number of group databases worked on at the same time
+GROUP_TASKS_ASYNCHRONOUS = env('GROUP_TASKS_ASYNCHRONOUS')
+GROUP_TASKS_ASYNC_CONCURRENCY = env('GROUP_TASKS_ASYNC_CONCURRENCY')
+
+# threads running the calls of the blocking drivers (pyodbc, mysql) for the asynchronous connections
+DATABASE_ASYNC_THREADS = env('DATABASE_ASYNC_THREADS')
+
+# rows given a tracking_id by each update (and commit) when a database is initialized, 0 updates each table with a single statement
+TRACKING_ID_BACKFILL_CHUNK_SIZE = env('TRACKING_ID_BACKFILL_CHUNK_SIZE')
+
+# seconds a compiled extraction plan is cached for, in case a change was made without going through the ORM's signals
+EXTRACTION_PLAN_TIMEOUT = env('EXTRACTION_PLAN_TIMEOUT')
+
+# number of rows read per query from a table with a key column, and number of rows after which an extraction is continued in a new part
+EXTRACTION_PAGE_SIZE = env('EXTRACTION_PAGE_SIZE')
+EXTRACTION_PART_ROWS = env('EXTRACTION_PART_ROWS')
+
+# number of times an interrupted extraction is resumed without saving a new part before it is marked as failed
+EXTRACTION_RESUME_ATTEMPTS = env('EXTRACTION_RESUME_ATTEMPTS')
+
+# seconds before a table's watermark from which its rows are read again by the next extraction, 
+# to catch the rows whose time was set before they were committed (0 reads from the watermark)
+EXTRACTION_WATERMARK_OVERLAP = env('EXTRACTION_WATERMARK_OVERLAP')
+
+# how the rows of an extraction are sent to a target database: temporary_table (bulk loaded, then merged) or json (merged from a json parameter)
+SYNCHRONIZATION_LOAD_STRATEGY = env('SYNCHRONIZATION_LOAD_STRATEGY')
+
+# number of target databases of a group synchronized at the same time by groups.functions.synchronize_group
+SYNCHRONIZATION_WORKERS = env('SYNCHRONIZATION_WORKERS')
+
+# whether the pending synchronizations of a database are applied at once, keeping the newest version of each row
+SYNCHRONIZATION_COMPACT_BACKLOG = env('SYNCHRONIZATION_COMPACT_BACKLOG')
+
+# number of connections used to apply the tables of the same level (tables not referencing each other) to a database at the same time
+SYNCHRONIZATION_LEVEL_WORKERS = env('SYNCHRONIZATION_LEVEL_WORKERS')
+
+# connections kept open per registered database (a max size of 0 opens a new connection every time),
+# seconds an idle connection is kept for and seconds to wait for a connection when they are all in use
+DATABASE_POOL_MIN_SIZE = env('DATABASE_POOL_MIN_SIZE')
+DATABASE_POOL_MAX_SIZE = env('DATABASE_POOL_MAX_SIZE')
+DATABASE_POOL_IDLE_TIMEOUT = env('DATABASE_POOL_IDLE_TIMEOUT')
+DATABASE_POOL_BORROW_TIMEOUT = env('DATABASE_POOL_BORROW_TIMEOUT')
+
+# consecutive connection failures after which a database isn't connected to for a cool-off period,
+# the first cool-off in seconds (doubled with each further failure) and the longest cool-off
+DATABASE_CIRCUIT_FAILURE_THRESHOLD = env('DATABASE_CIRCUIT_FAILURE_THRESHOLD')
+DATABASE_CIRCUIT_COOL_OFF = env('DATABASE_CIRCUIT_COOL_OFF')
+DATABASE_CIRCUIT_MAX_COOL_OFF = env('DATABASE_CIRCUIT_MAX_COOL_OFF')
+
+# size of the decoded extraction chunks kept in memory to apply an extraction to several databases (0 disables the cache),
+# and the directory and size of the chunks evicted from memory kept on disk (no directory disables it)
+EXTRACTION_CACHE_BYTES = env('EXTRACTION_CACHE_BYTES')
+EXTRACTION_CACHE_SPILL_DIRECTORY = env('EXTRACTION_CACHE_SPILL_DIRECTORY')
+EXTRACTION_CACHE_SPILL_BYTES = env('EXTRACTION_CACHE_SPILL_BYTES')
+
 ALLOWED_HOSTS = []
 
 EMAIL_HOST=env('EMAIL_HOST')
@@ -111,6 +209,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'ferdolt_web.wsgi.application'
 
+# the cache must be shared by the web and huey processes as it holds the databases' circuit breakers and the extraction plans.
+# The default database cache table is created by the migrations (or by manage.py createcachetable), 
+# a redis:// or memcache:// url can be used instead
+CACHES = {
+    'default': env.cache('CACHE_URL')
+}
+
 DATABASES = {
     # 'default': {
     #     'ENGINE': 'django.db.backends.sqlite3',
@@ -156,6 +261,7 @@ DATABASES = {
 #         'scheduler_interval': 1,  # Check schedule every second, -s.
 #         'periodic': True,  # Enable crontab feature.
 #         'check_worker_health': True,  # Enable worker health checks.
+#         'flush_locks': True,  # Release the task locks left by a consumer that was killed, -f.
 #         'health_check_interval': 1,  # Check worker health every second.
 #     },
 # }
@@ -0,0 +1,800 @@
+"""
+Reading and writing of extraction files.
+
+Extraction files are written in a chunked archive format laid out as follows:
+
+    MAGIC (8 bytes) | header length (4 bytes) | header (json)
+    chunk length (4 bytes) | chunk (fernet token) ...
+    index length (4 bytes) | index (fernet token)
+    index offset (8 bytes) | MAGIC (8 bytes)
+
+Every chunk holds at most chunk_rows rows of one section of the extraction and is compressed then encrypted on its own,
+so a chunk can be decrypted, authenticated and parsed without reading the rest of the file.
+The index lists the position, section and columns of every chunk, and the columns of every section written,
+sections without rows included (e.g. the deletions of a table from which nothing was deleted).
+The header records the version of the format and the codec the chunks and the index were compressed with.
+Chunks store their rows column by column: the names and types of the columns once, then an array of values per column.
+
+Older extraction files (a single fernet token of the whole json document, zipped or not) are still readable.
+
+Decoded chunks are kept in an LRU cache shared by the readers of a process (see DecodedExtractionCache),
+so an extraction applied to several databases is only decrypted and parsed once.
+"""
+import base64
+from collections import OrderedDict
+import datetime as dt
+from decimal import Decimal
+import json
+import logging
+from hashlib import sha256
+import lzma
+import mmap
+import os
+import struct
+import sys
+import threading
+import zipfile
+import zlib
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from core.exceptions import CorruptExtractionArchive, NotSupported
+from core.functions import custom_converter
+from ferdolt_web import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_MAGIC = b"FDLTARC\x00"
+ARCHIVE_VERSION = 3
+ARCHIVE_EXTENSION = ".fdx"
+
+DEFAULT_CHUNK_ROWS = 5000
+
+LENGTH_FORMAT = ">I"
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+
+TRAILER_FORMAT = ">Q8s"
+TRAILER_SIZE = struct.calcsize(TRAILER_FORMAT)
+
+# codec name: ( compress, decompress )
+COMPRESSION_CODECS = {
+    "none": ( lambda data: data, lambda data: data ),
+    "deflate": ( zlib.compress, zlib.decompress ),
+    "lzma": ( lzma.compress, lzma.decompress ),
+}
+DECOMPRESSION_ERRORS = ( zlib.error, lzma.LZMAError )
+
+if zstandard is not None:
+    COMPRESSION_CODECS["zstd"] = ( 
+        lambda data: zstandard.ZstdCompressor().compress(data), 
+        lambda data: zstandard.ZstdDecompressor().decompress(data) 
+    )
+    DECOMPRESSION_ERRORS += ( zstandard.ZstdError, )
+
+DEFAULT_CODEC = "deflate"
+
+def get_codec(name):
+    """
+    Returns the ( compress, decompress ) functions of a codec
+    """
+    if name not in COMPRESSION_CODECS:
+        raise NotSupported(f"The {name} compression codec is not supported{ ' (zstandard is not installed)' if name == 'zstd' else '' }")
+
+    return COMPRESSION_CODECS[name]
+
+# ( type name, python type, encode, decode ) of the values of a column, 
+# bool comes before int and datetime before date as they are subclasses of the latter
+COLUMN_TYPES = [
+    ( "bool", bool, None, None ),
+    ( "int", int, None, None ),
+    ( "float", float, None, None ),
+    ( "decimal", Decimal, str, Decimal ),
+    ( "datetime", dt.datetime, lambda value: value.isoformat(), dt.datetime.fromisoformat ),
+    ( "date", dt.date, lambda value: value.isoformat(), dt.date.fromisoformat ),
+    ( "time", dt.time, lambda value: value.isoformat(), dt.time.fromisoformat ),
+    ( "bytes", bytes, lambda value: base64.b64encode(value).decode("ascii"), base64.b64decode ),
+    ( "str", str, None, None ),
+]
+COLUMN_DECODERS = { name: decode for name, _, _, decode in COLUMN_TYPES }
+
+# values of any other type are written as strings
+TEXT_TYPE = "text"
+
+def get_value_type(value):
+    for name, python_type, encode, _ in COLUMN_TYPES:
+        if isinstance(value, python_type):
+            return name, encode
+
+    return TEXT_TYPE, custom_converter
+
+def encode_column(values):
+    """
+    Returns the type of a column's values and the values in a json serializable form
+    """
+    first_value = next( ( value for value in values if value is not None ), None )
+    type_name, encode = get_value_type(first_value) if first_value is not None else ( "str", None )
+
+    if any( value is not None and get_value_type(value)[0] != type_name for value in values ):
+        # the column holds values of different types
+        type_name, encode = TEXT_TYPE, custom_converter
+
+    if encode is None:
+        return type_name, list(values)
+
+    return type_name, [ encode(value) if value is not None else None for value in values ]
+
+def decode_column(type_name, values):
+    decode = COLUMN_DECODERS.get(type_name)
+
+    if decode is None:
+        return values
+
+    return [ decode(value) if value is not None else None for value in values ]
+
+def encode_value(value):
+    """
+    Returns a single value as a json serializable [ type, value ] pair
+    """
+    if value is None:
+        return [ "str", None ]
+
+    type_name, encode = get_value_type(value)
+
+    return [ type_name, encode(value) if encode else value ]
+
+def decode_value(encoded_value):
+    type_name, value = encoded_value
+
+    return decode_column(type_name, [value])[0]
+
+def get_decoded_size(columns) -> int:
+    """
+    Returns an estimate of the memory taken by the decoded columns of a chunk: the lists and the values they hold.
+    Values shared between rows (small integers, None, ...) are counted every time, the estimate is an upper bound
+    """
+    return sys.getsizeof(columns) + sum(
+        sys.getsizeof(column) + sum( sys.getsizeof(value) for value in column ) for column in columns
+    )
+
+def is_chunked_archive(path) -> bool:
+    with open(path, "rb") as file:
+        return file.read( len(ARCHIVE_MAGIC) ) == ARCHIVE_MAGIC
+
+class ExtractionWriter:
+    """
+    Writes the rows of an extraction to a chunked archive as they are fetched from the source database,
+    so that neither the extracted rows nor the encrypted file ever have to be held in memory as a whole.
+
+    The rows are grouped in sections identified by a tuple of keys (e.g. (group_table_name,) or (database_name, schema_name, table_name))
+    and a kind ("rows", "deleted_rows", "deletions"). Once read back, the sections make up the usual
+    { root_key: { key: { kind: [ row, ... ] } } } dictionary, or { key: { kind: [ row, ... ] } } if root_key is None.
+    """
+    def __init__(self, base_file_name, root_key, fernet, chunk_rows=DEFAULT_CHUNK_ROWS, codec=None):
+        self.path = base_file_name + ARCHIVE_EXTENSION
+        self.root_key = root_key
+        self.fernet = fernet
+        self.chunk_rows = chunk_rows
+
+        self.codec = codec or settings.EXTRACTION_COMPRESSION
+
+        if self.codec == "zstd" and zstandard is None:
+            logging.warning(f"zstandard is not installed, the extraction will be compressed with {DEFAULT_CODEC} instead")
+            self.codec = DEFAULT_CODEC
+
+        self.compress = get_codec(self.codec)[0]
+
+        self.chunks = []
+        self.row_count = 0
+
+        # ( keys, kind ): columns of every section written, even without rows
+        self.sections = {}
+
+        # chunks can be written from several threads, each thread writing the chunks of its own part of the extraction
+        self.lock = threading.Lock()
+        self.part_chunk_counts = {}
+
+        self.file = open(self.path, "wb")
+
+        header = json.dumps({ "version": ARCHIVE_VERSION, "codec": self.codec }).encode("utf-8")
+        self.file.write(ARCHIVE_MAGIC)
+        self.file.write( struct.pack(LENGTH_FORMAT, len(header)) )
+        self.file.write(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+
+    @property
+    def is_empty(self) -> bool:
+        return self.row_count == 0
+
+    @property
+    def keys(self):
+        return list( dict.fromkeys( keys for keys, _ in self.sections ) )
+
+    def _write_block(self, content: bytes) -> int:
+        """
+        Writes a length-prefixed block to the archive and returns its offset
+        """
+        offset = self.file.tell()
+        self.file.write( struct.pack(LENGTH_FORMAT, len(content)) )
+        self.file.write(content)
+
+        return offset
+
+    def write_rows(self, keys, kind, columns, rows, part=0):
+        """
+        Writes rows to the archive. The chunks are numbered ( part, number of the chunk in the part ) 
+        and ordered by that sequence in the index, so parts written concurrently are always read back in the same order
+        """
+        columns = list(columns)
+
+        with self.lock:
+            self.sections.setdefault( ( tuple(keys), kind ), columns )
+
+        for start in range( 0, len(rows), self.chunk_rows ):
+            chunk_rows = rows[ start:start + self.chunk_rows ]
+
+            with self.lock:
+                sequence = [ part, self.part_chunk_counts.get(part, 0) ]
+                self.part_chunk_counts[part] = sequence[1] + 1
+
+            types, values = zip( *[ encode_column(column) for column in zip(*chunk_rows) ] )
+
+            payload = json.dumps({
+                "sequence": sequence, "keys": list(keys), "kind": kind,
+                "columns": columns, "types": types, "values": values
+            }, default=custom_converter)
+
+            token = self.fernet.encrypt( self.compress( payload.encode("utf-8") ) )
+
+            with self.lock:
+                offset = self._write_block(token)
+
+                self.chunks.append({
+                    "sequence": sequence, "keys": list(keys), "kind": kind,
+                    "columns": columns, "types": types, "rows": len(chunk_rows), "offset": offset
+                })
+                self.row_count += len(chunk_rows)
+
+    def write_cursor(self, keys, kind, cursor, batch_size=None, part=0):
+        """
+        Writes the rows of a query already run on cursor, fetching batch_size (EXTRACTION_BATCH_SIZE by default) rows at a time
+        """
+        batch_size = batch_size or settings.EXTRACTION_BATCH_SIZE
+        columns = [ column[0] for column in cursor.description ]
+
+        # the section is recorded even if the query returns no rows
+        self.write_rows(keys, kind, columns, [], part=part)
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+
+            if not rows:
+                break
+
+            self.write_rows(keys, kind, columns, rows, part=part)
+
+    def close(self) -> str:
+        """
+        Writes the index of the archive and returns the path to the archive
+        """
+        self.chunks.sort( key=lambda chunk: chunk["sequence"] )
+
+        index = json.dumps({
+            "root": self.root_key, "chunks": self.chunks, "row_count": self.row_count,
+            "sections": [ { "keys": list(keys), "kind": kind, "columns": columns } for ( keys, kind ), columns in self.sections.items() ]
+        })
+        index_offset = self._write_block( self.fernet.encrypt( self.compress( index.encode("utf-8") ) ) )
+
+        self.file.write( struct.pack(TRAILER_FORMAT, index_offset, ARCHIVE_MAGIC) )
+        self.file.close()
+
+        return self.path
+
+    def discard(self):
+        if not self.file.closed:
+            self.file.close()
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+class DecodedExtractionCache:
+    """
+    LRU cache of the decoded columns of extraction chunks, keyed by the hash of the extraction file and the chunk's offset.
+    Its size is bounded by max_bytes, the memory taken by the decoded columns it holds (see get_decoded_size) 
+    and by the payloads kept to be spilled.
+
+    With a spill_directory, the payloads of the chunks evicted are written there (up to max_spill_bytes) 
+    and read back through a memory map instead of being read from their archive and decompressed again. 
+    The payloads are encrypted with a key generated by the cache and only kept in memory, 
+    so the files spilled can't be read by anyone else, nor once the process has ended.
+    The values returned are shared between readers and must not be modified
+    """
+    def __init__(self, max_bytes, spill_directory=None, max_spill_bytes=0):
+        self.max_bytes = max_bytes
+        self.spill_directory = spill_directory or None
+        self.max_spill_bytes = max_spill_bytes
+
+        self.spill_fernet = Fernet( Fernet.generate_key() ) if self.spill_directory else None
+
+        # key: ( columns, size, payload kept to be spilled )
+        self.entries = OrderedDict()
+        self.size = 0
+
+        # key: ( path, size )
+        self.spilled = OrderedDict()
+        self.spill_size = 0
+
+        self.lock = threading.Lock()
+
+        if self.spill_directory:
+            os.makedirs(self.spill_directory, exist_ok=True)
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            self.entries.move_to_end(key)
+
+            return entry[0]
+
+    def get_spilled(self, key):
+        """
+        Returns the payload of an evicted chunk if it was spilled to disk
+        """
+        with self.lock:
+            spilled = self.spilled.get(key)
+
+            if spilled is None:
+                return None
+
+            self.spilled.move_to_end(key)
+
+        try:
+            with open(spilled[0], "rb") as file, mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_READ ) as memory_map:
+                return self.spill_fernet.decrypt( memory_map[:] )
+        except (OSError, ValueError, InvalidToken) as e:
+            logging.warning(f"Could not read the spilled extraction chunk {spilled[0]}. Error: {str(e)}")
+
+            with self.lock:
+                self._remove_spilled(key)
+
+            return None
+
+    def put(self, key, columns, payload: bytes):
+        size = get_decoded_size(columns) + ( len(payload) if self.spill_directory else 0 )
+
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+
+            self.entries[key] = ( columns, size, payload if self.spill_directory else None )
+            self.size += size
+
+            while self.size > self.max_bytes:
+                evicted_key, ( _, evicted_size, evicted_payload ) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+                if evicted_payload is not None and evicted_key not in self.spilled:
+                    self._spill(evicted_key, evicted_payload)
+
+    def _spill(self, key, payload: bytes):
+        if len(payload) > self.max_spill_bytes:
+            return
+
+        path = os.path.join( self.spill_directory, sha256( repr(key).encode("utf-8") ).hexdigest() )
+        payload = self.spill_fernet.encrypt(payload)
+
+        try:
+            descriptor = os.open( path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 )
+
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(payload)
+        except OSError as e:
+            logging.warning(f"Could not spill an extraction chunk to {path}. Error: {str(e)}")
+            return
+
+        self.spilled[key] = ( path, len(payload) )
+        self.spill_size += len(payload)
+
+        while self.spill_size > self.max_spill_bytes:
+            self._remove_spilled( next( iter(self.spilled) ) )
+
+    def _remove_spilled(self, key):
+        spilled = self.spilled.pop(key, None)
+
+        if spilled is None:
+            return
+
+        self.spill_size -= spilled[1]
+
+        if os.path.exists(spilled[0]):
+            os.unlink(spilled[0])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+            for key in list(self.spilled):
+                self._remove_spilled(key)
+
+decoded_chunks = DecodedExtractionCache( 
+    settings.EXTRACTION_CACHE_BYTES, settings.EXTRACTION_CACHE_SPILL_DIRECTORY, settings.EXTRACTION_CACHE_SPILL_BYTES 
+)
+
+class ExtractionReader:
+    """
+    Reads a chunked extraction archive one chunk at a time.
+    With a cache_key (the hash of the file), the decoded chunks are shared with the other readers of the file through decoded_chunks
+    """
+    def __init__(self, path, fernet, cache_key=None):
+        self.path = path
+        self.fernet = fernet
+        self.cache_key = cache_key
+        self.file = open(path, "rb")
+
+        # the chunks of a reader can be read from several threads, each read seeks the file
+        self.lock = threading.Lock()
+
+        try:
+            if self.file.read( len(ARCHIVE_MAGIC) ) != ARCHIVE_MAGIC:
+                raise CorruptExtractionArchive(f"{path} is not an extraction archive")
+
+            self.header = json.loads( self._read_block() )
+
+            # version 1 archives were not compressed
+            self.codec = self.header.get("codec", "none")
+            self.decompress = get_codec(self.codec)[1]
+
+            self.file.seek(-TRAILER_SIZE, os.SEEK_END)
+            index_offset, magic = struct.unpack( TRAILER_FORMAT, self.file.read(TRAILER_SIZE) )
+
+            if magic != ARCHIVE_MAGIC:
+                raise CorruptExtractionArchive(f"The extraction archive {path} is truncated")
+
+            self.index = json.loads( self._decrypt( self._read_block(index_offset) ) )
+        except (struct.error, OSError, ValueError) as e:
+            self.file.close()
+            raise CorruptExtractionArchive(f"Could not read the extraction archive {path}. Error: {str(e)}")
+        except NotSupported as e:
+            self.file.close()
+            raise CorruptExtractionArchive(f"The extraction archive {path} cannot be decompressed. {str(e)}")
+        except CorruptExtractionArchive as e:
+            self.file.close()
+            raise e
+
+        self.root_key = self.index["root"]
+        self.chunks = self.index["chunks"]
+
+        # archives written before the sections were indexed only have the sections of their chunks
+        self.sections = self.index.get("sections") or [
+            { "keys": chunk["keys"], "kind": chunk["kind"], "columns": chunk["columns"] } for chunk in self.chunks
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _read_block(self, offset=None) -> bytes:
+        with self.lock:
+            if offset is not None:
+                self.file.seek(offset)
+
+            length = struct.unpack( LENGTH_FORMAT, self.file.read(LENGTH_SIZE) )[0]
+            content = self.file.read(length)
+
+        if len(content) != length:
+            raise CorruptExtractionArchive(f"The extraction archive {self.path} is truncated")
+
+        return content
+
+    def _decrypt(self, token: bytes) -> bytes:
+        try:
+            return self.decompress( self.fernet.decrypt(token) )
+        except InvalidToken:
+            raise CorruptExtractionArchive(f"A chunk of the extraction archive {self.path} could not be decrypted")
+        except DECOMPRESSION_ERRORS as e:
+            raise CorruptExtractionArchive(f"A chunk of the extraction archive {self.path} could not be decompressed. Error: {str(e)}")
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.chunks
+
+    @property
+    def keys(self):
+        return list( dict.fromkeys( tuple( section["keys"] ) for section in self.sections ) )
+
+    def get_columns(self, keys, kind):
+        for section in self.sections:
+            if tuple( section["keys"] ) == tuple(keys) and section["kind"] == kind:
+                return section["columns"]
+
+        return []
+
+    def read_chunk(self, chunk, content: bytes=None) -> dict:
+        if content is None:
+            content = self._decrypt( self._read_block( chunk["offset"] ) )
+
+        payload = json.loads(content)
+
+        # guards against chunks being swapped or replayed from another part of the archive
+        if payload["sequence"] != chunk["sequence"]:
+            raise CorruptExtractionArchive(f"Chunk {chunk['sequence']} of the extraction archive {self.path} is out of place")
+
+        return payload
+
+    def read_columns(self, chunk) -> list:
+        """
+        Returns the decoded values of each column of a chunk
+        """
+        # the index was decrypted with this reader's key, so the chunks of the file can be taken from the cache
+        key = ( self.cache_key, chunk["offset"] ) if self.cache_key and decoded_chunks.is_enabled else None
+
+        if key:
+            columns = decoded_chunks.get(key)
+
+            if columns is not None:
+                return columns
+
+            content = decoded_chunks.get_spilled(key)
+        else:
+            content = None
+
+        if content is None:
+            content = self._decrypt( self._read_block( chunk["offset"] ) )
+
+        payload = self.read_chunk(chunk, content)
+
+        if "values" not in payload:
+            # chunks of version 1 and 2 archives hold a list of dictionaries
+            columns = [ [ row.get(column) for row in payload["rows"] ] for column in chunk["columns"] ]
+        else:
+            columns = [ decode_column(type_name, values) for type_name, values in zip( payload["types"], payload["values"] ) ]
+
+        if key:
+            decoded_chunks.put(key, columns, content)
+
+        return columns
+
+    def read_rows(self, chunk) -> list:
+        columns = chunk["columns"]
+
+        return [ dict( zip( columns, row ) ) for row in zip( *self.read_columns(chunk) ) ]
+
+    def iter_column_chunks(self, keys=None, kind=None):
+        """
+        Yields the columns and the values of each column of the archive one chunk at a time,
+        optionally restricted to one section of the archive
+        """
+        for chunk in self.chunks:
+            if keys is not None and tuple( chunk["keys"] ) != tuple(keys):
+                continue
+            if kind is not None and chunk["kind"] != kind:
+                continue
+
+            yield chunk["columns"], self.read_columns(chunk)
+
+    def iter_chunks(self, keys=None, kind=None):
+        """
+        Yields the rows of the archive (as lists of dictionaries) one chunk at a time,
+        optionally restricted to one section of the archive
+        """
+        for columns, values in self.iter_column_chunks(keys, kind):
+            yield [ dict( zip( columns, row ) ) for row in zip(*values) ]
+
+    def to_dictionary(self) -> dict:
+        """
+        Reads the whole archive into the { root_key: { key: { kind: [ row, ... ] } } } dictionary
+        """
+        dictionary = {}
+        root = dictionary.setdefault(self.root_key, {}) if self.root_key is not None else dictionary
+
+        def get_node(keys):
+            node = root
+
+            for key in keys:
+                node = node.setdefault(key, {})
+
+            return node
+
+        for section in self.sections:
+            get_node( section["keys"] ).setdefault( section["kind"], [] )
+
+        for chunk in self.chunks:
+            get_node( chunk["keys"] ).setdefault( chunk["kind"], [] ).extend( self.read_rows(chunk) )
+
+        return dictionary
+
+class LegacyExtractionReader:
+    """
+    Exposes the same interface as ExtractionReader for extraction files made of a single fernet token,
+    these files have to be decrypted and parsed as a whole
+    """
+    def __init__(self, path, fernet):
+        self.path = path
+
+        if zipfile.is_zipfile(path):
+            content = b''
+
+            with zipfile.ZipFile(path) as zip_file:
+                for name in zip_file.namelist():
+                    content = zip_file.read(name)
+        else:
+            with open(path, "rb") as file:
+                content = file.read()
+
+        self.dictionary = json.loads( fernet.decrypt(content).decode('utf-8') ) if content else {}
+        self.root_key = list( self.dictionary.keys() )[0] if len( self.dictionary.keys() ) == 1 else None
+
+        self.sections = {}
+
+        def add_sections(node, keys):
+            for key, value in node.items():
+                if isinstance(value, list):
+                    self.sections[ ( tuple(keys), key ) ] = value
+                elif isinstance(value, dict):
+                    add_sections(value, keys + [key])
+
+        # extractions of whole databases have no root key, their first key is the database name
+        add_sections(self.dictionary[self.root_key] if self.root_key is not None else self.dictionary, [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+    @property
+    def is_empty(self) -> bool:
+        return not any( self.sections.values() )
+
+    @property
+    def keys(self):
+        return list( dict.fromkeys( keys for keys, _ in self.sections.keys() ) )
+
+    def get_columns(self, keys, kind):
+        rows = self.sections.get( ( tuple(keys), kind ) )
+
+        return list( rows[0].keys() ) if rows else []
+
+    def iter_column_chunks(self, keys=None, kind=None):
+        for rows in self.iter_chunks(keys, kind):
+            columns = list( rows[0].keys() )
+
+            yield columns, [ [ row.get(column) for row in rows ] for column in columns ]
+
+    def iter_chunks(self, keys=None, kind=None):
+        for ( section_keys, section_kind ), rows in self.sections.items():
+            if keys is not None and section_keys != tuple(keys):
+                continue
+            if kind is not None and section_kind != kind:
+                continue
+
+            if rows:
+                yield rows
+
+    def to_dictionary(self) -> dict:
+        return self.dictionary
+
+class MultiPartExtractionReader:
+    """
+    Reads the parts of an extraction (see flux.models.ExtractionPart) as one extraction
+    """
+    def __init__(self, readers):
+        self.readers = readers
+        self.root_key = readers[0].root_key
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+    @property
+    def is_empty(self) -> bool:
+        return all( reader.is_empty for reader in self.readers )
+
+    @property
+    def keys(self):
+        return list( dict.fromkeys( keys for reader in self.readers for keys in reader.keys ) )
+
+    def get_columns(self, keys, kind):
+        for reader in self.readers:
+            columns = reader.get_columns(keys, kind)
+
+            if columns:
+                return columns
+
+        return []
+
+    def iter_column_chunks(self, keys=None, kind=None):
+        for reader in self.readers:
+            yield from reader.iter_column_chunks(keys, kind)
+
+    def iter_chunks(self, keys=None, kind=None):
+        for reader in self.readers:
+            yield from reader.iter_chunks(keys, kind)
+
+    def to_dictionary(self) -> dict:
+        dictionary = {}
+
+        def merge(target, source):
+            for key, value in source.items():
+                if isinstance(value, dict):
+                    merge( target.setdefault(key, {}), value )
+                elif isinstance(value, list):
+                    target.setdefault(key, []).extend(value)
+                else:
+                    target[key] = value
+
+        for reader in self.readers:
+            merge( dictionary, reader.to_dictionary() )
+
+        return dictionary
+
+def open_extraction(path, fernet, cache_key=None):
+    """
+    Opens an extraction file whatever the format it was written in. 
+    The chunks of archives opened with a cache_key (the file's hash) are decoded once per process
+    """
+    if is_chunked_archive(path):
+        return ExtractionReader(path, fernet, cache_key=cache_key)
+
+    return LegacyExtractionReader(path, fernet)
+
+def open_extraction_parts(paths, fernet, cache_keys=None):
+    """
+    Opens the files of all the parts of an extraction
+    """
+    readers = []
+    cache_keys = cache_keys or [ None for _ in paths ]
+
+    try:
+        for path, cache_key in zip(paths, cache_keys):
+            readers.append( open_extraction(path, fernet, cache_key=cache_key) )
+    except Exception as e:
+        for reader in readers:
+            reader.close()
+
+        raise e
+
+    return readers[0] if len(readers) == 1 else MultiPartExtractionReader(readers)
+
+def read_extraction_dictionary(path, fernet) -> dict:
+    with open_extraction(path, fernet) as reader:
+        return reader.to_dictionary()
+
+def read_extraction_parts_dictionary(paths, fernet, cache_keys=None) -> dict:
+    with open_extraction_parts(paths, fernet, cache_keys=cache_keys) as reader:
+        return reader.to_dictionary()
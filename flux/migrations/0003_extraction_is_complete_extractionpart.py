@@ -0,0 +1,39 @@
+# Generated by Django 4.1.3 on 2026-10-17 10:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flux', '0002_file_password_historicalfile_password_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extraction',
+            name='is_complete',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='historicalextraction',
+            name='is_complete',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='ExtractionPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField()),
+                ('row_count', models.IntegerField(default=0)),
+                ('time_made', models.DateTimeField(auto_now_add=True)),
+                ('extraction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parts', to='flux.extraction')),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, to='flux.file')),
+            ],
+            options={
+                'ordering': ['extraction', 'number'],
+                'unique_together': {('extraction', 'number')},
+            },
+        ),
+    ]
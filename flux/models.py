@@ -48,10 +48,47 @@ class Extraction(models.Model):
     # i.e. SELECT * FROM table WHERE last_updated < end_time
     end_time = models.DateTimeField(null=True)
 
+    # False while the parts of a multi-part extraction are still being extracted
+    is_complete = models.BooleanField(default=True)
+
     @property
     def file_path(self) -> str:
         return self.file.file.path
 
+    def get_files(self) -> list:
+        """
+        Returns the files of the extraction's parts in order, or the extraction's file if it was made in one part
+        """
+        parts = self.parts.select_related("file").order_by("number")
+
+        return [ part.file for part in parts ] if parts else [ self.file ]
+
+    def get_file_paths(self) -> list:
+        return [ file.file.path for file in self.get_files() ]
+
+    def get_file_hashes(self) -> list:
+        """
+        Returns the hashes of the extraction's files, the keys their decoded content is cached under when they are read
+        """
+        return [ file.hash for file in self.get_files() ]
+
+class ExtractionPart(models.Model):
+    """
+    One of the files of an extraction too large to be written in one file. 
+    The first part's file is also the extraction's file
+    """
+    extraction = models.ForeignKey(Extraction, on_delete=models.CASCADE, related_name='parts')
+    number = models.IntegerField()
+    file = models.OneToOneField(File, on_delete=models.PROTECT)
+    row_count = models.IntegerField(default=0)
+    time_made = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [
+            ["extraction", "number"]
+        ]
+        ordering = [ "extraction", "number" ]
+
 class ExtractionTargetDatabase(models.Model):
     extraction = models.ForeignKey(Extraction, on_delete=models.CASCADE)
     database = models.ForeignKey(ferdolt_models.Database, on_delete=models.CASCADE)
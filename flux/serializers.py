@@ -4,7 +4,6 @@ import logging
 import os
 import datetime as dt
 from sqlite3 import ProgrammingError
-import zipfile
 
 import psycopg
 import pyodbc
@@ -21,6 +20,7 @@ from rest_framework.response import Response
 
 from core.functions import custom_converter, extract_raw, synchronize_database
 from . import models
+from .archives import ExtractionWriter, open_extraction
 from frontend.views import get_database_connection
 from ferdolt import models as ferdolt_models
 from ferdolt_web import settings
@@ -258,113 +258,92 @@ class ExtractionSerializer(serializers.ModelSerializer):
 
             time_made = timezone.now()
 
-            results = {}
             database_records = []
 
-            for database in databases:
-                database_record = database['database']
-                
-                if database_record:
-                    database_dictionary = results.setdefault(database_record.name, {})
+            base_filename = os.path.join( settings.BASE_DIR, settings.MEDIA_ROOT, "extractions", f"{timezone.now().strftime('%Y%m%d%H%M%S')}" )
+
+            # the rows are compressed and encrypted chunk by chunk as they are extracted
+            writer = ExtractionWriter(base_filename, None, f)
 
-                    connection = get_database_connection(database_record)
+            with writer:
+                for database in databases:
+                    database_record = database['database']
+                
+                    if database_record:
+                        connection = get_database_connection(database_record)
 
-                    if connection:
-                        cursor = connection.cursor()
-                        database_records.append(database)
+                        if connection:
+                            cursor = connection.cursor()
+                            database_records.append(database)
                         
-                        schemas = None
-                        schemas_key = 'extractionsourcedatabaseschema_set'
+                            schemas = None
+                            schemas_key = 'extractionsourcedatabaseschema_set'
 
-                        if schemas_key in database and database[schemas_key]:
-                            schemas = database[schemas_key]
+                            if schemas_key in database and database[schemas_key]:
+                                schemas = database[schemas_key]
 
-                        for schema in schemas:
-                            tables = None
-                            _schema = schema['schema']
+                            for schema in schemas:
+                                tables = None
+                                _schema = schema['schema']
 
-                            schema_tables_key = 'extractionsourcetable_set'
+                                schema_tables_key = 'extractionsourcetable_set'
 
-                            if schema_tables_key in schema and schema[schema_tables_key]:
-                                tables = schema[schema_tables_key]
+                                if schema_tables_key in schema and schema[schema_tables_key]:
+                                    tables = schema[schema_tables_key]
 
-                                for _table in tables:
-                                    table: ferdolt_models.Table = _table['table']
-                                    deletion_table = table.deletion_table
+                                    for _table in tables:
+                                        table: ferdolt_models.Table = _table['table']
+                                        deletion_table = table.deletion_table
                                     
-                                    table_query_name = table.get_queryname()
-                                    deletion_table_query_name = deletion_table.get_queryname()
+                                        table_query_name = table.get_queryname()
+                                        deletion_table_query_name = deletion_table.get_queryname()
 
-                                    schema_dictionary = database_dictionary.setdefault(_schema.name, {})
-                                    table_dictionary = schema_dictionary.setdefault( table.name, {} )
+                                        table_keys = ( database_record.name, _schema.name, table.name )
 
-                                    table_rows = table_dictionary.setdefault( "rows", [] )
-                                    table_deleted_rows = table_dictionary.setdefault("deletions", [])
-
-                                    time_field = table.column_set.filter( Q(name='last_updated') | Q(name="deletion_time") )
-                                    deletion_time_field = "deletion_time"
+                                        time_field = table.column_set.filter( Q(name='last_updated') | Q(name="deletion_time") )
+                                        deletion_time_field = "deletion_time"
             
-                                    query = f"""
-                                    SELECT { ', '.join( [ column.name for column in table.column_set.all() ] ) } FROM {table_query_name} 
-                                    { f"WHERE { time_field.first().name } >= ?" if start_time and time_field.exists() and use_time else "" }
-                                    """
-                                    deletion_query = f"""
-                                    SELECT { ', '.join( [column.name for column in deletion_table.column_set.all()] ) } FROM { deletion_table_query_name } 
-                                    { f"WHERE { deletion_time_field } >= ?" if start_time and deletion_time_field and use_time else "" }
-                                    """
-                                    try:
-                                        rows = cursor.execute(query, start_time) if start_time and time_field.exists() and use_time else cursor.execute(query)
-
-                                        columns = [ column[0] for column in cursor.description ]
-
-                                        for row in rows:
-                                            row_dictionary = dict( zip( columns, row ) )
-                                            table_rows.append(row_dictionary)
-
-                                    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                        logging.error(f"Error occured when extracting from {database}.{table.schema.name}.{table.name}. Error: {str(e)}")
-                                        raise e
-
-                                    try:
-                                        deleted_rows = (cursor.execute( deletion_query, start_time ) 
-                                            if start_time and deletion_time_field and use_time
-                                            else cursor.execute(deletion_query)
-                                        )
-
-                                        columns = [ column[0] for column in cursor.description ]
-                                        for row in deleted_rows:
-                                            row_dictionary = dict( zip( columns, row ) )
-                                            table_deleted_rows.append( row_dictionary )
-
-                                    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                        logging.error( f"Erorr occured when extracting the deleted rows from the deletion table of {table.__str__()} (Deletion table: {deletion_table.__str__()}, Error: {str(e)})" )
-                                        raise e
+                                        query = f"""
+                                        SELECT { ', '.join( [ column.name for column in table.column_set.all() ] ) } FROM {table_query_name} 
+                                        { f"WHERE { time_field.first().name } >= ?" if start_time and time_field.exists() and use_time else "" }
+                                        """
+                                        deletion_query = f"""
+                                        SELECT { ', '.join( [column.name for column in deletion_table.column_set.all()] ) } FROM { deletion_table_query_name } 
+                                        { f"WHERE { deletion_time_field } >= ?" if start_time and deletion_time_field and use_time else "" }
+                                        """
+                                        try:
+                                            cursor.execute(query, start_time) if start_time and time_field.exists() and use_time else cursor.execute(query)
+
+                                            writer.write_cursor( table_keys, "rows", cursor )
+
+                                        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+                                            logging.error(f"Error occured when extracting from {database}.{table.schema.name}.{table.name}. Error: {str(e)}")
+                                            raise e
+
+                                        try:
+                                            (cursor.execute( deletion_query, start_time ) 
+                                                if start_time and deletion_time_field and use_time
+                                                else cursor.execute(deletion_query)
+                                            )
+
+                                            writer.write_cursor( table_keys, "deletions", cursor )
+
+                                        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+                                            logging.error( f"Erorr occured when extracting the deleted rows from the deletion table of {table.__str__()} (Deletion table: {deletion_table.__str__()}, Error: {str(e)})" )
+                                            raise e
                         
+                        else:
+                            raise serializers.ValidationError( _("Invalid connection parameters") )
                     else:
-                        raise serializers.ValidationError( _("Invalid connection parameters") )
-                else:
-                    raise serializers.ValidationError( _("No database exists with id %(id)s" % {'id': id}) )
+                        raise serializers.ValidationError( _("No database exists with id %(id)s" % {'id': id}) )
 
             if database_records:
-                base_filename = os.path.join( settings.BASE_DIR, settings.MEDIA_ROOT, "extractions", f"{timezone.now().strftime('%Y%m%d%H%M%S')}" )
+                archive_filename = writer.close()
 
-                filename = base_filename + ".json"
-                zip_filename = base_filename + ".zip"
-
-                with open( filename, "a+" ) as file:
-                    json_string = json.dumps( results, default=custom_converter )
-                    token = f.encrypt( bytes(json_string, 'utf-8') )
-
-                    file.write( token.decode('utf-8') )
-                
-                # zipping the json file
-                with zipfile.ZipFile(zip_filename, mode='a') as archive:
-                    archive.write(filename, os.path.basename(filename))
-                    
-                with open( zip_filename, "rb" ) as __:
+                with open( archive_filename, "rb" ) as __:
                     file = models.File.objects.create( 
-                        file=File( __, name=os.path.basename( zip_filename ) ), 
-                        size=os.path.getsize(zip_filename), is_deleted=False )
+                        file=File( __, name=os.path.basename( archive_filename ) ), 
+                        size=os.path.getsize(archive_filename), is_deleted=False )
 
                     extraction = models.Extraction.objects.create(file=file, start_time=start_time, time_made=time_made)
 
@@ -388,7 +367,10 @@ class ExtractionSerializer(serializers.ModelSerializer):
                                 connection = get_database_connection(database)
 
                                 if connection:
-                                    synchronize_database(connection, database, results)
+                                    # the target databases read the rows back from the archive, a chunk at a time
+                                    with open_extraction(archive_filename, f) as reader:
+                                        synchronize_database(connection, database, reader)
+
                                     flag = True
                                 else: 
                                     flag = False
@@ -403,8 +385,9 @@ class ExtractionSerializer(serializers.ModelSerializer):
 
                             models.ExtractionTargetDatabase.objects.create(extraction=extraction, database=database, is_applied=synchronized_flag)
 
-                os.unlink( filename )
-                os.unlink( zip_filename )
+                os.unlink( archive_filename )
+            else:
+                writer.discard()
 
             return extraction
 
@@ -1,3 +1,154 @@
-from django.test import TestCase
-
-# Create your tests here.
+import datetime as dt
+from decimal import Decimal
+import os
+import tempfile
+
+from cryptography.fernet import Fernet
+
+from django.test import SimpleTestCase
+
+from .archives import DecodedExtractionCache, ExtractionWriter, get_decoded_size, open_extraction, open_extraction_parts
+
+class FakeCursor:
+    """
+    Cursor returning rows already fetched, as the drivers' cursors do after a query is run
+    """
+    def __init__(self, columns, rows):
+        self.description = [ ( column, None ) for column in columns ]
+        self.rows = list(rows)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+
+        return rows
+
+class ExtractionArchiveTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.fernet = Fernet( Fernet.generate_key() )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_writer(self, name="extraction", root_key=None, **kwargs):
+        return ExtractionWriter( os.path.join(self.directory.name, name), root_key, self.fernet, **kwargs )
+
+    def test_round_trip(self):
+        rows = [
+            ( 1, "first", Decimal("1.50"), dt.datetime(2023, 1, 1, 12, 30), None ),
+            ( 2, "second", Decimal("2.25"), dt.datetime(2023, 1, 2, 8, 0), b"\x00\x01" ),
+            ( 3, "third", None, dt.datetime(2023, 1, 3, 18, 45), b"" ),
+        ]
+        columns = [ "id", "name", "price", "last_updated", "content" ]
+
+        writer = self.get_writer(chunk_rows=2)
+        writer.write_rows( ( "database", "public", "product" ), "rows", columns, rows )
+        path = writer.close()
+
+        with open_extraction(path, self.fernet) as reader:
+            self.assertEqual( reader.keys, [ ( "database", "public", "product" ) ] )
+            self.assertEqual( len(reader.chunks), 2 )
+            self.assertEqual(
+                [ row for chunk in reader.iter_chunks() for row in chunk ],
+                [ dict( zip( columns, row ) ) for row in rows ]
+            )
+
+    def test_empty_sections_are_kept(self):
+        writer = self.get_writer()
+        writer.write_rows( ( "database", "public", "product" ), "rows", [ "id", "name" ], [ ( 1, "first" ) ] )
+        writer.write_rows( ( "database", "public", "product" ), "deletions", [ "row_tracking_id" ], [] )
+        writer.write_rows( ( "database", "public", "category" ), "rows", [ "id" ], [] )
+        path = writer.close()
+
+        with open_extraction(path, self.fernet) as reader:
+            self.assertEqual( reader.keys, [ ( "database", "public", "product" ), ( "database", "public", "category" ) ] )
+            self.assertEqual( reader.get_columns( ( "database", "public", "product" ), "deletions" ), [ "row_tracking_id" ] )
+            self.assertEqual( list( reader.iter_chunks( ( "database", "public", "product" ), "deletions" ) ), [] )
+
+            self.assertEqual( reader.to_dictionary(), {
+                "database": {
+                    "public": {
+                        "product": { "rows": [ { "id": 1, "name": "first" } ], "deletions": [] },
+                        "category": { "rows": [] },
+                    }
+                }
+            } )
+
+    def test_write_cursor(self):
+        rows = [ ( position, f"name {position}" ) for position in range(7) ]
+
+        writer = self.get_writer(root_key="group")
+        writer.write_cursor( ( "product", ), "rows", FakeCursor( [ "id", "name" ], rows ), batch_size=3 )
+        writer.write_cursor( ( "product", ), "deletions", FakeCursor( [ "row_tracking_id" ], [] ), batch_size=3 )
+        path = writer.close()
+
+        with open_extraction(path, self.fernet) as reader:
+            self.assertEqual( reader.to_dictionary(), {
+                "group": {
+                    "product": {
+                        "rows": [ { "id": position, "name": name } for position, name in rows ],
+                        "deletions": [],
+                    }
+                }
+            } )
+
+    def test_parts_with_mixed_codecs(self):
+        # the codec of each part is read from its header, whatever EXTRACTION_COMPRESSION is now
+        paths = []
+
+        for part, codec in enumerate( [ "none", "deflate", "lzma" ] ):
+            writer = self.get_writer(name=f"part-{part}", root_key="group", codec=codec)
+            writer.write_rows( ( "product", ), "rows", [ "id", "codec" ], [ ( part, codec ) ] )
+            writer.write_rows( ( "product", ), "deleted_rows", [ "row_tracking_id" ], [] )
+            paths.append( writer.close() )
+
+        with open_extraction_parts(paths, self.fernet) as reader:
+            self.assertEqual( [ part_reader.codec for part_reader in reader.readers ], [ "none", "deflate", "lzma" ] )
+            self.assertEqual( reader.keys, [ ( "product", ) ] )
+            self.assertEqual( reader.to_dictionary(), {
+                "group": {
+                    "product": {
+                        "rows": [ { "id": 0, "codec": "none" }, { "id": 1, "codec": "deflate" }, { "id": 2, "codec": "lzma" } ],
+                        "deleted_rows": [],
+                    }
+                }
+            } )
+
+class DecodedExtractionCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_size_of_the_decoded_columns(self):
+        columns = [ [ "a" * 1000, "b" * 1000 ], [ 1, 2 ] ]
+        cache = DecodedExtractionCache( 10 * 1024 * 1024 )
+
+        cache.put( "chunk", columns, b'{"values": []}' )
+
+        # the cache counts the memory taken by the decoded values, not the length of the payload
+        self.assertEqual( cache.size, get_decoded_size(columns) )
+        self.assertGreater( cache.size, 2000 )
+
+    def test_evicted_chunks_are_spilled_encrypted(self):
+        payload = b'{"values": [["secret value"]]}'
+        columns = [ [ "secret value" ] ]
+        size = get_decoded_size(columns) + len(payload)
+
+        cache = DecodedExtractionCache( size, self.directory.name, 1024 * 1024 )
+        cache.put( "first", columns, payload )
+        cache.put( "second", columns, payload )
+
+        self.assertIsNone( cache.get("first") )
+        self.assertEqual( cache.get("second"), columns )
+
+        spilled_path = cache.spilled["first"][0]
+
+        with open(spilled_path, "rb") as file:
+            self.assertNotIn( b"secret value", file.read() )
+
+        self.assertEqual( cache.get_spilled("first"), payload )
+
+        cache.clear()
+        self.assertFalse( os.path.exists(spilled_path) )
@@ -1,11 +1,10 @@
 import json
 import logging
-import zipfile
 import psycopg
 import pyodbc
 import re
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 
 from django.db.models import Q
 from django.utils import timezone
@@ -19,11 +18,13 @@ from rest_framework.serializers import ValidationError
 from common.permissions import IsStaff
 
 from flux import serializers
+from flux.archives import open_extraction_parts
 from groups.models import Group, GroupExtraction
 
 from . import models
 from .serializers import SynchronizationSerializer
 
+from core.exceptions import CorruptExtractionArchive
 from core.functions import (decrypt, get_create_temporary_table_query, get_dbms_booleans, 
 get_temporary_table_name, get_type_and_precision, get_column_dictionary, synchronize_database)
 
@@ -54,9 +55,11 @@ class ExtractionViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         object = self.get_object()
 
-        file: models.File = object.file
+        # the files of all the parts are deleted, the parts protect their files so they go first
+        files = [ file for file in object.get_files() if file ]
+        object.parts.all().delete()
 
-        if file:
+        for file in files:
             file.file.delete()
             file.delete()
 
@@ -81,24 +84,18 @@ class ExtractionViewSet(viewsets.ModelViewSet):
             group: Group = group_extraction_query.group
             f = Fernet(group.get_fernet_key())
 
-        file_path = object.file.file.path
-        file = object.file
+        file_paths = object.get_file_paths()
 
         try:
-            file_content = None
-            zip_file = zipfile.ZipFile(file_path)
+            with open_extraction_parts(file_paths, f) as reader:
+                logging.debug("[In flux.views.ExtractionViewSet.content] reading the extraction file")
+                file_content = reader.to_dictionary() if not reader.is_empty else None
 
-            for file in zip_file.namelist():
-                if file.endswith('.json'):
-                    file_content = zip_file.read(file)
-                    
-                    if file_content:
-                        file_content = f.decrypt(file_content).decode('utf-8')
-                        logging.debug("[In flux.views.SynchronizationViewSet.create] reading the unapplied synchronization file")
-
-            zip_file.close()
-            return Response( data={'content': json.loads(file_content), 
+            return Response( data={'content': file_content, 
             'message': _('Content gotten successfully') if file_content else _('The extraction is empty')} )
+        except (CorruptExtractionArchive, InvalidToken) as e:
+            return Response(data={'message': _("The file could not be read. It is either corrupted or was not encrypted with this key")}, 
+            status=status.HTTP_400_BAD_REQUEST)
         except FileNotFoundError as e:
             return Response(data={'message': _("The file was not found. It has either been deleted, moved or renamed")}, 
             status=status.HTTP_404_NOT_FOUND)
@@ -142,7 +139,8 @@ class SynchronizationViewSet(viewsets.ModelViewSet):
                     if connection:
                         cursor = connection.cursor()
                         
-                        unapplied_extractions = database_record.extractiontargetdatabase_set.filter(is_applied=False)
+                        # extractions still being made are applied once all their parts are saved
+                        unapplied_extractions = database_record.extractiontargetdatabase_set.filter(is_applied=False, extraction__is_complete=True)
 
                         time_applied = timezone.now()
 
@@ -153,24 +151,17 @@ class SynchronizationViewSet(viewsets.ModelViewSet):
                             file = extraction.extraction.file
 
                             try:
-                                zip_file = zipfile.ZipFile(file_path)
-
-                                for file in zip_file.namelist():
-                                    if file.endswith('.json'):
-                                        content = zip_file.read(file)
-                                        content = f.decrypt( bytes(content, 'utf-8') )
-                                        content = content.decode('utf-8')
-
-                                        logging.debug("[In flux.views.SynchronizationViewSet.create] reading the unapplied synchronization file")
-                                        
-                                        try:
-                                            dictionary: dict = json.loads(content)
-                                            synchronize_database(connection, database, dictionary)
-
-                                        except json.JSONDecodeError as e:
-                                            logging.error( f"[In flux.views.SynchronizationViewSet.create]. Error parsing json from file for database synchronization. File path: {file_path}" )
-
-                                zip_file.close()
+                                with open_extraction_parts(
+                                    extraction.extraction.get_file_paths(), f, cache_keys=extraction.extraction.get_file_hashes()
+                                ) as reader:
+                                    logging.debug("[In flux.views.SynchronizationViewSet.create] reading the unapplied synchronization file")
+                                    synchronize_database(connection, database_record, reader)
+
+                            except json.JSONDecodeError as e:
+                                logging.error( f"[In flux.views.SynchronizationViewSet.create]. Error parsing json from file for database synchronization. File path: {file_path}" )
+                            except (CorruptExtractionArchive, InvalidToken) as e:
+                                flag = False
+                                logging.error( f"[In flux.views.SynchronizationViewSet.create]. Error reading the file for database synchronization. File path: {file_path}. Error: {str(e)}" )
                             except FileNotFoundError as e:
                                 flag = False
                                 logging.error( f"[In flux.views.SynchronizationViewSet.create]. Error opening file for database synchronization. File path: {file_path}" )
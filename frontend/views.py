@@ -23,6 +23,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from core.functions import ( get_database_connection, initialize_database )
+from core.health import get_database_health
 
 from ferdolt import models as ferdolt_models
 from ferdolt import tasks as ferdolt_tasks
@@ -282,15 +283,20 @@ def databases(request, id: int=None):
             extractions = flux_models.ExtractionSourceDatabase.objects.filter(
                 database=database
             ).distinct()
+            # a database whose circuit is open isn't connected to, the page shows its cached status instead
             try:
                 connection = get_database_connection(database)
             except (pyodbc.OperationalError, psycopg.OperationalError) as e:
                 logging.error(f"Error connecting the {database.__str__()} database. Error: {str(e)}")
                 connection = None
 
+            if connection:
+                connection.close()
+
             context['database'] = database
             context['pending_synchronizations'] = pending_synchronizations
-            context['connection'] = connection
+            context['connection'] = connection is not None
+            context['health'] = get_database_health(database.id)
             context['synchronizations'] = database_synchronizations
             context['extractions'] = extractions
 
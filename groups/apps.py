@@ -1,6 +1,10 @@
-from django.apps import AppConfig
-
-
-class GroupsConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'groups'
+from django.apps import AppConfig
+
+
+class GroupsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'groups'
+
+    def ready(self):
+        # connects the receivers invalidating the extraction plans
+        from groups import signals
@@ -0,0 +1,217 @@
+"""
+Asynchronous extraction and synchronization of group databases, to work on many group databases from one event loop.
+
+Extractions read the source databases through core.asynchronous, the ORM records and the archives are written from threads.
+The application of extractions is done by the blocking engine (groups.functions.synchronize_group_database),
+run in a thread for each database being synchronized.
+"""
+import asyncio
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from cryptography.fernet import Fernet
+
+from django import db
+from django.db.models import Q
+from django.utils import timezone
+
+import psycopg
+import pyodbc
+
+from core.asynchronous import connect
+from core.health import is_circuit_open
+from ferdolt_web import settings
+from groups.plans import get_extraction_plan
+
+from . import models
+from .functions import (
+    GroupExtractionParts, build_extraction_jobs, get_interrupted_extraction, get_probe_queries, get_probed_tables, get_resume_state, 
+    get_watermarks, read_resume_state, synchronize_group_database
+)
+
+async def probe_latest_times_async(connection, tables_and_columns: list) -> dict:
+    """
+    Asynchronous variant of groups.functions.probe_latest_times
+    """
+    latest_times = {}
+
+    for batch, query in get_probe_queries(tables_and_columns):
+        try:
+            _, rows = await connection.execute(query)
+        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+            logging.error(f"Error occured when reading the latest changes of the tables { ', '.join( [ table_query_name for _, table_query_name, _ in batch ] ) }. Error: {str(e)}")
+            raise e
+
+        latest_times.update( { table_id: value for ( table_id, _, _ ), value in zip(batch, rows[0]) } )
+
+    return latest_times
+
+async def run_extraction_job_async(connection, writer, part: int, job, start_key=None, on_page=None):
+    """
+    Asynchronous variant of groups.functions.run_extraction_job, on_page being a coroutine function
+    """
+    keys, kind, query, parameters, cursor_name, key_column, next_page_query = job
+
+    if not key_column:
+        try:
+            async for columns, rows in connection.stream(query, parameters, batch_size=settings.EXTRACTION_BATCH_SIZE, name=cursor_name):
+                # the rows are compressed and encrypted outside of the event loop
+                await asyncio.to_thread( writer.write_rows, keys, kind, columns, rows, part=part )
+        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+            logging.error(f"Error occured when extracting the {kind} of the {keys[0]} table. Error: {str(e)}. Query: {query}")
+            raise e
+
+        return
+
+    last_key = start_key
+
+    while True:
+        try:
+            if last_key is not None:
+                columns, rows = await connection.execute(next_page_query, [ *parameters, last_key ])
+            else:
+                columns, rows = await connection.execute(query, parameters)
+        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+            logging.error(f"Error occured when extracting the {kind} of the {keys[0]} table. Error: {str(e)}. Query: {query if last_key is None else next_page_query}")
+            raise e
+
+        if not rows:
+            break
+
+        await asyncio.to_thread( writer.write_rows, keys, kind, columns, rows, part=part )
+
+        key_position = [ column.lower() for column in columns ].index( key_column.lower() )
+        last_key = rows[-1][key_position]
+
+        if on_page:
+            await on_page(last_key)
+
+def get_extraction_records(group_database: models.GroupDatabase, target_databases=None):
+    """
+    Returns the records an extraction of a group database needs: its plan, its watermarks,
+    the interrupted extraction to resume (if any) and the target databases
+    """
+    if not target_databases:
+        target_databases = group_database.group.groupdatabase_set.filter(Q(can_read=True) & ~Q(id=group_database.id))
+
+    return get_extraction_plan(group_database), get_watermarks(group_database), get_interrupted_extraction(group_database), list(target_databases)
+
+async def extract_from_groupdatabase_async(
+    group_database: models.GroupDatabase,
+    use_time=True,
+    start_time=None, target_databases=None
+):
+    """
+    Asynchronous variant of groups.functions.extract_from_groupdatabase.
+    The group database must have been read with its group and its database's dbms (see get_group_databases)
+    """
+    f = Fernet(group_database.group.get_fernet_key())
+    time_made = timezone.now()
+
+    connection = await connect(group_database.database)
+
+    if not connection:
+        return None
+
+    try:
+        plan, watermarks, interrupted_extraction, target_databases = await sync_to_async(get_extraction_records)(group_database, target_databases)
+
+        if interrupted_extraction:
+            jobs, watermarks, start_job, start_key = read_resume_state(interrupted_extraction.resume_state)
+            logging.info(f"Resuming the extraction {interrupted_extraction.extraction.id} of the {group_database.database} database from query {start_job}")
+        else:
+            latest_times = await probe_latest_times_async( connection, get_probed_tables(plan) )
+            jobs, watermarks = build_extraction_jobs(plan, watermarks, latest_times, start_time, use_time, connection.dbms_booleans)
+            start_job, start_key = 0, None
+
+        if not jobs:
+            logging.info(f"There were no changes to extract from the {group_database.database} database")
+            return None
+
+        base_file_name = os.path.join( settings.BASE_DIR, settings.MEDIA_ROOT,
+        "extractions", f"{timezone.now().strftime('%Y%m%d%H%M%S')}")
+
+        parts = await sync_to_async(GroupExtractionParts)(
+            group_database, f, base_file_name, start_time, time_made, target_databases,
+            group_extraction=interrupted_extraction
+        )
+
+        try:
+            for part, job in enumerate(jobs):
+                if part < start_job:
+                    continue
+
+                async def save_full_part(last_key):
+                    if parts.is_full:
+                        await sync_to_async(parts.save_part)( get_resume_state(jobs, watermarks, part, last_key) )
+
+                await run_extraction_job_async(
+                    connection, parts, part, job,
+                    start_key=start_key if part == start_job else None, on_page=save_full_part
+                )
+
+                if parts.is_full and part + 1 < len(jobs):
+                    await sync_to_async(parts.save_part)( get_resume_state(jobs, watermarks, part + 1, None) )
+
+            await sync_to_async(parts.save_part)(watermarks=watermarks)
+        except Exception as e:
+            # the parts already saved are kept, the extraction resumes after them next time
+            await asyncio.to_thread(parts.discard)
+            raise e
+
+        return parts.group_extraction
+    finally:
+        await connection.rollback()
+        await connection.close()
+
+async def synchronize_group_database_async(group_database: models.GroupDatabase, use_primary_keys_for_verification=False):
+    """
+    Runs groups.functions.synchronize_group_database in a thread of its own
+    """
+    def synchronize():
+        try:
+            return synchronize_group_database(group_database, use_primary_keys_for_verification)
+        finally:
+            # the thread's connection to the django database is closed with the thread
+            db.connections.close_all()
+
+    return await sync_to_async(synchronize, thread_sensitive=False)()
+
+def get_group_databases(group_database_ids=None) -> list:
+    """
+    Returns the group databases (all of them by default) whose database's circuit isn't open,
+    with the records the asynchronous functions use
+    """
+    query = models.GroupDatabase.objects.select_related("group", "database__dbms_version__dbms")
+
+    if group_database_ids is not None:
+        query = query.filter(id__in=group_database_ids)
+
+    return [ group_database for group_database in query if not is_circuit_open(group_database.database_id) ]
+
+async def run_on_group_databases(function, group_database_ids=None, concurrency=None) -> dict:
+    """
+    Runs the coroutine function on the group databases, on up to concurrency (GROUP_TASKS_ASYNC_CONCURRENCY by default) of them at the same time.
+    Returns the result of each group database, indexed by its id
+    """
+    semaphore = asyncio.Semaphore( concurrency or settings.GROUP_TASKS_ASYNC_CONCURRENCY )
+    group_databases = await sync_to_async(get_group_databases)(group_database_ids)
+
+    async def run(group_database):
+        async with semaphore:
+            try:
+                return { "database": str(group_database.database), "result": await function(group_database), "error": None }
+            except Exception as e:
+                logging.error(f"[In groups.asynchronous.run_on_group_databases]. Error running {function.__name__} on the {group_database.database} database. Error: {str(e)}")
+                return { "database": str(group_database.database), "result": None, "error": str(e) }
+
+    results = await asyncio.gather( *[ run(group_database) for group_database in group_databases ] )
+
+    return { group_database.id: result for group_database, result in zip(group_databases, results) }
+
+async def extract_from_group_databases(group_database_ids=None, concurrency=None) -> dict:
+    return await run_on_group_databases(extract_from_groupdatabase_async, group_database_ids, concurrency)
+
+async def synchronize_group_databases(group_database_ids=None, concurrency=None) -> dict:
+    return await run_on_group_databases(synchronize_group_database_async, group_database_ids, concurrency)
@@ -1,224 +1,1215 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import datetime as dt
 from hashlib import sha256
+from itertools import groupby
 import json
 import logging
 import os
+import queue
 from time import sleep
 import zipfile
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 
 from django.core.files import File as DjangoFile
+from django import db
 from django.db import transaction
-from django.db.models import F, Q
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 import psycopg
 import pyodbc
 from common.functions import hash_file
 
+from core.exceptions import CorruptExtractionArchive
+
 from core.functions import (
-    custom_converter, get_column_dictionary, get_create_temporary_table_query, 
-    get_database_connection, get_dbms_booleans, get_temporary_table_name, 
+    bulk_insert_rows, custom_converter, fetch_in_batches, get_column_dictionary, get_create_temporary_table_query, 
+    get_database_connection, get_dbms_booleans, get_sqlserver_input_sizes, get_streaming_cursor, get_temporary_table_name, 
     get_type_and_precision, deletion_table_regex, get_query_placeholder, initialize_database
 )
 
 from ferdolt import models as ferdolt_models
 from ferdolt_web import settings
+from flux.archives import ExtractionWriter, decode_value, encode_value, open_extraction
 from flux.models import File
 from flux import models as flux_models
 from groups import serializers
+from groups.plans import get_extraction_plan
 
 from . import models
 
+# number of tables whose latest change is read by a single query
+PROBE_BATCH_SIZE = 100
+
+def get_watermarks(group_database: models.GroupDatabase) -> dict:
+    return {
+        watermark.table_id: watermark.get_value() 
+        for watermark in models.GroupDatabaseTableWatermark.objects.filter(group_database=group_database)
+    }
+
+def save_watermarks(group_database: models.GroupDatabase, watermarks: dict):
+    """
+    Records the latest time values extracted from the tables of a group database, watermarks maps table ids to those values
+    """
+    for table_id, value in watermarks.items():
+        models.GroupDatabaseTableWatermark.objects.update_or_create(
+            group_database=group_database, table_id=table_id, 
+            defaults={ 'value': value.isoformat() if hasattr(value, 'isoformat') else str(value) }
+        )
+
+def get_probe_queries(tables_and_columns: list):
+    """
+    Yields the batches of PROBE_BATCH_SIZE ( table id, table query name, time column ) tuples and the query reading their latest times
+    """
+    for start in range( 0, len(tables_and_columns), PROBE_BATCH_SIZE ):
+        batch = tables_and_columns[ start:start + PROBE_BATCH_SIZE ]
+
+        query = f"""
+        SELECT { ', '.join( [ f"(SELECT MAX({column}) FROM {table_query_name})" for _, table_query_name, column in batch ] ) }
+        """
+
+        yield batch, query
+
+def probe_latest_times(cursor, tables_and_columns: list) -> dict:
+    """
+    Reads the latest value of the time column of every ( table id, table query name, time column ) tuple, 
+    batching the MAX() subqueries of PROBE_BATCH_SIZE tables in one query. Returns a dictionary mapping table ids to those values
+    """
+    latest_times = {}
+
+    for batch, query in get_probe_queries(tables_and_columns):
+        try:
+            cursor.execute(query)
+            row = cursor.fetchone()
+        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+            logging.error(f"Error occured when reading the latest changes of the tables { ', '.join( [ table_query_name for _, table_query_name, _ in batch ] ) }. Error: {str(e)}")
+            raise e
+
+        latest_times.update( { table_id: value for ( table_id, _, _ ), value in zip(batch, row) } )
+
+    return latest_times
+
+def get_extraction_window(time_column, upper_bound, start_time, use_time, watermark, query_placeholder, overlap=None):
+    """
+    Returns the condition (and its parameters) selecting the rows of a table changed since the last extraction 
+    along with the new watermark of the table, upper_bound being the latest value of the table's time column in the source database.
+    The condition is None if no row changed since the last extraction.
+
+    The rows changed up to overlap (EXTRACTION_WATERMARK_OVERLAP by default) seconds before the watermark are read again, 
+    so that rows committed after a later change was extracted (their time being set before their commit) are not skipped. 
+    The rows read twice are merged again without being changed
+    """
+    overlap = settings.EXTRACTION_WATERMARK_OVERLAP if overlap is None else overlap
+
+    if not use_time:
+        return "", [], upper_bound
+
+    if upper_bound is None:
+        return None, [], None
+
+    conditions, parameters = [], []
+
+    if start_time:
+        conditions.append(f"{time_column} >= {query_placeholder}")
+        parameters.append(start_time)
+    elif watermark is not None:
+        try:
+            if upper_bound <= watermark:
+                return None, [], watermark
+        except TypeError:
+            # the watermark and the column's values can't be compared e.g. a date and a datetime
+            pass
+
+        lower_bound = watermark
+
+        if overlap:
+            try:
+                lower_bound = watermark - dt.timedelta(seconds=overlap)
+            except TypeError:
+                # the watermark isn't a time e.g. a counter
+                pass
+
+        conditions.append(f"{time_column} > {query_placeholder}")
+        parameters.append(lower_bound)
+
+    # rows changed while the extraction runs are left for the next extraction
+    if start_time or watermark is not None:
+        conditions.append(f"{time_column} <= {query_placeholder}")
+    else:
+        # the first extraction of a table also takes the rows that were never given a time
+        conditions.append(f"( {time_column} <= {query_placeholder} OR {time_column} IS NULL )")
+
+    parameters.append(upper_bound)
+
+    return f" WHERE { ' AND '.join(conditions) }", parameters, upper_bound
+
+def get_page_queries(select_query, condition, key_column, dbms_booleans, query_placeholder):
+    """
+    Returns the queries reading the first page and the next pages (after a given key) of a table's rows, in the order of key_column
+    """
+    page_size = settings.EXTRACTION_PAGE_SIZE
+
+    if dbms_booleans['is_sqlserver_db']:
+        select_query = select_query.replace("SELECT ", f"SELECT TOP {page_size} ", 1)
+        limit = ""
+    else:
+        limit = f" LIMIT {page_size}"
+
+    first_page_query = f"{select_query}{condition} ORDER BY {key_column}{limit}"
+    next_page_query = f"{select_query}{ f'{condition} AND' if condition else ' WHERE' } {key_column} > {query_placeholder} ORDER BY {key_column}{limit}"
+
+    return first_page_query, next_page_query
+
+def get_extraction_jobs(connection, group_database: models.GroupDatabase, start_time, use_time, dbms_booleans):
+    """
+    Returns the queries to run to extract the group's tables from a group database as
+    ( keys, kind, query, parameters, cursor name, key column, next page query ) lists in the order their rows are written to the extraction,
+    and the watermarks that changed, to record once the extraction is saved.
+    Tables with no rows changed since their watermark are left out. 
+    Tables with a key column are read page by page, the others with a single query
+    """
+    # the tables, queries and time columns don't have to be read from the ORM at every extraction
+    plan = get_extraction_plan(group_database)
+
+    watermarks = get_watermarks(group_database)
+
+    # the latest changes of all the tables are read with a single query before extracting anything
+    cursor = connection.cursor()
+    latest_times = probe_latest_times( cursor, get_probed_tables(plan) )
+    cursor.close()
+
+    return build_extraction_jobs(plan, watermarks, latest_times, start_time, use_time, dbms_booleans)
+
+def get_probed_tables(plan) -> list:
+    return [ ( table_id, table_query_name, time_column ) for _, _, table_id, table_query_name, _, time_column, _ in plan if time_column ]
+
+def build_extraction_jobs(plan, watermarks: dict, latest_times: dict, start_time, use_time, dbms_booleans):
+    """
+    Returns the extraction jobs of an extraction plan and the watermarks that changed (see get_extraction_jobs), 
+    latest_times holding the latest value of the time column of each table
+    """
+    query_placeholder = get_query_placeholder(**dbms_booleans)
+
+    jobs = []
+    new_watermarks = {}
+
+    for keys, kind, table_id, _, select_query, time_column, key_column in plan:
+        condition, parameters = "", []
+
+        if time_column:
+            condition, parameters, new_watermark = get_extraction_window(
+                time_column, latest_times[table_id], start_time, use_time, watermarks.get(table_id), query_placeholder
+            )
+
+            if new_watermark is not None and new_watermark != watermarks.get(table_id):
+                new_watermarks[table_id] = new_watermark
+
+        if condition is None:
+            continue
+
+        if key_column:
+            query, next_page_query = get_page_queries(select_query, condition, key_column, dbms_booleans, query_placeholder)
+        else:
+            query, next_page_query = f"{select_query}{condition}", None
+
+        jobs.append( [ list(keys), kind, query, parameters, f"ferdolt_extraction_{table_id}", key_column, next_page_query ] )
+
+    return jobs, new_watermarks
+
+def run_extraction_job(connection, writer, part: int, job, start_key=None, on_page=None):
+    """
+    Runs one extraction query and writes its rows to the extraction batch by batch. 
+    Paginated jobs are read from start_key onward and on_page is called with the last key of every page written
+    """
+    keys, kind, query, parameters, cursor_name, key_column, next_page_query = job
+
+    if not key_column:
+        # a server-side cursor is used so that postgres sends the rows in batches
+        cursor = get_streaming_cursor(connection, cursor_name)
+
+        try:
+            if parameters:
+                cursor.execute(query, parameters)
+            else:
+                cursor.execute(query)
+
+            columns = [ column[0] for column in cursor.description ]
+            
+            for rows in fetch_in_batches(cursor, settings.EXTRACTION_BATCH_SIZE):
+                writer.write_rows( keys, kind, columns, rows, part=part )
+
+        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+            logging.error(f"Error occured when extracting the {kind} of the {keys[0]} table. Error: {str(e)}. Query: {query}")
+            raise e
+        finally:
+            cursor.close()
+
+        return
+
+    last_key = start_key
+
+    while True:
+        cursor = connection.cursor()
+
+        try:
+            if last_key is not None:
+                cursor.execute(next_page_query, [ *parameters, last_key ])
+            elif parameters:
+                cursor.execute(query, parameters)
+            else:
+                cursor.execute(query)
+
+            columns = [ column[0] for column in cursor.description ]
+            rows = cursor.fetchall()
+
+        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+            logging.error(f"Error occured when extracting the {kind} of the {keys[0]} table. Error: {str(e)}. Query: {query if last_key is None else next_page_query}")
+            raise e
+        finally:
+            cursor.close()
+
+        if not rows:
+            break
+
+        writer.write_rows( keys, kind, columns, rows, part=part )
+
+        key_position = [ column.lower() for column in columns ].index( key_column.lower() )
+        last_key = rows[-1][key_position]
+
+        if on_page:
+            on_page(last_key)
+
+def run_extraction_jobs_in_parallel(database, connection, writer, jobs: list, workers: int, start_job=0, start_key=None, on_window_done=None):
+    """
+    Runs the extraction jobs from start_job onward (the first one from start_key) over a pool of at most workers threads, 
+    each thread using its own connection to the source database. The jobs are run a window of one job per thread at a time 
+    and on_window_done is called with the position of the next job once a window is written, when no job is writing to the extraction.
+    The chunks of a job are numbered after the job's position, so the extraction is the same whatever order the jobs finish in
+    """
+    # the connections are opened here as opening them needs the ORM, which the workers don't use
+    connections = queue.Queue()
+    connections.put(connection)
+    worker_connections = []
+
+    for _ in range( min(workers, len(jobs) - start_job) - 1 ):
+        worker_connection = get_database_connection(database)
+
+        if not worker_connection:
+            break
+
+        worker_connections.append(worker_connection)
+        connections.put(worker_connection)
+
+    def run(part, job, job_start_key):
+        job_connection = connections.get()
+
+        try:
+            run_extraction_job(job_connection, writer, part, job, start_key=job_start_key)
+        finally:
+            connections.put(job_connection)
+
+    window_size = len(worker_connections) + 1
+
+    try:
+        with ThreadPoolExecutor( max_workers=window_size ) as executor:
+            for window_start in range(start_job, len(jobs), window_size):
+                window_end = min( window_start + window_size, len(jobs) )
+                futures = [ 
+                    executor.submit( run, part, jobs[part], start_key if part == start_job else None ) 
+                    for part in range(window_start, window_end) 
+                ]
+
+                for future in futures:
+                    # raises the exception of a failed job
+                    future.result()
+
+                if on_window_done:
+                    on_window_done(window_end)
+    finally:
+        for worker_connection in worker_connections:
+            worker_connection.close()
+
+def get_resume_state(jobs, watermarks, job_index, last_key) -> dict:
+    """
+    Returns what's needed to resume an extraction from the job_index job (after last_key if it is paginated) as json
+    """
+    return {
+        "jobs": [ [ *job[:3], [ encode_value(parameter) for parameter in job[3] ], *job[4:] ] for job in jobs ],
+        "watermarks": { table_id: encode_value(value) for table_id, value in watermarks.items() },
+        "job": job_index,
+        "last_key": encode_value(last_key),
+    }
+
+def get_interrupted_extraction(group_database: models.GroupDatabase):
+    """
+    Returns the interrupted extraction of a group database to resume, if there is one, after counting the attempt in its resume_state.
+    An extraction resumed EXTRACTION_RESUME_ATTEMPTS times without saving a new part is marked as failed instead, 
+    the next extraction then starts again from the watermarks, which are only saved once an extraction is complete
+    """
+    interrupted_extraction = models.GroupExtraction.objects.filter(
+        source_database=group_database, extraction__is_complete=False, is_failed=False, resume_state__isnull=False
+    ).select_related("extraction").order_by("-extraction__time_made").first()
+
+    if not interrupted_extraction:
+        return None
+
+    # the attempts are reset by get_resume_state when a new part is saved
+    attempts = interrupted_extraction.resume_state.get("attempts", 0) + 1
+
+    if attempts > settings.EXTRACTION_RESUME_ATTEMPTS:
+        logging.error(f"The extraction {interrupted_extraction.extraction.id} of the {group_database.database} database failed to be resumed {attempts - 1} times, marking it as failed")
+        interrupted_extraction.is_failed = True
+        interrupted_extraction.save()
+
+        return None
+
+    interrupted_extraction.resume_state["attempts"] = attempts
+    interrupted_extraction.save()
+
+    return interrupted_extraction
+
+def read_resume_state(resume_state: dict):
+    jobs = [ [ *job[:3], [ decode_value(parameter) for parameter in job[3] ], *job[4:] ] for job in resume_state["jobs"] ]
+    watermarks = { int(table_id): decode_value(value) for table_id, value in resume_state["watermarks"].items() }
+
+    return jobs, watermarks, resume_state["job"], decode_value( resume_state["last_key"] )
+
+class GroupExtractionParts:
+    """
+    Writes the extraction of a group database as a series of part files under one Extraction.
+    A part is saved, with the records needed to apply it, as soon as it is full, 
+    so target databases can apply it while the next parts are still being extracted
+    """
+    def __init__(self, group_database: models.GroupDatabase, fernet, base_file_name, start_time, time_made, target_databases, group_extraction=None):
+        self.group_database = group_database
+        self.fernet = fernet
+        self.base_file_name = base_file_name
+        self.start_time = start_time
+        self.time_made = time_made
+        self.target_databases = target_databases
+
+        self.group_extraction = group_extraction
+        self.part_number = group_extraction.extraction.parts.count() if group_extraction else 0
+
+        self.writer = self.get_writer()
+
+    def get_writer(self):
+        # the extracted rows are written to disk batch by batch instead of being accumulated in memory
+        return ExtractionWriter( f"{self.base_file_name}_{self.part_number}", self.group_database.group.slug, self.fernet )
+
+    def write_rows(self, keys, kind, columns, rows, part=0):
+        self.writer.write_rows( keys, kind, columns, rows, part=part )
+
+    @property
+    def is_full(self) -> bool:
+        return self.writer.row_count >= settings.EXTRACTION_PART_ROWS
+
+    def discard(self):
+        self.writer.discard()
+
+    @transaction.atomic
+    def save_part(self, resume_state=None, watermarks=None):
+        """
+        Saves the current part of the extraction, the extraction is complete if there is no resume_state
+        """
+        if self.writer.is_empty:
+            self.writer.discard()
+        else:
+            logging.info(f"Saving part {self.part_number} of the extraction. The data's keys are: {self.writer.keys}")
+
+            archive_file_name = self.writer.close()
+
+            with open( archive_file_name, "rb" ) as __:
+                file = File.objects.create( 
+                    file=DjangoFile( __, name=os.path.basename(archive_file_name) ), 
+                    size=os.path.getsize(archive_file_name), is_deleted=False, 
+                    hash=hash_file(archive_file_name)
+                )
+
+            if not self.group_extraction:
+                self.create_extraction_records(file)
+
+            flux_models.ExtractionPart.objects.create(
+                extraction=self.group_extraction.extraction, number=self.part_number, 
+                file=file, row_count=self.writer.row_count
+            )
+
+            # the archive has been copied to the storage by the File record
+            os.unlink( archive_file_name )
+
+            self.part_number += 1
+
+        if self.group_extraction:
+            self.group_extraction.resume_state = resume_state
+            self.group_extraction.save()
+
+            if not resume_state:
+                self.group_extraction.extraction.is_complete = True
+                self.group_extraction.extraction.save()
+
+        if not resume_state:
+            save_watermarks(self.group_database, watermarks or {})
+        else:
+            self.writer = self.get_writer()
+
+    def create_extraction_records(self, file):
+        extraction = models.Extraction.objects.create(
+            file=file, 
+            start_time=self.start_time, 
+            time_made=self.time_made,
+            is_complete=False
+        )
+
+        self.group_extraction = models.GroupExtraction.objects.create(
+            group=self.group_database.group, 
+            extraction=extraction, 
+            source_database=self.group_database
+        )
+
+        flux_models.ExtractionSourceDatabase.objects.create(
+            extraction=extraction, database=self.group_database.database
+        )
+
+        for database in self.target_databases:
+            models.GroupDatabaseSynchronization.objects.create(extraction=self.group_extraction, 
+                group_database=database, is_applied=False
+            )
+            flux_models.ExtractionTargetDatabase.objects.create(
+                extraction=extraction, database=database.database, is_applied=False
+            )
+
 def extract_from_groupdatabase(
     group_database: models.GroupDatabase, 
     use_time=True, 
-    start_time=None, target_databases=None
+    start_time=None, target_databases=None, connection=None
 ):
+    """
+    Extracts the rows of the group's tables from a group database to compressed and encrypted archives 
+    and records a synchronization for every target database. Returns the GroupExtraction created, or None if there was nothing to extract
+
+    If use_time is True, the rows changed since start_time are extracted or, without a start_time, the rows changed since the last extraction of each table.
+    Large extractions are split in parts of EXTRACTION_PART_ROWS rows, an interrupted extraction is resumed from its last saved part 
+    (see get_interrupted_extraction)
+    """
     group: models.Group = group_database.group
     f = Fernet(group.get_fernet_key())
 
-    if use_time:
-        if not start_time:
-            latest_extraction = (
-                models.GroupExtraction.objects
-                .order_by('-extraction__time_made')
-                .annotate(time_made=F('extraction__time_made')).first()
-            )
-
-            if latest_extraction:
-                start_time = latest_extraction.time_made
-                print(f"Extracting records updated after: {latest_extraction.time_made}")
-    
     time_made = timezone.now()
 
-    results = {}
-
     if not target_databases:
         target_databases = group.groupdatabase_set.filter(Q(can_read=True) & ~Q(id=group_database.id))
 
-    group_dictionary = results.setdefault( group.slug, {} )
+    # the connection is only closed here if it was opened here
+    close_connection = connection is None
+
+    if connection is None:
+        connection = get_database_connection(group_database.database)
 
-    connection = get_database_connection(group_database.database)
     dbms_booleans = get_dbms_booleans(group_database.database)
 
-    query_placeholder = get_query_placeholder(**dbms_booleans)
+    group_extraction = None
+
     if connection:
-        cursor = connection.cursor()
+        interrupted_extraction = get_interrupted_extraction(group_database)
+
+        if interrupted_extraction:
+            jobs, watermarks, start_job, start_key = read_resume_state(interrupted_extraction.resume_state)
+            logging.info(f"Resuming the extraction {interrupted_extraction.extraction.id} of the {group_database.database} database from query {start_job}")
+        else:
+            # without a start_time, each table is extracted from its watermark. Tables without changes are left out
+            jobs, watermarks = get_extraction_jobs(connection, group_database, start_time, use_time, dbms_booleans)
+            start_job, start_key = 0, None
+
+        if not jobs:
+            logging.info(f"There were no changes to extract from the {group_database.database} database")
+        else:
+            base_file_name = os.path.join( settings.BASE_DIR, settings.MEDIA_ROOT, 
+            "extractions", f"{timezone.now().strftime('%Y%m%d%H%M%S')}")
+
+            parts = GroupExtractionParts(
+                group_database, f, base_file_name, start_time, time_made, target_databases, 
+                group_extraction=interrupted_extraction
+            )
 
-        with transaction.atomic():
-            for table in group.tables.all():
-                # get the tables of this database linked to the group's tables
-                actual_database_tables = ferdolt_models.Table.objects.filter( 
-                    id__in=table.grouptabletable_set.values("table__id"), 
-                    schema__database=group_database.database 
-                )
-                table_dictionary = {}
-                for item in actual_database_tables:
-                    table_results = []
-
-                    table_query_name = item.get_queryname()
-                    
-                    # get the group columns of the grouptable linked to this item's table
-                    columns_in_common = ferdolt_models.Column.objects.filter(table=item, 
-                        id__in=models.GroupColumnColumn.objects.filter( group_column__group_table=table ).values("column__id")
+            try:
+                if settings.EXTRACTION_WORKERS > 1 and len(jobs) - start_job > 1:
+                    # the jobs run concurrently, a full part is saved between two windows of jobs
+                    def save_full_window(next_job):
+                        if parts.is_full and next_job < len(jobs):
+                            parts.save_part( get_resume_state(jobs, watermarks, next_job, None) )
+
+                    run_extraction_jobs_in_parallel(
+                        group_database.database, connection, parts, jobs, settings.EXTRACTION_WORKERS, 
+                        start_job=start_job, start_key=start_key, on_window_done=save_full_window
                     )
+                else:
+                    for part, job in enumerate(jobs):
+                        if part < start_job:
+                            continue
+
+                        def save_full_part(last_key):
+                            if parts.is_full:
+                                parts.save_part( get_resume_state(jobs, watermarks, part, last_key) )
+
+                        run_extraction_job(
+                            connection, parts, part, job, 
+                            start_key=start_key if part == start_job else None, on_page=save_full_part
+                        )
 
-                    time_field = item.column_set.filter( Q( name='last_updated' ) | 
-                        Q( name='deletion_time' ) 
-                    )
+                        if parts.is_full and part + 1 < len(jobs):
+                            parts.save_part( get_resume_state(jobs, watermarks, part + 1, None) )
 
-                    query = f"""
-                    SELECT { ', '.join( [ column.name for column in columns_in_common ] ) } FROM { table_query_name } { f" WHERE { time_field.first().name } >= {query_placeholder}" if start_time and time_field.exists() and use_time else "" }
-                    """
+                parts.save_part(watermarks=watermarks)
+            except Exception as e:
+                # the parts already saved are kept, the extraction resumes after them next time
+                parts.discard()
+                raise e
 
-                    try:
-                        if start_time and time_field.exists() and use_time: 
-                            rows = cursor.execute(query, [start_time])
-                        else:
-                            rows = cursor.execute(query)
+            group_extraction = parts.group_extraction
+            
+        if close_connection:
+            connection.close()
 
-                        columns = [ column[0] for column in cursor.description ]
-                        
-                        for row in rows:
-                            row_dictionary = dict( zip( columns, row ) )
-                            table_results.append( row_dictionary )
+    return group_extraction
+
+def synchronize_group(group: models.Group, use_primary_keys_for_verification=False, workers=None) -> dict:
+    """
+    Applies the pending synchronizations of each of the group's databases, 
+    on up to workers (SYNCHRONIZATION_WORKERS by default) databases at the same time, each with its own connection.
+    Returns the result of each database, indexed by the group database's id
+    """
+    workers = workers or settings.SYNCHRONIZATION_WORKERS
+    group_databases = list( group.groupdatabase_set.select_related("database") )
+
+    def synchronize(group_database):
+        try:
+            synchronized_databases = synchronize_group_database(group_database, use_primary_keys_for_verification)
+            return { "database": str(group_database.database), "synchronized": bool(synchronized_databases), "error": None }
+        except Exception as e:
+            logging.error(f"[In groups.functions.synchronize_group]. Error synchronizing the {group_database.database} database. Error: {str(e)}")
+            return { "database": str(group_database.database), "synchronized": False, "error": str(e) }
+
+    def synchronize_in_thread(group_database):
+        try:
+            return synchronize(group_database)
+        finally:
+            # every thread gets its own connection to the django database, it is closed with the thread
+            db.connections.close_all()
+
+    if workers > 1 and len(group_databases) > 1:
+        with ThreadPoolExecutor( max_workers=min(workers, len(group_databases)) ) as executor:
+            results = list( executor.map(synchronize_in_thread, group_databases) )
+    else:
+        results = [ synchronize(group_database) for group_database in group_databases ]
+
+    return { group_database.id: result for group_database, result in zip(group_databases, results) }
+
+# types that can't be written to json as they are, tables with such columns are always loaded through a temporary table
+JSON_UNSUPPORTED_TYPES = [ 'bytea', 'binary', 'varbinary', 'image' ]
+
+def get_json_rowset(dbms_booleans, schema_name, table_name, table_columns, column_dictionaries) -> str:
+    """
+    Returns the expression unpacking a json array of rows, passed as a query parameter, to use as the source of a merge query
+    """
+    if dbms_booleans['is_sqlserver_db']:
+        # OPENJSON needs a database compatibility level of 130 or more. 
+        # datetimes are read as datetime2 as they are written with microseconds
+        definitions = [
+            get_type_and_precision(
+                column, 
+                { **column_dictionary, 'data_type': 'datetime2' } if column_dictionary['data_type'] in ['datetime', 'smalldatetime'] else column_dictionary
+            ) + f" '$.{column}'"
+            for column, column_dictionary in zip(table_columns, column_dictionaries)
+        ]
+
+        return f"OPENJSON(?) WITH ( { ', '.join(definitions) } )"
+
+    return f"json_populate_recordset(NULL::{schema_name}.{table_name}, %s::json)"
+
+def apply_group_table_rows(
+    connection, cursor, database_record, dbms_booleans, 
+    group_table_table: models.GroupTableTable, row_columns, column_batches, 
+    temporary_tables_created: set, use_primary_keys_for_verification=False
+) -> bool:
+    """
+    Loads the rows of a group table into a temporary table of the target database batch by batch, 
+    then merges the temporary table into the group table's table. Returns True if the rows were applied
+
+    With the "json" SYNCHRONIZATION_LOAD_STRATEGY, each batch is instead sent as a json array merged straight into the table, 
+    unless the table's foreign keys have to be rewritten in a temporary table first
+
+    column_batches yields ( columns, values of each column ) tuples as read from the extraction
+    """
+    successful_flag = True
+
+    table = group_table_table.table
+    table_name = table.name.lower()
+    schema_name = table.schema.name.lower()
+
+    # the column names as they were extracted, indexed by their lowercase name
+    extracted_columns = { column.lower(): column for column in row_columns }
+
+    group_table_columns = group_table_table.group_table.columns.filter(
+        name__in=extracted_columns.keys()
+    )
+    
+    table_columns = [ f.column.name.lower() for f in models.GroupColumnColumn.objects.filter( group_column__in=group_table_columns, column__table=table ) ]
+    
+    primary_key_columns = [
+        f["name"] for f in table.column_set.filter(columnconstraint__is_primary_key=True).values("name")
+    ]
 
-                        if table_results:
-                            table_dictionary.setdefault( "rows", table_results )
+    use_time = "last_updated" in extracted_columns
 
-                    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                        logging.error(f"Error occured when extracting from {group_database.database}.{item.schema.name}.{item.name}. Error: {str(e)}")
-                        raise e
+    temporary_table_name = f"{schema_name}_{table_name}_temporary_table"
+    temporary_table_actual_name = get_temporary_table_name(database_record, temporary_table_name)
 
-                    deletion_table = item.deletion_table
+    column_dictionaries = [ get_column_dictionary(table, column) for column in table_columns ]
 
-                    if deletion_table:
-                        table_deletions = []
-                        time_field = 'deletion_time'
+    create_temporary_table_query = get_create_temporary_table_query( 
+    database_record, temporary_table_name,  
+    f"( { ', '.join( [ get_type_and_precision(column, column_dictionary) for column, column_dictionary in zip(table_columns, column_dictionaries) ] ) } )" 
+    )
 
-                        query = f"""
-                        SELECT { ', '.join( [ column.name for column in deletion_table.column_set.all() ] ) } 
-                        FROM { deletion_table.get_queryname() } {f"WHERE {time_field} >= {query_placeholder}" if start_time and time_field and use_time else ""}
-                        """
+    logging.info(f"Running query to create the temporary table. Query: {create_temporary_table_query}")
 
-                        if start_time and time_field and use_time:
-                            rows = cursor.execute( query, [start_time] )  
-                        else: 
-                            rows = cursor.execute(query)
+    # SQL Server gets the rows of a batch in one round trip, with parameter types taken from the columns' metadata
+    input_sizes = get_sqlserver_input_sizes(column_dictionaries) if dbms_booleans['is_sqlserver_db'] else None
 
-                        columns = [ column[0] for column in cursor.description ]
+    # the foreign keys referencing rows by their tracking_id are rewritten in the temporary table
+    foreign_key_constraints = list( ferdolt_models.ColumnConstraint.objects.filter(
+        column__table=table, is_foreign_key=True, references_tracking_id__isnull=False, 
+        references__isnull=False
+    ) )
 
-                        for row in rows:
-                            row_dictionary = dict( zip( columns, row ) )
-                            table_deletions.append( row_dictionary )
+    use_json = ( 
+        settings.SYNCHRONIZATION_LOAD_STRATEGY == "json" and not foreign_key_constraints 
+        and ( dbms_booleans['is_postgres_db'] or dbms_booleans['is_sqlserver_db'] )
+        and not any( column_dictionary is None or column_dictionary['data_type'] in JSON_UNSUPPORTED_TYPES for column_dictionary in column_dictionaries )
+    )
 
-                        if table_results:
-                            table_dictionary.setdefault( "deleted_rows", table_deletions )
+    merge_source = get_json_rowset(dbms_booleans, schema_name, table_name, table_columns, column_dictionaries) if use_json else temporary_table_actual_name
 
-                if ( "rows" in table_dictionary and len(table_dictionary["rows"]) > 0 ) or ( "deleted_rows" in table_dictionary and len(table_dictionary["deleted_rows"]) > 0):
-                    group_dictionary.setdefault( table.name.lower(), table_dictionary )
+    try:
+        if temporary_table_actual_name not in temporary_tables_created and not use_json:
+            logging.info(f"Creating the {temporary_table_actual_name} temp table")
+            
+            cursor.execute(create_temporary_table_query)
+            temporary_tables_created.add( temporary_table_actual_name )
 
-            if group_dictionary.keys():
-                print("There was data to extract from the group database. Saving the data to a file")
-                print(f"The data's keys are: {group_dictionary.keys()}")
-                base_file_name = os.path.join( settings.BASE_DIR, settings.MEDIA_ROOT, 
-                "extractions", f"{timezone.now().strftime('%Y%m%d%H%M%S')}")
+        try:
+            # emptying the temporary table in case of previous data
+            try:
+                if not use_json:
+                    cursor.execute(f"DELETE FROM {temporary_table_actual_name}")
+            except pyodbc.ProgrammingError as e:
+                logging.error(f"Error deleting from the temporary_table {temporary_table_actual_name}. Error: {str(e)}")
+                logging.error(f"The temporary tables that have already been created are: ")
+                logging.error(temporary_tables_created)
+                successful_flag = False
 
-                file_name = base_file_name + ".json"
-                zip_file_name = base_file_name + ".zip"
+                connection.rollback()
+            
+            # the rows are inserted one batch at a time to keep memory usage flat
+            for columns, values in ( column_batches if not use_json else [] ):
+                positions = { column.lower(): position for position, column in enumerate(columns) }
 
-                group_extraction = None
+                # the rows are built by zipping the columns of the table in order
+                rows_to_insert = list( zip( *[ values[ positions[column] ] for column in table_columns ] ) )
 
-                with open(file_name, "a+") as file:
-                    # creating the json file
-                    json_string = json.dumps( results, default=custom_converter )
-                    token = f.encrypt( bytes( json_string, "utf-8" ) )
+                # postgres targets get the rows through COPY and SQL Server targets through fast_executemany instead of one INSERT per row
+                bulk_insert_rows(cursor, temporary_table_actual_name, table_columns, rows_to_insert, input_sizes=input_sizes)
 
-                    file.write( token.decode('utf-8') )
+            # modify the foreign keys in the table
+            for constraint in foreign_key_constraints:
+                column = constraint.column
+                referenced_column = constraint.references
+                referenced_table = referenced_column.table
+                tracking_id_referencing_column = constraint.references_tracking_id
 
-                with zipfile.ZipFile(zip_file_name, mode='a') as archive:
-                    # zipping the json file
-                    archive.write(file_name, os.path.basename(file_name))
-                    
-                with open( zip_file_name, "rb" ) as __:
-                    file = File.objects.create( 
-                        file=DjangoFile( __, name=os.path.basename(zip_file_name) ), 
-                        size=os.path.getsize(file_name), is_deleted=False, 
-                        hash=hash_file(zip_file_name)
-                    )
+                referenced_table_tracking_id_name = "tracking_id"
 
-                    extraction = models.Extraction.objects.create(
-                        file=file, 
-                        start_time=start_time, 
-                        time_made=time_made
-                    )
+                query = f"""
+                UPDATE {temporary_table_actual_name} SET {column.name} = subquery.{referenced_column.name} 
+                FROM ( SELECT {referenced_column.name}, {referenced_table_tracking_id_name} FROM {referenced_table.get_queryname()} ) subquery 
+                WHERE subquery.{referenced_table_tracking_id_name}={temporary_table_actual_name}.{tracking_id_referencing_column.name}
+                """
 
-                    group_extraction = models.GroupExtraction.objects.create(
-                        group=group, 
-                        extraction=extraction, 
-                        source_database=group_database
-                    )
+                try:
+                    cursor.execute(query)
+                except (psycopg.ProgrammingError, pyodbc.ProgrammingError) as e:
+                    logging.error(f"Error occured when modifying the foreign keys in the temporary table. Error: {str(e)}")
+                    logging.error(f"Query to execute: {query}")
+                    connection.rollback()
+                    successful_flag = False
 
-                    extraction_source_database = flux_models.ExtractionSourceDatabase.objects.create(
-                        extraction=extraction, database=group_database.database
-                    )
+                    raise e
 
-                    for database in target_databases:
-                        connection = get_database_connection(database.database)
+            if dbms_booleans['is_sqlserver_db']:
+                # set identity_insert on to be able to explicitly write values for identity columns
+                try:
+                    cursor.execute(f"SET IDENTITY_INSERT {schema_name}.{table_name} ON")
+                except pyodbc.ProgrammingError as e:
+                    logging.error(f"Error occured when setting identity_insert on for {schema_name}.{table_name} table")
+                    connection.rollback()
+                    successful_flag = False
+                    raise e
 
-                        # if connection:
-                        group_database_synchronization = models.GroupDatabaseSynchronization.objects.create(extraction=group_extraction, 
-                            group_database=database, is_applied=False
-                        )
-                        flux_models.ExtractionTargetDatabase.objects.create(
-                            extraction=extraction, database=database.database, is_applied=False
+            merge_query = None
+            
+            tracking_id_column = "tracking_id"
+
+            if len(primary_key_columns) == 1:
+                non_primary_key_columns_list = [ column for column in table_columns if column not in primary_key_columns ]
+                non_primary_key_columns_list_string = ', '.join(non_primary_key_columns_list)
+            else:
+                non_primary_key_columns_list_string = ', '.join( table_columns )
+
+            if not deletion_table_regex.search(table_name):
+                merge_query = ""
+
+                if dbms_booleans["is_sqlserver_db"]:
+                    merge_query = f"""
+                        merge {schema_name}.{table_name} as t USING {merge_source} AS s ON (
+                            {
+                                ' AND '.join(
+                                    [ f"t.{column}=s.{column}" for column in primary_key_columns ]
+                                ) if use_primary_keys_for_verification else f"t.{tracking_id_column}=s.{tracking_id_column}"
+                            }
                         )
+                        when matched { " and t.last_updated < s.last_updated " if use_time else ' ' } then 
+                        update set {
+                            ', '.join(
+                                [ f"{column} = s.{column}" for column in table_columns if column not in primary_key_columns ]
+                            )
+                        }
 
-                        # if connection:
+                        when not matched then 
+                            insert ( { ', '.join( [ column for column in table_columns ] ) } ) 
+                            values ( { ', '.join( [ f"s.{column}" for column in table_columns ] ) } )
+                        ;
+                    """
 
+                elif dbms_booleans['is_postgres_db']:
+                    merge_query = f"""
+                    INSERT INTO {schema_name}.{table_name} AS source ( { non_primary_key_columns_list_string } ) 
+                    (SELECT { non_primary_key_columns_list_string } FROM {merge_source}) 
+                    ON CONFLICT ( { ', '.join( [ column for column in primary_key_columns ] ) if use_primary_keys_for_verification else tracking_id_column } )
+                    DO 
+                        UPDATE SET { ', '.join( f"{column} = EXCLUDED.{column}" for column in table_columns if column not in primary_key_columns ) if use_primary_keys_for_verification else ', '.join( f"{column} = EXCLUDED.{column}" for column in table_columns if column != tracking_id_column ) } 
+                        WHERE EXCLUDED.last_updated > source.last_updated;
+                    """
+                
+            else:
+                if len(primary_key_columns) == 1:
+                    if dbms_booleans["is_sqlserver_db"]:
+                        merge_query = f"""
+                        merge {schema_name}.{table_name} as t USING {merge_source} AS s ON (
+                            {
+                                f"t.{primary_key_columns[0]} = s.row_id"
+                            }
+                        ) 
+                        when matched then 
+                        delete
+                        ;
+                        """
+                    elif dbms_booleans['is_postgres_db']:
+                        merge_query = f"""
+                        DELETE FROM {schema_name}.{table_name} WHERE { 
+                            ' AND, '.join(
+                                f"{column} IN (SELECT {column} FROM {merge_source})" 
+                                for column in primary_key_columns
+                            )
+                            }
+                        """
+                else:
+                    logging.error(f"Could not delete from {table.__str__()} table as it has a composite primary key")
+
+            try:
+                if merge_query and use_json:
+                    # one query per batch, the rows are unpacked from the json parameter by the database
+                    for columns, values in column_batches:
+                        positions = { column.lower(): position for position, column in enumerate(columns) }
+                        rows = [ 
+                            dict( zip( table_columns, row ) ) 
+                            for row in zip( *[ values[ positions[column] ] for column in table_columns ] ) 
+                        ]
+
+                        cursor.execute( merge_query, [ json.dumps(rows, default=custom_converter) ] )
+
+                    connection.commit()
+                elif merge_query: 
+                    cursor.execute(merge_query)
+                    connection.commit()
+                    logging.debug(f"Successfully synchronized {schema_name}.{table_name}")
+            except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+                logging.error(f"Error executing merge query \n{merge_query}. \nException: {str(e)}")
+                logging.error(f"The temporary tables that have been created are: {temporary_tables_created}")
+                successful_flag = False
+                connection.rollback()
 
-                os.unlink( file_name )
+            except (pyodbc.IntegrityError, psycopg.IntegrityError) as e:
+                logging.error(f"Error executing merge query\n {merge_query}. \n Exception: {str(e)}")
+                logging.error(f"The temporary tables that have been created are: {temporary_tables_created}")
+                cursor.connection.rollback()
+                successful_flag = False
             
-            connection.close()
+            if dbms_booleans['is_sqlserver_db']:
+                # set identity_insert on to be able to explicitly write values for identity columns
+                try:
+                    cursor.execute(f"SET IDENTITY_INSERT {schema_name}.{table_name} OFF")
+                except pyodbc.ProgrammingError as e:
+                    logging.error(f"Error occured when setting identity_insert off for {schema_name}.{table_name} table")
+
+        except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+            logging.error(f"Error inserting into the temporary table. Error: {str(e)}")
+            logging.error(f"Temp table creation query: {create_temporary_table_query}")
+            successful_flag = False
+            connection.rollback()
+
+    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
+        logging.error(f"Error creating the temporary table {temporary_table_actual_name}. Error: {str(e)}.\nQuery: {create_temporary_table_query}")
+        logging.error(f"Temp table creation query: {create_temporary_table_query}")
+        cursor.connection.rollback()
+        successful_flag = False
+
+    return successful_flag
+
+def apply_group_table_deletions(connection, cursor, dbms_booleans, group_table_table: models.GroupTableTable, tracking_ids) -> bool:
+    """
+    Deletes the rows of a group table's table with the given tracking ids. Returns True if the rows were deleted
+    """
+    table = group_table_table.table
+    query_placeholder = get_query_placeholder(**dbms_booleans)
+    tracking_ids = list(tracking_ids)
+
+    try:
+        # SQL Server accepts at most 2100 parameters per query
+        for start in range(0, len(tracking_ids), 1000):
+            batch = tracking_ids[start:start + 1000]
+
+            cursor.execute(
+                f"DELETE FROM {table.get_queryname()} WHERE tracking_id IN ( { ', '.join( query_placeholder for _ in batch ) } )", 
+                batch
+            )
+
+        connection.commit()
+    except (pyodbc.ProgrammingError, psycopg.ProgrammingError, pyodbc.IntegrityError, psycopg.IntegrityError) as e:
+        logging.error(f"Error deleting the deleted rows of the {table} table. Error: {str(e)}")
+        connection.rollback()
+
+        return False
+
+    return True
+
+def get_deleted_tracking_ids(reader, table_keys) -> dict:
+    """
+    Returns the deletion time of each tracking id in the deleted rows of a table of an extraction
+    """
+    deleted_tracking_ids = {}
+
+    for columns, values in reader.iter_column_chunks(table_keys, "deleted_rows"):
+        positions = { column.lower(): position for position, column in enumerate(columns) }
+
+        if "row_tracking_id" not in positions:
+            continue
+
+        deletion_times = values[ positions["deletion_time"] ] if "deletion_time" in positions else [ None ] * len( values[0] )
+
+        for tracking_id, deletion_time in zip( values[ positions["row_tracking_id"] ], deletion_times ):
+            deleted_tracking_ids[tracking_id] = deletion_time
+
+    return deleted_tracking_ids
+
+def get_comparable_time(value):
+    """
+    Returns a time of an extraction as an aware datetime. Archives decode their times to datetimes 
+    while older extraction files hold them as iso formatted strings, naive times are taken as UTC.
+    Returns None if the value can't be read as a time
+    """
+    if isinstance(value, str):
+        try:
+            value = parse_datetime(value)
+        except ValueError:
+            return None
+    elif isinstance(value, dt.date) and not isinstance(value, dt.datetime):
+        value = dt.datetime.combine(value, dt.time())
+
+    if not isinstance(value, dt.datetime):
+        return None
+
+    return value.replace(tzinfo=dt.timezone.utc) if timezone.is_naive(value) else value
+
+def is_newer(time, other_time) -> bool:
+    time, other_time = get_comparable_time(time), get_comparable_time(other_time)
+
+    # rows without a time are considered newer, as they come from a later extraction
+    if time is None or other_time is None:
+        return True
+
+    return time >= other_time
+
+class CompactedTable:
+    """
+    The newest version of each row of a table across several extractions, indexed by tracking_id, and the tracking ids deleted.
+    The rows are kept as tuples of the values of self.columns, rows read before a column was added are shorter
+    """
+    def __init__(self):
+        self.columns = []
+        self.rows = {}
+        self.deleted_tracking_ids = {}
+
+    def add_rows(self, columns, values):
+        columns = [ column.lower() for column in columns ]
+
+        for column in columns:
+            if column not in self.columns:
+                self.columns.append(column)
+
+        positions = { column: position for position, column in enumerate(columns) }
+        row_positions = [ positions.get(column) for column in self.columns ]
+
+        tracking_id_position = positions["tracking_id"]
+        last_updated_position = self.columns.index("last_updated") if "last_updated" in positions else None
+
+        for row in zip(*values):
+            tracking_id = row[tracking_id_position]
+            current_row = self.rows.get(tracking_id)
+            row = tuple( row[position] if position is not None else None for position in row_positions )
+
+            if current_row is None or last_updated_position is None or is_newer( 
+                row[last_updated_position], current_row[last_updated_position] if last_updated_position < len(current_row) else None
+            ):
+                self.rows[tracking_id] = row
+
+    def add_deletions(self, deleted_tracking_ids: dict):
+        for tracking_id, deletion_time in deleted_tracking_ids.items():
+            if tracking_id not in self.deleted_tracking_ids or is_newer( deletion_time, self.deleted_tracking_ids[tracking_id] ):
+                self.deleted_tracking_ids[tracking_id] = deletion_time
+
+    def iter_column_chunks(self, batch_size):
+        """
+        Yields the rows that are not deleted in the format of ExtractionReader.iter_column_chunks
+        """
+        rows = [ row for tracking_id, row in self.rows.items() if tracking_id not in self.deleted_tracking_ids ]
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+
+            yield self.columns, [ [ row[position] if position < len(row) else None for row in batch ] for position in range( len(self.columns) ) ]
+
+class LevelApplier:
+    """
+    Applies the tables of a database level by level (see ferdolt.models.Table.level): 
+    the tables of a level don't reference each other, so they are applied at the same time on up to workers connections, 
+    and a level only starts once the previous one is applied.
+    Every connection has its own cursor and temporary tables
+    """
+    def __init__(self, database_record, connection, cursor, temporary_tables_created: set, workers: int=1):
+        self.contexts = queue.Queue()
+        self.contexts.put( ( connection, cursor, temporary_tables_created ) )
+        self.workers = 1
+        self.worker_connections = []
+
+        for _ in range(workers - 1):
+            worker_connection = get_database_connection(database_record)
+
+            if not worker_connection:
+                break
+
+            self.worker_connections.append(worker_connection)
+            self.contexts.put( ( worker_connection, worker_connection.cursor(), set([]) ) )
+
+        self.workers += len(self.worker_connections)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for worker_connection in self.worker_connections:
+            worker_connection.close()
+
+        self.worker_connections = []
+
+    def run(self, group_table_tables, apply, reverse=False) -> bool:
+        """
+        Calls apply( connection, cursor, temporary tables created, group table table ) for each of the tables, 
+        ordered by level (reversed to delete rows) and returns True if all the calls returned True
+        """
+        levels = [ list(tables) for _, tables in groupby( group_table_tables, key=lambda group_table_table: group_table_table.table.level ) ]
+
+        if reverse:
+            levels.reverse()
+
+        def run_one(group_table_table):
+            connection, cursor, temporary_tables_created = self.contexts.get()
+
+            try:
+                return apply(connection, cursor, temporary_tables_created, group_table_table)
+            finally:
+                self.contexts.put( ( connection, cursor, temporary_tables_created ) )
+
+        def run_in_thread(group_table_table):
+            try:
+                return run_one(group_table_table)
+            finally:
+                # the queries made to the django database from this thread used their own connection
+                db.connections.close_all()
+
+        successful_flag = True
+
+        for level in levels:
+            if self.workers > 1 and len(level) > 1:
+                with ThreadPoolExecutor( max_workers=min(self.workers, len(level)) ) as executor:
+                    # leaving the executor waits for every table of the level
+                    results = list( executor.map(run_in_thread, level) )
+            else:
+                results = [ run_one(group_table_table) for group_table_table in level ]
+
+            successful_flag = all(results) and successful_flag
+
+        return successful_flag
+
+def apply_compacted_backlog(
+    connection, cursor, database_record, dbms_booleans, readers, 
+    temporary_tables_created: set, use_primary_keys_for_verification=False
+) -> bool:
+    """
+    Applies several extractions to a database at once: the newest version of each row (by tracking_id and last_updated) 
+    is merged into each table with a single merge, then the deleted rows are deleted, children tables first.
+    Tables whose rows have no tracking_id are applied one extraction after the other. Returns True if everything was applied
+    """
+    table_keys_list = list( dict.fromkeys( keys for reader in readers for keys in reader.keys ) )
+
+    group_table_tables = list( models.GroupTableTable.objects
+        .filter(group_table__name__in=[ keys[0] for keys in table_keys_list ], 
+            table__schema__database=database_record
+        )
+        .select_related("group_table", "table__schema")
+        .order_by('table__level')
+    )
+
+    # only the deleted tracking ids are read ahead, the rows of a table are compacted when the table is applied
+    deleted_tracking_ids = {}
+
+    for group_table_table in group_table_tables:
+        table_keys = ( group_table_table.group_table.name.lower(), )
+        table_deleted_tracking_ids = CompactedTable()
+
+        for reader in readers:
+            table_deleted_tracking_ids.add_deletions( get_deleted_tracking_ids(reader, table_keys) )
+
+        deleted_tracking_ids[group_table_table.id] = table_deleted_tracking_ids.deleted_tracking_ids
+
+    def apply_rows(connection, cursor, temporary_tables_created, group_table_table):
+        table_keys = ( group_table_table.group_table.name.lower(), )
+        successful_flag = True
+
+        readers_with_rows = [ reader for reader in readers if reader.get_columns(table_keys, "rows") ]
+
+        if not all( "tracking_id" in [ column.lower() for column in reader.get_columns(table_keys, "rows") ] for reader in readers_with_rows ):
+            # without a tracking_id the versions of a row can't be told apart, the extractions are applied one after the other
+            for reader in readers_with_rows:
+                if not apply_group_table_rows(
+                    connection, cursor, database_record, dbms_booleans, group_table_table, 
+                    reader.get_columns(table_keys, "rows"), reader.iter_column_chunks(table_keys, "rows"), 
+                    temporary_tables_created, use_primary_keys_for_verification
+                ):
+                    successful_flag = False
+
+            return successful_flag
+
+        # each reader is streamed into the table's compacted rows, which are released once the table is applied
+        compacted_table = CompactedTable()
+        compacted_table.deleted_tracking_ids = deleted_tracking_ids[group_table_table.id]
+
+        for reader in readers_with_rows:
+            for columns, values in reader.iter_column_chunks(table_keys, "rows"):
+                compacted_table.add_rows(columns, values)
+
+        if compacted_table.columns:
+            logging.info(f"Merging {len(compacted_table.rows)} rows into the {group_table_table.table} table")
+
+            if not apply_group_table_rows(
+                connection, cursor, database_record, dbms_booleans, group_table_table, 
+                compacted_table.columns, compacted_table.iter_column_chunks(settings.EXTRACTION_BATCH_SIZE), 
+                temporary_tables_created, use_primary_keys_for_verification
+            ):
+                successful_flag = False
+
+        return successful_flag
+
+    def apply_deletions(connection, cursor, temporary_tables_created, group_table_table):
+        table_deleted_tracking_ids = deleted_tracking_ids[group_table_table.id]
+
+        if not table_deleted_tracking_ids:
+            return True
+
+        return apply_group_table_deletions(connection, cursor, dbms_booleans, group_table_table, table_deleted_tracking_ids.keys())
+
+    with LevelApplier(database_record, connection, cursor, temporary_tables_created, settings.SYNCHRONIZATION_LEVEL_WORKERS) as applier:
+        successful_flag = applier.run(group_table_tables, apply_rows)
+
+        # the deletions are applied last, children tables first
+        successful_flag = applier.run(group_table_tables, apply_deletions, reverse=True) and successful_flag
+
+    return successful_flag
+
+def synchronize_backlog(
+    connection, cursor, database_record, dbms_booleans, fernet, synchronizations, 
+    temporary_tables_created: set, use_primary_keys_for_verification=False
+) -> bool:
+    """
+    Applies the pending synchronizations of a database at once (see apply_compacted_backlog) and marks them as applied.
+    Returns False if they couldn't be applied
+    """
+    with ExitStack() as stack:
+        try:
+            readers = [
+                stack.enter_context( open_extraction(part_file.file.path, fernet, cache_key=part_file.hash) )
+                for synchronization in synchronizations
+                for part_file in synchronization.extraction.extraction.get_files()[synchronization.parts_applied:]
+            ]
+
+            logging.info(f"Applying {len(synchronizations)} synchronizations ({len(readers)} files) to the {database_record} database at once")
+
+            if not apply_compacted_backlog(
+                connection, cursor, database_record, dbms_booleans, readers, 
+                temporary_tables_created, use_primary_keys_for_verification
+            ):
+                return False
+        except (json.JSONDecodeError, zipfile.BadZipFile, CorruptExtractionArchive, InvalidToken) as e:
+            logging.error(f"[In groups.functions.synchronize_backlog]. Error reading the extraction files. Error: {str(e)}")
+            return False
+
+    connection.commit()
+
+    with transaction.atomic():
+        for synchronization in synchronizations:
+            synchronization.parts_applied = len( synchronization.extraction.extraction.get_files() )
+            synchronization.is_applied = True
+            synchronization.save()
+
+    return True
 
-def synchronize_group(group: models.Group, use_primary_keys_for_verification=False):
-    for group_database in group.groupdatabase_set.all():
-        synchronize_group_database(group_database)
-    
 def synchronize_group_database(group_database: models.GroupDatabase, use_primary_keys_for_verification=False):
-    errors = []
     group = group_database.group
     f = Fernet(group.get_fernet_key())
 
     synchronized_databases = []
-    applied_synchronizations = []
     
-    pending_synchronizations = models.GroupDatabaseSynchronization.objects.filter(
-        group_database=group_database, is_applied=False
-    ).order_by(
+    # the parts of failed extractions that were applied are kept, their rows are extracted again by the next extraction
+    pending_synchronizations = list( models.GroupDatabaseSynchronization.objects.filter(
+        group_database=group_database, is_applied=False, extraction__is_failed=False
+    ).select_related("extraction__extraction").order_by(
         'extraction__extraction__time_made'
-    )
+    ) )
 
     temporary_tables_created = set([])
 
@@ -231,270 +1222,106 @@ def synchronize_group_database(group_database: models.GroupDatabase, use_primary
     if connection: 
         cursor = connection.cursor()
 
+        # the complete extractions at the head of the queue form the backlog applied at once
+        backlog = []
+
         for group_database_synchronization in pending_synchronizations:
-            file_path = group_database_synchronization.extraction.extraction.file.file.path
-            successful_flag = True
+            if not group_database_synchronization.extraction.extraction.is_complete:
+                break
 
-            try:
-                zip_file = zipfile.ZipFile(file_path)
+            backlog.append(group_database_synchronization)
 
-                for __ in zip_file.namelist():
-                    print(f"Opening the {__} file in the {zip_file} zip_file")
+        if settings.SYNCHRONIZATION_COMPACT_BACKLOG and len(backlog) > 1:
+            if synchronize_backlog(connection, cursor, database_record, dbms_booleans, f, backlog, temporary_tables_created, use_primary_keys_for_verification):
+                synchronized_databases.append(database_record)
+                pending_synchronizations = pending_synchronizations[len(backlog):]
+            else:
+                # the merges are idempotent, the synchronizations are applied again one after the other
+                logging.warning(f"[In groups.functions.synchronize_group_database]. The backlog of the {database_record} database could not be applied at once, applying it file by file")
 
-                    content = zip_file.read(__)
-                    content = f.decrypt(content)
-                    content = content.decode('utf-8')
+        for group_database_synchronization in pending_synchronizations:
+            extraction = group_database_synchronization.extraction.extraction
+            successful_flag = True
 
-                    logging.debug("[In groups.functions.synchronize_group_database]")
+            # the parts already applied are skipped, the parts of an extraction still being made are applied as they are saved
+            part_files = extraction.get_files()[group_database_synchronization.parts_applied:]
 
-                    try:
-                        dictionary: dict = json.loads(content)
-                        dictionary = dictionary[group.slug]
+            for part_file in part_files:
+                file_path = part_file.file.path
 
-                        group_table_tables = ( models.GroupTableTable.objects
-                            .filter(group_table__name__in=dictionary.keys(), 
+                try:
+                    # the extraction is read one chunk at a time, only the index is kept in memory
+                    # the chunks decoded for another target database of the extraction are taken from the cache
+                    with open_extraction(file_path, f, cache_key=part_file.hash) as reader:
+                        logging.debug("[In groups.functions.synchronize_group_database]")
+
+                        group_table_tables = list( models.GroupTableTable.objects
+                            .filter(group_table__name__in=[ keys[0] for keys in reader.keys ], 
                                 table__schema__database=database_record
                             ) 
+                            .select_related("group_table", "table__schema")
                             .order_by('table__level')
                         )
 
-                        for group_table_table in group_table_tables:
-                            table = group_table_table.table
-                            table_name = table.name.lower()
-                            schema_name = table.schema.name.lower()
-                            group_table = group_table_table.group_table
-                            
-                            group_table_name = group_table.name.lower()
+                        def apply_rows(connection, cursor, temporary_tables_created, group_table_table):
+                            table_keys = ( group_table_table.group_table.name.lower(), )
+                            row_columns = reader.get_columns(table_keys, "rows")
 
-                            table_rows = dictionary[group_table_name]['rows']
+                            if not row_columns:
+                                # only deleted rows were extracted from this table
+                                return True
 
-                            group_table_columns = group_table_table.group_table.columns.filter(
-                                name__in=table_rows[0].keys()
-                            )
-                            
-                            flag = True
-                            
-                            table_columns = [ f.column.name.lower() for f in models.GroupColumnColumn.objects.filter( group_column__in=group_table_columns, column__table=table ) ]
-                            
-                            primary_key_columns = [
-                                f["name"] for f in table.column_set.filter(columnconstraint__is_primary_key=True).values("name")
-                            ]
-
-                            temporary_table_name = f"{schema_name}_{table_name}_temporary_table"
-                            temporary_table_actual_name = get_temporary_table_name(database_record, temporary_table_name)
-                        
-                            create_temporary_table_query = get_create_temporary_table_query( 
-                            database_record, temporary_table_name,  
-                            f"( { ', '.join( [ get_type_and_precision(column, get_column_dictionary(table, column)) for column in table_columns ] ) } )" 
+                            return apply_group_table_rows(
+                                connection, cursor, database_record, dbms_booleans, group_table_table, 
+                                row_columns, reader.iter_column_chunks(table_keys, "rows"), 
+                                temporary_tables_created, use_primary_keys_for_verification
                             )
-                            logging.info(f"Running query to create the temporary table. Query: {create_temporary_table_query}")
-
-                            try:
-                                if temporary_table_actual_name not in temporary_tables_created:
-                                    logging.info(f"Creating the {temporary_table_actual_name} temp table")
-                                    
-                                    cursor.execute(create_temporary_table_query)
-                                    temporary_tables_created.add( temporary_table_actual_name )
-
-                                try:
-                                    # emptying the temporary table in case of previous data
-                                    try:
-                                        cursor.execute(f"DELETE FROM {temporary_table_actual_name}")
-                                    except pyodbc.ProgrammingError as e:
-                                        logging.error(f"Error deleting from the temporary_table {temporary_table_actual_name}. Error: {str(e)}")
-                                        logging.error(f"The temporary tables that have already been created are: ")
-                                        logging.error(temporary_tables_created)
-                                        successful_flag = False
-
-                                        connection.rollback()
-                                    
-                                    insert_into_temporary_table_query = f"""
-                                    INSERT INTO {temporary_table_actual_name} 
-                                    ( { ', '.join( [ column for column in table_columns ] ) } ) VALUES ( { ', '.join( [ '?' if isinstance(cursor, pyodbc.Cursor) else '%s'  for _ in table_columns ] ) } );
-                                    """
-
-                                    rows_to_insert = []
-                                    use_time = False
-                                    
-                                    for row in table_rows:
-                                        rows_to_insert.append( tuple(
-                                            row[f.name.lower() if not isinstance(f, str) else f] for f in table_columns
-                                        ) )
-                                        if "last_updated" in row.keys():
-                                            use_time = True
-
-                                    
-                                    cursor.executemany(insert_into_temporary_table_query, rows_to_insert)
-
-                                    # modify the foreign keys in the table
-                                    for constraint in ferdolt_models.ColumnConstraint.objects.filter(
-                                        column__table=table, is_foreign_key=True, references_tracking_id__isnull=False, 
-                                        references__isnull=False
-                                    ):
-                                        column = constraint.column
-                                        referenced_column = constraint.references
-                                        referenced_table = referenced_column.table
-                                        tracking_id_referencing_column = constraint.references_tracking_id
-
-                                        referenced_table_tracking_id_name = "tracking_id"
-
-                                        query = f"""
-                                        UPDATE {temporary_table_actual_name} SET {column.name} = subquery.{referenced_column.name} 
-                                        FROM ( SELECT {referenced_column.name}, {referenced_table_tracking_id_name} FROM {referenced_table.get_queryname()} ) subquery 
-                                        WHERE subquery.{referenced_table_tracking_id_name}={temporary_table_actual_name}.{tracking_id_referencing_column.name}
-                                        """
-
-                                        try:
-                                            cursor.execute(query)
-                                        except (psycopg.ProgrammingError, pyodbc.ProgrammingError) as e:
-                                            logging.error(f"Error occured when modifying the foreign keys in the temporary table. Error: {str(e)}")
-                                            logging.error(f"Query to execute: {query}")
-                                            connection.rollback()
-                                            successful_flag = False
-
-                                            raise e
-
-                                    if dbms_booleans['is_sqlserver_db']:
-                                        # set identity_insert on to be able to explicitly write values for identity columns
-                                        try:
-                                            cursor.execute(f"SET IDENTITY_INSERT {schema_name}.{table_name} ON")
-                                        except pyodbc.ProgrammingError as e:
-                                            logging.error(f"Error occured when setting identity_insert on for {schema_name}.{table_name} table")
-                                            connection.rollback()
-                                            successful_flag = False
-                                            raise e
-
-                                    merge_query = None
-                                    
-                                    tracking_id_column = "tracking_id"
-
-                                    if len(primary_key_columns) == 1:
-                                        non_primary_key_columns_list = [ column for column in table_columns if column not in primary_key_columns ]
-                                        non_primary_key_columns_list_string = ', '.join(non_primary_key_columns_list)
-                                    else:
-                                        non_primary_key_columns_list_string = ', '.join( table_columns )
-
-                                    if not deletion_table_regex.search(table_name):
-                                        merge_query = ""
-
-                                        if dbms_booleans["is_sqlserver_db"]:
-                                            merge_query = f"""
-                                                merge {schema_name}.{table_name} as t USING {temporary_table_actual_name} AS s ON (
-                                                    {
-                                                        ' AND '.join(
-                                                            [ f"t.{column}=s.{column}" for column in primary_key_columns ]
-                                                        ) if use_primary_keys_for_verification else f"t.{tracking_id_column}=s.{tracking_id_column}"
-                                                    }
-                                                )
-                                                when matched { " and t.last_updated < s.last_updated " if use_time else ' ' } then 
-                                                update set {
-                                                    ', '.join(
-                                                        [ f"{column} = s.{column}" for column in table_columns if column not in primary_key_columns ]
-                                                    )
-                                                }
-
-                                                when not matched then 
-                                                    insert ( { ', '.join( [ column for column in table_columns ] ) } ) 
-                                                    values ( { ', '.join( [ f"s.{column}" for column in table_columns ] ) } )
-                                                ;
-                                            """
-
-                                        elif dbms_booleans['is_postgres_db']:
-                                            merge_query = f"""
-                                            INSERT INTO {schema_name}.{table_name} AS source ( { non_primary_key_columns_list_string } ) 
-                                            (SELECT { non_primary_key_columns_list_string } FROM {temporary_table_actual_name}) 
-                                            ON CONFLICT ( { ', '.join( [ column for column in primary_key_columns ] ) if use_primary_keys_for_verification else tracking_id_column } )
-                                            DO 
-                                                UPDATE SET { ', '.join( f"{column} = EXCLUDED.{column}" for column in table_columns if column not in primary_key_columns ) if use_primary_keys_for_verification else ', '.join( f"{column} = EXCLUDED.{column}" for column in table_columns if column != tracking_id_column ) } 
-                                                WHERE EXCLUDED.last_updated > source.last_updated;
-                                            """
-                                        
-                                    else:
-                                        if len(primary_key_columns) == 1:
-                                            if dbms_booleans["is_sqlserver_db"]:
-                                                merge_query = f"""
-                                                merge {schema_name}.{table_name} as t USING {temporary_table_actual_name} AS s ON (
-                                                    {
-                                                        f"t.{primary_key_columns[0]} = s.row_id"
-                                                    }
-                                                ) 
-                                                when matched then 
-                                                delete
-                                                ;
-                                                """
-                                            elif dbms_booleans['is_postgres_db']:
-                                                merge_query = f"""
-                                                DELETE FROM {schema_name}.{table_name} WHERE { 
-                                                    ' AND, '.join(
-                                                        f"{column} IN (SELECT {column} FROM {temporary_table_actual_name})" 
-                                                        for column in primary_key_columns
-                                                    )
-                                                    }
-                                                """
-                                        else:
-                                            logging.error(f"Could not delete from {table.__str__()} table as it has a composite primary key")
-
-                                    try:
-                                        if merge_query: 
-                                            cursor.execute(merge_query)
-                                            connection.commit()
-                                            print(f"Successfully synchronized {schema_name}.{table_name}")
-                                            group_database_synchronization.is_applied = True
-                                            group_database_synchronization.save()
-                                    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                        logging.error(f"Error executing merge query \n{merge_query}. \nException: {str(e)}")
-                                        logging.error(f"The temporary tables that have been created are: {temporary_tables_created}")
-                                        flag = False
-                                        successful_flag = False
-                                        connection.rollback()
-
-                                    except (pyodbc.IntegrityError, psycopg.IntegrityError) as e:
-                                        logging.error(f"Error executing merge query\n {merge_query}. \n Exception: {str(e)}")
-                                        logging.error(f"The temporary tables that have been created are: {temporary_tables_created}")
-                                        cursor.connection.rollback()
-                                        flag = False
-                                        successful_flag = False
-                                    
-                                    if dbms_booleans['is_sqlserver_db']:
-                                        # set identity_insert on to be able to explicitly write values for identity columns
-                                        try:
-                                            cursor.execute(f"SET IDENTITY_INSERT {schema_name}.{table_name} OFF")
-                                        except pyodbc.ProgrammingError as e:
-                                            logging.error(f"Error occured when setting identity_insert off for {schema_name}.{table_name} table")
-
-                                except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                    logging.error(f"Error inserting into the temporary table. Error: {str(e)}")
-                                    logging.error(f"Temp table creation query: {create_temporary_table_query}")
-                                    print(f"Temp table creation query: {create_temporary_table_query}")
-                                    print(f"Query to insert into the temp table: {insert_into_temporary_table_query}")
-                                    flag = False
-                                    successful_flag = False
-                                    connection.rollback()
-
-                            except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                logging.error(f"Error creating the temporary table {temporary_table_actual_name}. Error: {str(e)}.\nQuery: {create_temporary_table_query}")
-                                logging.error(f"Temp table creation query: {create_temporary_table_query}")
-                                cursor.connection.rollback()
-                                flag = False
+
+                        def apply_deletions(connection, cursor, temporary_tables_created, group_table_table):
+                            deleted_tracking_ids = get_deleted_tracking_ids( reader, ( group_table_table.group_table.name.lower(), ) )
+
+                            if not deleted_tracking_ids:
+                                return True
+
+                            return apply_group_table_deletions(connection, cursor, dbms_booleans, group_table_table, deleted_tracking_ids.keys())
+
+                        with LevelApplier(database_record, connection, cursor, temporary_tables_created, settings.SYNCHRONIZATION_LEVEL_WORKERS) as applier:
+                            if not applier.run(group_table_tables, apply_rows):
                                 successful_flag = False
 
-                    except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                        logging.error(f"Error creating the temporary table {temporary_table_actual_name}. Error: {str(e)}.\nQuery: {create_temporary_table_query}")
-                        logging.error(f"Temp table creation query: {create_temporary_table_query}")
-                        cursor.connection.rollback()
-                        flag = False
-                        successful_flag = False
-                    
-                    if successful_flag:
-                        connection.commit()                           
-                        synchronized_databases.append(database_record)
-
-            except json.JSONDecodeError as e:
-                successful_flag = False
-                logging.error(f"[In groups.functions.synchronize_group_database]. Error parsing json from file for database synchronization. File path: {file_path}")
-            except (zipfile.BadZipFile) as e:
-                successful_flag = False
-                logging.error(f"[In groups.function.synchronize_group_database]. Error opening zip file")
+                            # the deleted rows are deleted after the rows are merged, children tables first
+                            if not applier.run(group_table_tables, apply_deletions, reverse=True):
+                                successful_flag = False
+
+                except json.JSONDecodeError as e:
+                    successful_flag = False
+                    logging.error(f"[In groups.functions.synchronize_group_database]. Error parsing json from file for database synchronization. File path: {file_path}")
+                except (zipfile.BadZipFile) as e:
+                    successful_flag = False
+                    logging.error(f"[In groups.function.synchronize_group_database]. Error opening zip file")
+                except (CorruptExtractionArchive, InvalidToken) as e:
+                    successful_flag = False
+                    logging.error(f"[In groups.functions.synchronize_group_database]. Error reading the extraction file {file_path}. Error: {str(e)}")
+
+                if not successful_flag:
+                    break
+
+                # each part is committed on its own so an interrupted synchronization resumes after the last part applied
+                connection.commit()
+                group_database_synchronization.parts_applied += 1
+                group_database_synchronization.save()
+
+            if successful_flag and extraction.is_complete:
+                group_database_synchronization.is_applied = True
+                group_database_synchronization.save()
+                synchronized_databases.append(database_record)
+            elif not extraction.is_complete:
+                # the next extractions can't be applied before the rest of this one
+                break
+
+        connection.close()
+
+    return synchronized_databases
 
 def get_data_type_specification_for_group_column(group_column: models.GroupColumn) -> str:
     if group_column.data_type in ["varchar", "char"]:
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.3 on 2026-10-17 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ferdolt', '0010_historicalserver_host_server_host'),
+        ('groups', '0011_joingrouprequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupDatabaseTableWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=50)),
+                ('time_updated', models.DateTimeField(auto_now=True)),
+                ('group_database', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watermarks', to='groups.groupdatabase')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ferdolt.table')),
+            ],
+            options={
+                'unique_together': {('group_database', 'table')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-17 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0012_groupdatabasetablewatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupextraction',
+            name='resume_state',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupdatabasesynchronization',
+            name='parts_applied',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-17 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0013_groupextraction_resume_state_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupextraction',
+            name='is_failed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
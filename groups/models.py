@@ -1,3 +1,4 @@
+import datetime as dt
 from email.policy import default
 import logging
 from random import choices
@@ -265,12 +266,17 @@ class GroupExtraction(models.Model):
         max_length=EXTRACTION_CODE_MAX_LENGTH, 
         default=generate_random_encryption_code
     )
+    # where a multi-part extraction resumes from if it was interrupted, None once the extraction is complete
+    resume_state = models.JSONField(null=True, blank=True)
+    # True if the extraction couldn't be resumed, it is then left incomplete and skipped by the synchronizations
+    is_failed = models.BooleanField(default=False)
 
 class GroupDatabaseSynchronization(models.Model):
     group_database = models.ForeignKey(GroupDatabase, on_delete=models.CASCADE)
     extraction = models.ForeignKey( GroupExtraction, on_delete=models.CASCADE )
     is_applied = models.BooleanField( default=False )
     time_applied = models.DateTimeField( null=True )
+    parts_applied = models.IntegerField( default=0 ) # the number of parts of the extraction applied so far
 
     class Meta:
         unique_together = [
@@ -283,6 +289,28 @@ class GroupDatabaseSynchronization(models.Model):
 
         return super().save(*args, **kwargs)
 
+class GroupDatabaseTableWatermark(models.Model):
+    """
+    The latest value of a table's last_updated (or deletion_time) column extracted from a group database, 
+    as read from the source database. The next extraction of the table resumes from this value.
+    It is stored in ISO format so that naive datetimes of the source database are kept as they are
+    """
+    group_database = models.ForeignKey(GroupDatabase, on_delete=models.CASCADE, related_name='watermarks')
+    table = models.ForeignKey(ferdolt_models.Table, on_delete=models.CASCADE)
+    value = models.CharField(max_length=50)
+    time_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [
+            ["group_database", "table"]
+        ]
+
+    def get_value(self):
+        try:
+            return dt.datetime.fromisoformat(self.value)
+        except ValueError:
+            return self.value
+
 class GroupServerSynchronization(models.Model):
     group_server = models.ForeignKey(GroupServer, on_delete=models.CASCADE)
     extraction = models.ForeignKey(Group, on_delete=models.CASCADE)
@@ -0,0 +1,110 @@
+"""
+Compiled extraction plans of group databases.
+
+A plan lists, for every table to extract from a group database, the query selecting its group columns,
+the column holding the time of its last change and the column its rows can be paginated on. Plans are kept in the cache so that an extraction 
+doesn't query the ORM table by table. Any change to the group's tables and columns or to the ferdolt schema records
+(primary key constraints included, they decide the key column) invalidates every plan (see groups.signals).
+The cache is shared by the web and huey processes (see CACHES in the settings), a change made by one invalidates the plans of both.
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from ferdolt import models as ferdolt_models
+from ferdolt_web import settings
+
+from . import models
+
+PLAN_GENERATION_KEY = "groups:extraction-plans:generation"
+
+def get_plan_generation():
+    generation = cache.get(PLAN_GENERATION_KEY)
+
+    if generation is None:
+        cache.add(PLAN_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(PLAN_GENERATION_KEY)
+
+    return generation
+
+def invalidate_extraction_plans():
+    # plans are cached under the current generation, a new generation makes them unreachable
+    cache.set(PLAN_GENERATION_KEY, time.time_ns(), timeout=None)
+
+def get_key_column(table: ferdolt_models.Table, column_names) -> str:
+    """
+    Returns the column (among column_names) uniquely identifying the rows of a table, 
+    used to read the table page by page in the order of that column
+    """
+    if "tracking_id" in column_names:
+        return "tracking_id"
+
+    primary_key_columns = [ 
+        column.name for column in table.column_set.filter(columnconstraint__is_primary_key=True).distinct() 
+    ]
+
+    if len(primary_key_columns) == 1 and primary_key_columns[0] in column_names:
+        return primary_key_columns[0]
+
+    return None
+
+def compile_extraction_plan(group_database: models.GroupDatabase) -> list:
+    """
+    Returns a ( keys, kind, table id, table query name, select query, time column, key column ) tuple 
+    for every table to extract from, in the order their rows are written to the extraction 
+    i.e. parent tables before the tables referencing them
+    """
+    plan = []
+
+    for table in models.GroupTable.objects.filter(group_id=group_database.group_id):
+        # get the tables of this database linked to the group's tables
+        actual_database_tables = ferdolt_models.Table.objects.filter( 
+            id__in=table.grouptabletable_set.values("table__id"), 
+            schema__database_id=group_database.database_id 
+        ).select_related("schema", "deletion_table__schema")
+        table_keys = ( table.name.lower(), )
+
+        for item in actual_database_tables:
+            # get the group columns of the grouptable linked to this item's table
+            columns_in_common = ferdolt_models.Column.objects.filter(table=item, 
+                id__in=models.GroupColumnColumn.objects.filter( group_column__group_table=table ).values("column__id")
+            )
+
+            time_field = item.column_set.filter( Q( name='last_updated' ) | 
+                Q( name='deletion_time' ) 
+            ).first()
+
+            column_names = [ column.name for column in columns_in_common ]
+
+            plan.append( ( item.level, ( 
+                table_keys, "rows", item.id, item.get_queryname(), 
+                f"SELECT { ', '.join(column_names) } FROM { item.get_queryname() }", 
+                time_field.name if time_field else None, get_key_column(item, column_names) 
+            ) ) )
+
+            deletion_table = item.deletion_table
+
+            if deletion_table:
+                column_names = [ column.name for column in deletion_table.column_set.all() ]
+
+                plan.append( ( item.level, ( 
+                    table_keys, "deleted_rows", deletion_table.id, deletion_table.get_queryname(), 
+                    f"SELECT { ', '.join(column_names) } FROM { deletion_table.get_queryname() }", 
+                    'deletion_time', get_key_column(deletion_table, column_names) 
+                ) ) )
+
+    # the sort is stable, tables of the same level stay in the group's order
+    plan.sort( key=lambda item: item[0] )
+
+    return [ source for _, source in plan ]
+
+def get_extraction_plan(group_database: models.GroupDatabase) -> list:
+    key = f"groups:extraction-plans:{get_plan_generation()}:{group_database.group_id}:{group_database.id}"
+    plan = cache.get(key)
+
+    if plan is None:
+        plan = compile_extraction_plan(group_database)
+        cache.set(key, plan, timeout=settings.EXTRACTION_PLAN_TIMEOUT)
+
+    return plan
@@ -140,17 +140,22 @@ class ExtractFromGroupSerializer(serializers.ModelSerializer):
 
 class SimpleGroupExtractionSerializer(serializers.ModelSerializer):
     file_name = serializers.SerializerMethodField()
+    # the files of all the parts of the extraction, in order
+    file_names = serializers.SerializerMethodField()
     extraction_time = serializers.DateTimeField(source="extraction.time_made")
 
     class Meta:
         model = models.GroupExtraction
-        fields = ( "id", "extraction", "group", "file_name", "extraction_time" ) 
+        fields = ( "id", "extraction", "group", "file_name", "file_names", "extraction_time" ) 
 
     def get_file_name(self, obj):
         file_path = obj.extraction.file_path
 
         return os.path.basename(file_path)
 
+    def get_file_names(self, obj):
+        return [ os.path.basename(file_path) for file_path in obj.extraction.get_file_paths() ]
+
 class GroupExtractionSerializer(SimpleGroupExtractionSerializer):
     file_path = serializers.CharField(source='extraction.file_path')
     # file_name = serializers.SerializerMethodField()
@@ -158,7 +163,7 @@ class GroupExtractionSerializer(SimpleGroupExtractionSerializer):
 
     class Meta:
         model = models.GroupExtraction
-        fields = ( "id", "extraction", "group", "file_name", "file_path", "extraction_time" ) 
+        fields = ( "id", "extraction", "group", "file_name", "file_names", "file_path", "extraction_time" ) 
 
 
 class GroupDatabaseSynchronizationSerializer(serializers.ModelSerializer):
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+
+from ferdolt import models as ferdolt_models
+
+from . import models, plans
+
+# the models the extraction plans are compiled from
+EXTRACTION_PLAN_MODELS = [
+    models.GroupTable, models.GroupTableTable, models.GroupColumn, models.GroupColumnColumn, models.GroupDatabase,
+    ferdolt_models.DatabaseSchema, ferdolt_models.Table, ferdolt_models.Column, ferdolt_models.ColumnConstraint,
+]
+
+def invalidate_extraction_plans(sender, **kwargs):
+    plans.invalidate_extraction_plans()
+
+for model in EXTRACTION_PLAN_MODELS:
+    post_save.connect(invalidate_extraction_plans, sender=model, dispatch_uid=f"invalidate_extraction_plans_on_{model.__name__}_save")
+    post_delete.connect(invalidate_extraction_plans, sender=model, dispatch_uid=f"invalidate_extraction_plans_on_{model.__name__}_delete")
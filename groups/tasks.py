@@ -1,21 +1,147 @@
+import asyncio
+from contextlib import contextmanager
 import logging
 from huey import crontab
-from huey.contrib.djhuey import periodic_task, task
+from huey.contrib.djhuey import HUEY, periodic_task, task
+from huey.exceptions import TaskLockedException
 from core.functions import get_database_connection
+from core.health import is_circuit_open
 
-from groups import functions
+from ferdolt_web import settings
+from groups import asynchronous, functions
 
 from . import models
 
+# the slots are huey locks, released when the task holding them ends. The locks of a consumer that was killed while running tasks
+# stay taken: run the consumer with --flush-locks (manage.py run_huey -f) to release them when it starts, or call HUEY.flush_locks()
+
+@contextmanager
+def acquire_slot(name, limit):
+    """
+    Takes one of the limit locks named name-0 ... name-(limit - 1), raises TaskLockedException if they are all taken
+    """
+    for slot in range(limit):
+        lock = HUEY.lock_task(f"{name}-{slot}")
+
+        try:
+            lock.__enter__()
+        except TaskLockedException:
+            continue
+
+        try:
+            yield slot
+        finally:
+            lock.__exit__(None, None, None)
+
+        return
+
+    raise TaskLockedException(f"The {limit} {name} slots are all taken")
+
+def run_in_group_database_slot(group_database_id, function):
+    """
+    Runs function on a group database, limiting the number of tasks working at the same time overall and on the same database
+    """
+    group_database = models.GroupDatabase.objects.filter(id=group_database_id).first()
+
+    if not group_database:
+        return
+
+    # raises TaskLockedException if every slot is taken, huey then retries the task after a delay
+    with acquire_slot("group-database-tasks", settings.GROUP_TASKS_MAX_CONCURRENT):
+        try:
+            with acquire_slot(f"database-{group_database.database_id}-tasks", settings.GROUP_TASKS_PER_DATABASE):
+                function(group_database)
+        except TaskLockedException as e:
+            # the database is busy with other tasks, it will be processed again in the next cycle
+            logging.info(f"Skipping {function.__name__} for the {group_database.database} database. {str(e)}")
+
+@task(retries=3, retry_delay=15)
+def extract_from_group_database(group_database_id):
+    run_in_group_database_slot(group_database_id, functions.extract_from_groupdatabase)
+
+@task(retries=3, retry_delay=15)
+def synchronize_group_database(group_database_id):
+    run_in_group_database_slot(group_database_id, functions.synchronize_group_database)
+
+def get_available_group_databases():
+    """
+    Returns the ( id, database id ) of the group databases whose database's circuit isn't open, the others are skipped until their cool-off ends
+    """
+    group_databases = []
+
+    for group_database_id, database_id in models.GroupDatabase.objects.values_list("id", "database_id"):
+        if is_circuit_open(database_id):
+            logging.info(f"Skipping the group database {group_database_id}, its database can't be connected to")
+            continue
+
+        group_databases.append( ( group_database_id, database_id ) )
+
+    return group_databases
+
+def get_queued_group_database_ids(group_database_task) -> set:
+    """
+    Returns the ids of the group databases for which the task is waiting in the queue or in the schedule (e.g. to be retried)
+    """
+    return set( [
+        queued_task.args[0] for queued_task in HUEY.pending() + HUEY.scheduled()
+        if isinstance(queued_task, group_database_task.task_class) and queued_task.args
+    ] )
+
+def is_slot_taken(name) -> bool:
+    """
+    Returns True if the lock named name is taken, without taking it. The key is the one huey's TaskLock stores the lock under
+    """
+    return HUEY.storage.has_data_for_key(f"{HUEY.name}.lock.{name}")
+
+def is_database_busy(database_id) -> bool:
+    """
+    Returns True if every slot of a database is taken by a running task
+    """
+    return all( is_slot_taken(f"database-{database_id}-tasks-{slot}") for slot in range(settings.GROUP_TASKS_PER_DATABASE) )
+
+def enqueue_group_database_tasks(group_database_task):
+    """
+    Queues the task for each available group database, unless the task is already queued for it or its database is busy.
+    A cycle taking longer than the period of the periodic tasks then doesn't pile up tasks
+    """
+    queued_group_database_ids = get_queued_group_database_ids(group_database_task)
+
+    for group_database_id, database_id in get_available_group_databases():
+        if group_database_id in queued_group_database_ids or is_database_busy(database_id):
+            logging.info(f"Not queueing {group_database_task.func.__name__} for the group database {group_database_id}, it is already queued or running")
+            continue
+
+        group_database_task(group_database_id)
+
+def run_asynchronously(name, coroutine_function):
+    # a cycle still running when the next one starts is left to finish, the next one is skipped
+    try:
+        with HUEY.lock_task(f"{name}-asynchronous"):
+            results = asyncio.run( coroutine_function() )
+    except TaskLockedException:
+        logging.info(f"Skipping {name}, the previous cycle is still running")
+        return
+
+    for result in results.values():
+        if result["error"]:
+            logging.error(f"{name} failed on the {result['database']} database. Error: {result['error']}")
+
 @periodic_task(crontab(minute='*/1'))
 def extract_from_groups():
-    for group_database in models.GroupDatabase.objects.all():
-        functions.extract_from_groupdatabase(group_database)
+    if settings.GROUP_TASKS_ASYNCHRONOUS:
+        run_asynchronously("extract_from_groups", asynchronous.extract_from_group_databases)
+        return
+
+    # one task per group database so that a slow or unreachable database doesn't hold up the others
+    enqueue_group_database_tasks(extract_from_group_database)
 
 @periodic_task(crontab(minute='*/1'))
 def synchronize_groups():
-    for group in models.Group.objects.all():
-        functions.synchronize_group(group)
+    if settings.GROUP_TASKS_ASYNCHRONOUS:
+        run_asynchronously("synchronize_groups", asynchronous.synchronize_group_databases)
+        return
+
+    enqueue_group_database_tasks(synchronize_group_database)
 
 @task()
 def create_missing_tables_and_columns_in_group_databases(group_id):
@@ -1,3 +1,517 @@
-from django.test import TestCase
-
-# Create your tests here.
+import asyncio
+import datetime as dt
+import json
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from cryptography.fernet import Fernet
+from huey import MemoryHuey
+
+from ferdolt import models as ferdolt_models
+from flux import models as flux_models
+from flux.archives import ExtractionWriter, open_extraction
+
+from . import asynchronous, functions, models, tasks
+from .functions import (
+    CompactedTable, LevelApplier, apply_compacted_backlog, apply_group_table_rows, get_extraction_window, get_interrupted_extraction, is_newer, run_extraction_jobs_in_parallel
+)
+
+class CompactedTableTestCase(SimpleTestCase):
+    def test_is_newer_with_mixed_times(self):
+        # archives decode their times while older extraction files hold strings
+        self.assertTrue( is_newer( "2023-01-02T00:00:00", dt.datetime(2023, 1, 1) ) )
+        self.assertFalse( is_newer( dt.datetime(2023, 1, 1), "2023-01-02 00:00:00+00:00" ) )
+        self.assertTrue( is_newer( dt.datetime(2023, 1, 1, 1, tzinfo=dt.timezone(dt.timedelta(hours=-1))), "2023-01-01T01:30:00" ) )
+        self.assertTrue( is_newer( None, dt.datetime(2023, 1, 1) ) )
+
+    def test_newest_version_of_each_row_is_kept(self):
+        table = CompactedTable()
+
+        # a legacy extraction with string times, then an archive with datetimes and its columns in another order
+        table.add_rows(
+            [ "tracking_id", "name", "last_updated" ],
+            [ [ "S1", "S2" ], [ "old first", "newest second" ], [ "2023-01-01T00:00:00", "2023-01-05T00:00:00" ] ]
+        )
+        table.add_rows(
+            [ "last_updated", "Tracking_Id", "name", "price" ],
+            [ [ dt.datetime(2023, 1, 2), dt.datetime(2023, 1, 3) ], [ "S1", "S2" ], [ "newest first", "old second" ], [ 10, 20 ] ]
+        )
+
+        self.assertEqual( table.columns, [ "tracking_id", "name", "last_updated", "price" ] )
+
+        columns, values = next( table.iter_column_chunks(10) )
+
+        self.assertEqual( columns, [ "tracking_id", "name", "last_updated", "price" ] )
+        self.assertEqual( values, [
+            [ "S1", "S2" ],
+            [ "newest first", "newest second" ],
+            [ dt.datetime(2023, 1, 2), "2023-01-05T00:00:00" ],
+            [ 10, None ],
+        ] )
+
+    def test_deleted_rows_are_left_out(self):
+        table = CompactedTable()
+        table.add_rows( [ "tracking_id", "last_updated" ], [ [ "S1", "S2", "S3" ], [ None, None, None ] ] )
+        table.add_deletions( { "S2": "2023-01-01T00:00:00" } )
+        table.add_deletions( { "S2": dt.datetime(2023, 1, 2) } )
+
+        self.assertEqual( table.deleted_tracking_ids, { "S2": dt.datetime(2023, 1, 2) } )
+        self.assertEqual( [ values[0] for _, values in table.iter_column_chunks(1) ], [ [ "S1" ], [ "S3" ] ] )
+
+class ExtractionWindowTestCase(SimpleTestCase):
+    def test_first_extraction_includes_rows_without_time(self):
+        upper_bound = dt.datetime(2023, 1, 2)
+
+        self.assertEqual(
+            get_extraction_window("last_updated", upper_bound, None, True, None, "%s", overlap=0),
+            ( " WHERE ( last_updated <= %s OR last_updated IS NULL )", [ upper_bound ], upper_bound )
+        )
+
+    def test_window_starts_before_the_watermark(self):
+        watermark, upper_bound = dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 2)
+
+        self.assertEqual(
+            get_extraction_window("last_updated", upper_bound, None, True, watermark, "?", overlap=60),
+            ( " WHERE last_updated > ? AND last_updated <= ?", [ dt.datetime(2023, 1, 1, 11, 59), upper_bound ], upper_bound )
+        )
+        self.assertEqual(
+            get_extraction_window("last_updated", upper_bound, None, True, watermark, "?", overlap=0)[1],
+            [ watermark, upper_bound ]
+        )
+
+    def test_unchanged_table_is_skipped(self):
+        watermark = dt.datetime(2023, 1, 2)
+
+        self.assertEqual( get_extraction_window("last_updated", watermark, None, True, watermark, "?", overlap=60), ( None, [], watermark ) )
+        self.assertEqual( get_extraction_window("last_updated", None, None, True, None, "?", overlap=60), ( None, [], None ) )
+
+    def test_start_time_and_no_time(self):
+        start_time, upper_bound = dt.datetime(2023, 1, 1), dt.datetime(2023, 1, 2)
+
+        self.assertEqual(
+            get_extraction_window("last_updated", upper_bound, start_time, True, dt.datetime(2023, 1, 1, 18), "?", overlap=60),
+            ( " WHERE last_updated >= ? AND last_updated <= ?", [ start_time, upper_bound ], upper_bound )
+        )
+        self.assertEqual( get_extraction_window("last_updated", upper_bound, None, False, None, "?", overlap=60), ( "", [], upper_bound ) )
+
+class EnqueueGroupDatabaseTasksTestCase(SimpleTestCase):
+    def setUp(self):
+        self.huey = MemoryHuey("ferdolt-tests", immediate=False)
+
+        @self.huey.task()
+        def extract(group_database_id):
+            pass
+
+        self.task = extract
+
+        for patcher in [
+            mock.patch.object(tasks, "HUEY", self.huey),
+            mock.patch.object(tasks.settings, "GROUP_TASKS_PER_DATABASE", 1),
+            # the group database 1 is on the database 10 and the group database 2 on the database 20
+            mock.patch.object(tasks, "get_available_group_databases", return_value=[ ( 1, 10 ), ( 2, 20 ) ]),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_pending_ids(self):
+        return [ pending_task.args[0] for pending_task in self.huey.pending() ]
+
+    def test_busy_database_is_skipped(self):
+        with tasks.acquire_slot("database-10-tasks", 1):
+            self.assertTrue( tasks.is_database_busy(10) )
+            self.assertFalse( tasks.is_database_busy(20) )
+
+            tasks.enqueue_group_database_tasks(self.task)
+
+        self.assertEqual( self.get_pending_ids(), [ 2 ] )
+        self.assertFalse( tasks.is_database_busy(10) )
+
+    def test_queued_task_is_not_queued_again(self):
+        tasks.enqueue_group_database_tasks(self.task)
+        tasks.enqueue_group_database_tasks(self.task)
+
+        self.assertEqual( self.get_pending_ids(), [ 1, 2 ] )
+
+class FakeConnection:
+    def __init__(self):
+        self.is_closed = False
+
+    def close(self):
+        self.is_closed = True
+
+class ParallelExtractionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.worker_connections = []
+        self.jobs_run = []
+        self.lock = threading.Lock()
+
+        def get_database_connection(database):
+            self.worker_connections.append( FakeConnection() )
+            return self.worker_connections[-1]
+
+        def run_extraction_job(connection, writer, part, job, start_key=None):
+            with self.lock:
+                self.jobs_run.append( ( part, start_key ) )
+
+        for patcher in [
+            mock.patch.object(functions, "get_database_connection", get_database_connection),
+            mock.patch.object(functions, "run_extraction_job", run_extraction_job),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_jobs_run_window_by_window(self):
+        windows = []
+
+        def on_window_done(next_job):
+            # the jobs of the window are all written when the part can be saved
+            windows.append( ( next_job, sorted(self.jobs_run) ) )
+
+        run_extraction_jobs_in_parallel( None, FakeConnection(), None, [ [ "job" ] ] * 5, 2, on_window_done=on_window_done )
+
+        self.assertEqual( [ next_job for next_job, _ in windows ], [ 2, 4, 5 ] )
+        self.assertEqual( windows[1][1], [ ( 0, None ), ( 1, None ), ( 2, None ), ( 3, None ) ] )
+        self.assertEqual( len(self.worker_connections), 1 )
+        self.assertTrue( self.worker_connections[0].is_closed )
+
+    def test_resumed_extraction(self):
+        run_extraction_jobs_in_parallel( None, FakeConnection(), None, [ [ "job" ] ] * 4, 4, start_job=2, start_key=42 )
+
+        # only the jobs left are run and the first one continues after the last key saved
+        self.assertEqual( sorted(self.jobs_run), [ ( 2, 42 ), ( 3, None ) ] )
+        self.assertEqual( len(self.worker_connections), 1 )
+
+class InterruptedExtractionTestCase(TestCase):
+    def setUp(self):
+        self.group_database = models.GroupDatabase.objects.create( group=models.Group.objects.create(slug="group"), database=None )
+
+        extraction = flux_models.Extraction.objects.create(
+            time_made=timezone.now(), file=flux_models.File.objects.create(file="extractions/extraction_0"), is_complete=False
+        )
+        self.group_extraction = models.GroupExtraction.objects.create(
+            extraction=extraction, group=self.group_database.group, source_database=self.group_database, 
+            resume_state={ "jobs": [], "watermarks": {}, "job": 1, "last_key": None }
+        )
+
+    @mock.patch.object(functions.settings, "EXTRACTION_RESUME_ATTEMPTS", 2)
+    def test_extraction_failing_to_resume_is_marked_as_failed(self):
+        for attempt in [ 1, 2 ]:
+            self.assertEqual( get_interrupted_extraction(self.group_database), self.group_extraction )
+
+            self.group_extraction.refresh_from_db()
+            self.assertEqual( self.group_extraction.resume_state["attempts"], attempt )
+
+        self.assertIsNone( get_interrupted_extraction(self.group_database) )
+
+        self.group_extraction.refresh_from_db()
+        self.assertTrue( self.group_extraction.is_failed )
+        self.assertIsNone( get_interrupted_extraction(self.group_database) )
+
+class RunOnGroupDatabasesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.group_databases = [ SimpleNamespace( id=group_database_id, database=f"database {group_database_id}" ) for group_database_id in range(1, 5) ]
+
+        patcher = mock.patch.object(asynchronous, "get_group_databases", return_value=self.group_databases)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_errors_are_kept_per_group_database(self):
+        async def extract(group_database):
+            if group_database.id == 2:
+                raise ValueError("connection lost")
+
+            return group_database.id * 10
+
+        results = await asynchronous.run_on_group_databases(extract)
+
+        self.assertEqual( results[1], { "database": "database 1", "result": 10, "error": None } )
+        self.assertEqual( results[2], { "database": "database 2", "result": None, "error": "connection lost" } )
+        self.assertEqual( [ result["result"] for result in results.values() ], [ 10, None, 30, 40 ] )
+
+    async def test_concurrency(self):
+        running, most_running = 0, 0
+
+        async def extract(group_database):
+            nonlocal running, most_running
+            running += 1
+            most_running = max(most_running, running)
+
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asynchronous.run_on_group_databases(extract, concurrency=2)
+
+        self.assertEqual( most_running, 2 )
+
+class GroupDatabasesCircuitTestCase(TestCase):
+    def test_group_databases_with_an_open_circuit_are_skipped(self):
+        group = models.Group.objects.create(slug="group")
+        group_databases = [ models.GroupDatabase.objects.create(group=group, database=None) for _ in range(2) ]
+
+        with mock.patch.object(asynchronous, "is_circuit_open", return_value=False):
+            self.assertEqual( len( asynchronous.get_group_databases() ), 2 )
+
+        with mock.patch.object(asynchronous, "is_circuit_open", return_value=True):
+            self.assertEqual( asynchronous.get_group_databases( [ group_databases[0].id ] ), [] )
+
+class RecordingCursor:
+    """
+    A cursor recording the queries run on a target database
+    """
+    def __init__(self):
+        self.queries = []
+        self.executemany_calls = []
+
+    def execute(self, query, parameters=None):
+        self.queries.append( ( query, parameters ) )
+
+    def executemany(self, query, rows):
+        self.executemany_calls.append( ( query, list(rows) ) )
+
+class RecordingConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+class ApplyGroupTableRowsTestCase(TestCase):
+    def setUp(self):
+        self.cursor, self.connection = RecordingCursor(), RecordingConnection()
+        self.last_updated = dt.datetime(2023, 1, 1, 12, 30)
+
+        # the rows as read from an extraction, with the extracted column names
+        self.columns = [ "Tracking_Id", "Id", "Name", "Last_Updated" ]
+        self.column_batches = [ ( self.columns, [ [ "S1", "S2" ], [ 1, 2 ], [ "first", "second" ], [ self.last_updated, self.last_updated ] ] ) ]
+
+    def create_group_table_table(self, dbms_codename, column_types=None):
+        dbms = ferdolt_models.DatabaseManagementSystem.objects.get(codename=dbms_codename)
+        dbms_version = ferdolt_models.DatabaseManagementSystemVersion.objects.create(dbms=dbms, version_number="test")
+        database = ferdolt_models.Database.objects.create(dbms_version=dbms_version, name="target", username="user", password="password", port="5432")
+        schema = ferdolt_models.DatabaseSchema.objects.create(database=database, name="public")
+        table = ferdolt_models.Table.objects.create(schema=schema, name="product")
+
+        column_types = { "tracking_id": "varchar", "id": "integer", "name": "varchar", "last_updated": "datetime", **( column_types or {} ) }
+        columns = [ 
+            ferdolt_models.Column.objects.create(table=table, name=name, data_type=data_type, character_maximum_length=50 if data_type == "varchar" else None) 
+            for name, data_type in column_types.items() 
+        ]
+        ferdolt_models.ColumnConstraint.objects.create(column=columns[1], is_primary_key=True)
+
+        group_table = models.GroupTable.objects.create( group=models.Group.objects.create(slug="group"), name="product" )
+        group_columns = [ models.GroupColumn.objects.create(group_table=group_table, name=column.name, data_type="char") for column in columns ]
+
+        # bulk_create doesn't run the task GroupColumnColumn.save queues
+        models.GroupColumnColumn.objects.bulk_create( [ 
+            models.GroupColumnColumn(group_column=group_column, column=column) for group_column, column in zip(group_columns, columns) 
+        ] )
+
+        return database, models.GroupTableTable.objects.create(group_table=group_table, table=table)
+
+    def apply(self, database, group_table_table, dbms_booleans):
+        return apply_group_table_rows(
+            self.connection, self.cursor, database, dbms_booleans, group_table_table, self.columns, self.column_batches, set()
+        )
+
+    def get_merge_queries(self, keyword):
+        return [ ( query, parameters ) for query, parameters in self.cursor.queries if keyword in query ]
+
+    @mock.patch.object(functions.settings, "SYNCHRONIZATION_LOAD_STRATEGY", "json")
+    def test_postgres_json_strategy(self):
+        database, group_table_table = self.create_group_table_table("postgres")
+
+        self.assertTrue( self.apply(database, group_table_table, { "is_postgres_db": True, "is_sqlserver_db": False, "is_mysql_db": False }) )
+
+        # the rows are merged straight from the json parameter, without a temporary table
+        self.assertEqual( self.get_merge_queries("TEMP TABLE"), [] )
+        self.assertEqual( self.cursor.executemany_calls, [] )
+
+        [ ( query, parameters ) ] = self.get_merge_queries("INSERT INTO public.product")
+        self.assertIn( "FROM json_populate_recordset(NULL::public.product, %s::json)", query )
+        self.assertIn( "ON CONFLICT ( tracking_id )", query )
+        self.assertEqual( json.loads( parameters[0] ), [
+            { "tracking_id": "S1", "id": 1, "name": "first", "last_updated": "2023-01-01 12:30:00.000000" },
+            { "tracking_id": "S2", "id": 2, "name": "second", "last_updated": "2023-01-01 12:30:00.000000" },
+        ] )
+        self.assertEqual( self.connection.commits, 1 )
+
+    @mock.patch.object(functions.settings, "SYNCHRONIZATION_LOAD_STRATEGY", "json")
+    def test_sqlserver_json_strategy(self):
+        database, group_table_table = self.create_group_table_table("sqlserver")
+
+        self.assertTrue( self.apply(database, group_table_table, { "is_postgres_db": False, "is_sqlserver_db": True, "is_mysql_db": False }) )
+
+        [ ( query, parameters ) ] = self.get_merge_queries("merge public.product")
+        self.assertIn( "USING OPENJSON(?) WITH (", query )
+        # the datetimes are written with microseconds
+        self.assertIn( "last_updated  datetime2 '$.last_updated'", query )
+        self.assertIn( "name  varchar(50) '$.name'", query )
+        self.assertEqual( len( json.loads( parameters[0] ) ), 2 )
+        self.assertEqual( self.get_merge_queries("CREATE TABLE"), [] )
+
+    @mock.patch.object(functions.settings, "SYNCHRONIZATION_LOAD_STRATEGY", "temporary_table")
+    def test_temporary_table_strategy(self):
+        database, group_table_table = self.create_group_table_table("postgres")
+
+        self.assertTrue( self.apply(database, group_table_table, { "is_postgres_db": True, "is_sqlserver_db": False, "is_mysql_db": False }) )
+
+        self.assertEqual( len( self.get_merge_queries("CREATE TEMP TABLE public_product_temporary_table") ), 1 )
+        self.assertEqual( len( self.get_merge_queries("DELETE FROM public_product_temporary_table") ), 1 )
+
+        # the recording cursor isn't a psycopg cursor, the rows are inserted with executemany
+        [ ( insert_query, rows ) ] = self.cursor.executemany_calls
+        self.assertIn( "INSERT INTO public_product_temporary_table", insert_query )
+        self.assertEqual( len(rows), 2 )
+
+        [ ( query, parameters ) ] = self.get_merge_queries("INSERT INTO public.product")
+        self.assertIn( "FROM public_product_temporary_table", query )
+        self.assertIsNone(parameters)
+
+    @mock.patch.object(functions.settings, "SYNCHRONIZATION_LOAD_STRATEGY", "json")
+    def test_json_strategy_falls_back_to_a_temporary_table(self):
+        # binary values can't be written to json
+        database, group_table_table = self.create_group_table_table("postgres", column_types={ "name": "bytea" })
+
+        self.assertTrue( self.apply(database, group_table_table, { "is_postgres_db": True, "is_sqlserver_db": False, "is_mysql_db": False }) )
+
+        self.assertEqual( len( self.get_merge_queries("CREATE TEMP TABLE") ), 1 )
+        self.assertEqual( len(self.cursor.executemany_calls), 1 )
+        self.assertNotIn( "json_populate_recordset", self.get_merge_queries("INSERT INTO public.product")[0][0] )
+
+class CompactedBacklogTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.fernet = Fernet( Fernet.generate_key() )
+
+        dbms = ferdolt_models.DatabaseManagementSystem.objects.get(codename="postgres")
+        dbms_version = ferdolt_models.DatabaseManagementSystemVersion.objects.create(dbms=dbms, version_number="test")
+        self.database = ferdolt_models.Database.objects.create(dbms_version=dbms_version, name="target", username="user", password="password", port="5432")
+        schema = ferdolt_models.DatabaseSchema.objects.create(database=self.database, name="public")
+        group = models.Group.objects.create(slug="group")
+
+        # product references category
+        for level, name in enumerate( [ "category", "product" ] ):
+            table = ferdolt_models.Table.objects.create(schema=schema, name=name, level=level)
+            models.GroupTableTable.objects.create( group_table=models.GroupTable.objects.create(group=group, name=name), table=table )
+
+        self.applied_rows, self.applied_deletions = [], []
+
+        def apply_group_table_rows(connection, cursor, database_record, dbms_booleans, group_table_table, row_columns, column_batches, *args):
+            rows = [ row for columns, values in column_batches for row in zip(*values) ]
+            self.applied_rows.append( ( group_table_table.table.name, row_columns, rows ) )
+            return True
+
+        def apply_group_table_deletions(connection, cursor, dbms_booleans, group_table_table, tracking_ids):
+            self.applied_deletions.append( ( group_table_table.table.name, set(tracking_ids) ) )
+            return True
+
+        for patcher in [
+            mock.patch.object(functions, "apply_group_table_rows", apply_group_table_rows),
+            mock.patch.object(functions, "apply_group_table_deletions", apply_group_table_deletions),
+            mock.patch.object(functions.settings, "SYNCHRONIZATION_LEVEL_WORKERS", 1),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_extraction(self, name, sections):
+        writer = ExtractionWriter( os.path.join(self.directory.name, name), "group", self.fernet )
+
+        for ( table, kind ), ( columns, rows ) in sections.items():
+            writer.write_rows( ( table, ), kind, columns, rows )
+
+        return writer.close()
+
+    def test_one_merge_per_table(self):
+        first, second = dt.datetime(2023, 1, 1), dt.datetime(2023, 1, 2)
+
+        paths = [
+            self.write_extraction( "first", {
+                ( "product", "rows" ): ( [ "tracking_id", "name", "last_updated" ], [ ( "S1", "old first", first ), ( "S2", "second", first ) ] ),
+                ( "product", "deleted_rows" ): ( [ "row_tracking_id", "deletion_time" ], [] ),
+                ( "category", "rows" ): ( [ "tracking_id", "name", "last_updated" ], [ ( "C1", "category", first ) ] ),
+            } ),
+            self.write_extraction( "second", {
+                ( "product", "rows" ): ( [ "tracking_id", "name", "last_updated" ], [ ( "S1", "new first", second ) ] ),
+                ( "product", "deleted_rows" ): ( [ "row_tracking_id", "deletion_time" ], [ ( "S2", second ) ] ),
+            } ),
+        ]
+
+        readers = [ open_extraction(path, self.fernet) for path in paths ]
+
+        try:
+            self.assertTrue( apply_compacted_backlog( None, None, self.database, {}, readers, set() ) )
+        finally:
+            for reader in readers:
+                reader.close()
+
+        # the referenced table is merged first, each table once with the newest version of its rows that weren't deleted
+        self.assertEqual( self.applied_rows, [
+            ( "category", [ "tracking_id", "name", "last_updated" ], [ ( "C1", "category", first ) ] ),
+            ( "product", [ "tracking_id", "name", "last_updated" ], [ ( "S1", "new first", second ) ] ),
+        ] )
+        self.assertEqual( self.applied_deletions, [ ( "product", { "S2" } ) ] )
+
+class LevelApplierTestCase(SimpleTestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.worker_connections = []
+        self.events = []
+
+        def get_database_connection(database):
+            connection = mock.Mock()
+            self.worker_connections.append(connection)
+            return connection
+
+        patcher = mock.patch.object(functions, "get_database_connection", get_database_connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tables = [ SimpleNamespace( name=name, table=SimpleNamespace(level=level) ) for name, level in [ ( "a", 0 ), ( "b", 0 ), ( "c", 1 ), ( "d", 2 ) ] ]
+
+    def apply(self, connection, cursor, temporary_tables_created, group_table_table):
+        with self.lock:
+            self.events.append( ( "start", group_table_table.table.level ) )
+
+        threading.Event().wait(0.01)
+
+        with self.lock:
+            self.events.append( ( "end", group_table_table.table.level ) )
+
+        return group_table_table.name != "c"
+
+    def test_levels_are_applied_in_order(self):
+        with LevelApplier(None, mock.Mock(), mock.Mock(), set(), workers=2) as applier:
+            # c fails, the other tables are still applied
+            self.assertFalse( applier.run(self.tables, self.apply) )
+
+        self.assertEqual( len(self.worker_connections), 1 )
+        self.worker_connections[0].close.assert_called_once()
+
+        self.assertEqual( [ level for event, level in self.events if event == "start" ], [ 0, 0, 1, 2 ] )
+
+        # a level starts once every table of the previous one is applied
+        self.assertLess( max( position for position, event in enumerate(self.events) if event == ( "end", 0 ) ), self.events.index( ( "start", 1 ) ) )
+        self.assertLess( self.events.index( ( "end", 1 ) ), self.events.index( ( "start", 2 ) ) )
+
+    def test_deletions_are_applied_children_first(self):
+        with LevelApplier(None, mock.Mock(), mock.Mock(), set(), workers=2) as applier:
+            applier.run(self.tables, self.apply, reverse=True)
+
+        self.assertEqual( [ level for event, level in self.events if event == "start" ], [ 2, 1, 0, 0 ] )
+        self.assertLess( self.events.index( ( "end", 1 ) ), self.events.index( ( "start", 0 ) ) )
+
+    def test_tables_of_a_level_are_applied_at_the_same_time(self):
+        with LevelApplier(None, mock.Mock(), mock.Mock(), set(), workers=2) as applier:
+            applier.run(self.tables[:2], self.apply)
+
+        self.assertEqual( self.events[:2], [ ( "start", 0 ), ( "start", 0 ) ] )
@@ -6,7 +6,7 @@ from pathlib import Path
 import re
 import zipfile
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 
 from django.core.files import File as DjangoFile
 from django.db.models import Count, Q
@@ -28,16 +28,18 @@ from common.permissions import IsStaff
 from common.responses import get_error_response
 
 from common.viewsets import MultiplePermissionViewSet, MultipleSerializerViewSet
+from core.exceptions import CorruptExtractionArchive
 from core.functions import custom_converter, get_create_temporary_table_query, get_database_connection, get_dbms_booleans, get_temporary_table_name, synchronize_database
 from ferdolt_web import settings
 
 from ferdolt_web.settings import FERNET_KEY
 from ferdolt import models as ferdolt_models
+from flux.archives import open_extraction_parts
 from flux.models import Extraction, ExtractionTargetDatabase, File
 from flux.serializers import ExtractionSerializer
 from flux.views import get_column_dictionary, get_type_and_precision
 from frontend.views import synchronizations
-from . import models, serializers
+from . import functions, models, serializers
 
 from common.functions import hash_file
 
@@ -75,7 +77,6 @@ class GroupViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
         source = serializer.validated_data['source_database']
 
         validated_data = serializer.validated_data
-        f = Fernet(group.get_fernet_key())
 
         if 'use_pentaho' not in validated_data or not validated_data['use_pentaho']:
             databases = [source]
@@ -84,139 +85,29 @@ class GroupViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
 
             use_time = not ( 'use_time' in validated_data and not validated_data['use_time'] )
 
-            if use_time:
-                if 'start_time' in validated_data:
-                    start_time = validated_data.pop('start_time')
-                else:
-                    # get the creation time of the latest extraction
-                    latest_extraction_query = models.GroupExtraction.objects.order_by('-extraction__time_made')
-
-                    if latest_extraction_query.exists():
-                        start_time = latest_extraction_query.first().extraction.time_made
-                    else: 
-                        start_time = None
-
-            time_made = timezone.now()
-
-            results = {}
+            # without a start_time, each table is extracted from the latest change extracted from it
+            if use_time and 'start_time' in validated_data:
+                start_time = validated_data.pop('start_time')
 
             target_databases = validated_data.pop('target_databases')
 
-            group_dictionary = results.setdefault( group.slug, {} )
-
             for database in databases:
                 database_record = database
 
-                # get the time of the last extraction of this group from this source
-                if not start_time and use_time:
-                    latest_extraction = Extraction.objects.filter( 
-                        groupextraction__group=group, groupextraction__source_database=source
-                        ).last()
-
-                    if latest_extraction:
-                        start_time = latest_extraction.time_made
-
                 connection = get_database_connection(database_record.database)
 
                 if connection:
-                    cursor = connection.cursor()
-
-                    for table in group.tables.all():
-                        # get the tables of this database linked to the group's tables
-                        actual_database_tables = ferdolt_models.Table.objects.filter( id__in=table.grouptabletable_set.values("table__id"), 
-                            schema__database=source.database 
-                        )
-                        
-                        table_dictionary = {}
-
-                        for item in actual_database_tables:
-                            table_results = []
-
-                            table_query_name = item.get_queryname()
-                            
-                            # get the group columns of the grouptable linked to this item's table
-                            columns_in_common = ferdolt_models.Column.objects.filter(table=item, 
-                                id__in=models.GroupColumnColumn.objects.filter( group_column__group_table=table ).values("column__id")
-                            )
-
-                            time_field = item.column_set.filter( Q( name='last_updated' ) | 
-                                Q( name='deletion_time' ) 
-                            )
-
-                            query = f"""
-                            SELECT { ', '.join( [ column.name for column in columns_in_common ] ) } FROM 
-                            { table_query_name } { f" WHERE { time_field.first().name } >= ?" if start_time and time_field.exists() and use_time else "" }
-                            """
-
-                            try:
-                                rows = cursor.execute(query, start_time) if start_time and time_field.exists() and use_time else cursor.execute(query)
-
-                                columns = [ column[0] for column in cursor.description ]
-                                
-                                for row in rows:
-                                    row_dictionary = dict( zip( columns, row ) )
-                                    table_results.append( row_dictionary )
-
-                                if table_results:
-                                    table_dictionary.setdefault( "rows", table_results )
-
-                            except (pyodbc.ProgrammingError, psycopg.ProgrammingError) as e:
-                                logging.error(f"Error occured when extracting from {database}.{table.schema.name}.{table.name}. Error: {str(e)}")
-                                raise e
-
-                            deletion_table = table.deletion_table
-                            if deletion_table:
-                                table_deletions = []
-                                time_field = 'deletion_time'
-
-                                query = f"""
-                                SELECT { ', '.join( [ column.name for column in deletion_table.column_set.all() ] ) } 
-                                FROM { deletion_table.get_queryname() } {f"WHERE {time_field} >= ?" if start_time and time_field.exists() and use_time else ""}
-                                """
-
-                                rows = cursor.execute( query, start_time ) if start_time and time_field and use_time else cursor.execute(query)
-
-                                columns = [ column[0] for column in cursor.description ]
-
-                                for row in rows:
-                                    row_dictionary = dict( zip( columns, row ) )
-                                    table_deletions.append( row_dictionary )
-
-                                if table_results:
-                                    table_dictionary.setdefault( "deleted_rows", table_deletions )
-
-                        
-                        if table_dictionary.keys():
-                            group_dictionary.setdefault( table.name.lower(), table_dictionary )
-                            
-                            file_name = os.path.join( settings.BASE_DIR, settings.MEDIA_ROOT, 
-                            "extractions", f"{timezone.now().strftime('%Y%m%d%H%M%S')}.json")
-
-                    group_extraction = None
-
-                    with open( file_name, "a+" ) as __:
-                        json_string = json.dumps( results, default=custom_converter )
-                        token = f.encrypt( bytes( json_string, 'utf-8' ) )
-
-                        __.write( token.decode('utf-8') )
-                        
-                        file = File.objects.create( file=DjangoFile( __, name=os.path.basename(file_name) ), size=os.path.getsize(file_name), is_deleted=False, hash=sha256( token ).hexdigest() 
-                        )
-
-                        extraction = models.Extraction.objects.create(file=file, start_time=start_time, time_made=time_made)
-
-                        group_extraction = models.GroupExtraction.objects.create(group=group, extraction=extraction, source_database=source)
-
-                        for database in target_databases:
-                            connection = get_database_connection(database)
+                    # the rows are written to a compressed and encrypted archive by the extraction function
+                    group_extraction = functions.extract_from_groupdatabase(
+                        database_record, use_time=use_time, start_time=start_time, 
+                        target_databases=target_databases, connection=connection
+                    )
+                    connection.close()
 
-                            if connection:
-                                models.GroupDatabaseSynchronization.objects.create(extraction=group_extraction, 
-                                    group_database=database, is_applied=False
-                                )
+                    if not group_extraction:
+                        return Response( data={'message': _('There was no data to extract from the %(database)s database' 
+                        % {'database': database_record.database})} )
 
-                    os.unlink( file_name )
-                    
                     serializer = serializers.GroupExtractionSerializer(group_extraction)
 
                 else:
@@ -244,24 +135,24 @@ class GroupViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
         synchronized_databases = []
         applied_synchronizations = []
 
-        for group_database_synchronization in models.GroupDatabaseSynchronization.objects.filter( group_database__group=group, is_applied=False ):
+        for group_database_synchronization in models.GroupDatabaseSynchronization.objects.filter( group_database__group=group, is_applied=False, extraction__extraction__is_complete=True ):
             # apply the synchronization for this database
             file_path = group_database_synchronization.extraction.extraction.file.file.path
 
             try:
-                with open( file_path ) as __:
-                    content = __.read()
-                    content = f.decrypt( bytes( content, 'utf-8' ) )
-                    content = content.decode('utf-8')
-
+                with open_extraction_parts( group_database_synchronization.extraction.extraction.get_file_paths(), f ) as reader:
                     logging.debug("[In groups.views.GroupViewSet.synchronize]")
 
                     try:
                         # the keys of this dictionary are the group's tables
-                        dictionary: dict = json.loads(content)
+                        dictionary: dict = reader.to_dictionary()
                         dictionary = dictionary[group.slug]
 
                         for group_table_name in dictionary.keys():
+                            # archives keep the sections without rows e.g. a table from which rows were only deleted
+                            if not dictionary[group_table_name].get('rows'):
+                                continue
+
                             try:
                                 group_table = group.tables.get( name__iexact=group_table_name )
                                 # getting the database tables associated to this group_table
@@ -443,6 +334,10 @@ class GroupViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
             except FileNotFoundError as e:
                 flag = False 
                 logging.error( f"[In flux.GroupViewSet.synchronize]. Error opening file for database synchronization. File path: {file_path}" )
+            except (CorruptExtractionArchive, InvalidToken) as e:
+                logging.error( f"[In flux.GroupViewSet.synchronize]. Error reading the file for database synchronization. File path: {file_path}. Error: {str(e)}" )
+                errors.append( _("The extraction file %(file_path)s is corrupted or could not be decrypted" % {'file_path': file_path}) )
+                continue
 
             group_database_synchronization.is_applied = True
             group_database_synchronization.time_applied = timezone.now()
@@ -668,7 +563,8 @@ class GroupViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
         # extractions = models.GroupExtraction.objects.filter(
         #     id__in=models.GroupServerSynchronization.objects.filter(group_server=group_server, is_applied=False)
         # )
-        extractions = models.GroupExtraction.objects.all()
+        # extractions still being made are sent once all their parts are saved
+        extractions = models.GroupExtraction.objects.filter(extraction__is_complete=True).select_related("extraction__file")
         
         serialized_extractions = serializers.SimpleGroupExtractionSerializer(extractions, many=True)
 
@@ -703,15 +599,17 @@ class GroupViewSet(viewsets.ModelViewSet, MultipleSerializerViewSet):
         with zipfile.ZipFile( zip_file_name, mode='a' ) as archive:
             archive.write(temp_json_file, os.path.basename(temp_json_file))
 
-        for extraction in extractions:
-            extraction_file_path = extraction.extraction.file_path
-
-            if not os.path.exists(extraction_file_path):
-                extraction.file.is_deleted = True
-                extraction.file.save()
-            else:
-                with zipfile.ZipFile( zip_file_name, mode='a' ) as archive:
-                    archive.write(extraction_file_path, os.path.basename(extraction_file_path))
+        with zipfile.ZipFile( zip_file_name, mode='a' ) as archive:
+            for extraction in extractions:
+                # every part of the extraction is sent, in order
+                for extraction_file in extraction.extraction.get_files():
+                    extraction_file_path = extraction_file.file.path
+
+                    if not os.path.exists(extraction_file_path):
+                        extraction_file.is_deleted = True
+                        extraction_file.save()
+                    else:
+                        archive.write(extraction_file_path, os.path.basename(extraction_file_path))
 
         fh = open(zip_file_name, 'rb')
         